@@ -1,16 +1,66 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from models import Product, Sale, Business, MediaPost
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from sqlalchemy import func, extract, and_, or_, cast, delete, insert, select, Integer
+from sqlalchemy.exc import IntegrityError
+from models import Product, Sale, Business, MediaPost, SalesHourlyRollup, SalesRollupState, to_rupees
+from columnar_store import get_tenant
+from instrumentation import timed
+from duckdb_engine import get_duckdb_sales
+from product_catalog import get_catalog, margin_percent
+from post_impacts import get_post_impacts
+from sales_scan import daily_totals, weekday_totals
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 import pandas as pd
 
 
+def _rupees(paise) -> float:
+    """A paise total, summed exactly as an integer, in rupees for a result"""
+    return to_rupees(int(paise))
+
+
+def _product_sales_totals(db: Session, business_id: int, start: Optional[date] = None):
+    """(catalog, quantity, revenue in paise, orders) with one array slot per catalog product, summed in SQL"""
+    duckdb_sales = get_duckdb_sales(db, business_id)
+    if duckdb_sales is not None:
+        rows = duckdb_sales.product_totals(start)
+    else:
+        query = db.query(
+            Sale.product_id,
+            func.sum(Sale.quantity),
+            func.sum(Sale.total_amount_paise),
+            func.count(Sale.id)
+        ).join(Product, Sale.product_id == Product.id).filter(Product.business_id == business_id)
+        if start is not None:
+            query = query.filter(Sale.sale_date >= start)
+        rows = query.group_by(Sale.product_id).all()
+    
+    catalog = get_catalog(db, business_id, product_ids=[r[0] for r in rows])
+    quantity = np.zeros(len(catalog), dtype=np.int64)
+    revenue = np.zeros(len(catalog), dtype=np.int64)
+    orders = np.zeros(len(catalog), dtype=np.int64)
+    if rows:
+        idx = catalog.indices(r[0] for r in rows)
+        quantity[idx] = [r[1] for r in rows]
+        revenue[idx] = [r[2] for r in rows]
+        orders[idx] = [r[3] for r in rows]
+    return catalog, quantity, revenue, orders
+
+
+@timed("analytics_seconds")
 def get_dashboard_stats(db: Session, business_id: int) -> Dict[str, Any]:
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        return {
+            "total_revenue": _rupees(tenant.revenue_between()),
+            "total_profit": _rupees(tenant.total_profit()),
+            "total_orders": tenant.sale_count,
+            "total_products": len(tenant.product_ids)
+        }
     
-    if not product_ids:
+    catalog, quantity, revenue, orders = _product_sales_totals(db, business_id)
+    
+    if not len(catalog):
         return {
             "total_revenue": 0,
             "total_profit": 0,
@@ -18,251 +68,158 @@ def get_dashboard_stats(db: Session, business_id: int) -> Dict[str, Any]:
             "total_products": 0
         }
     
-    sales = db.query(Sale).filter(Sale.product_id.in_(product_ids)).all()
-    
-    total_revenue = sum(s.total_amount for s in sales)
-    total_orders = len(sales)
-    
-    total_profit = 0
-    for sale in sales:
-        product = next((p for p in products if p.id == sale.product_id), None)
-        if product:
-            profit_per_unit = product.selling_price - product.cost_price
-            total_profit += profit_per_unit * sale.quantity
-    
     return {
-        "total_revenue": round(total_revenue, 2),
-        "total_profit": round(total_profit, 2),
-        "total_orders": total_orders,
-        "total_products": len(products)
+        "total_revenue": _rupees(revenue.sum()),
+        "total_profit": _rupees(np.dot(catalog.unit_profit, quantity)),
+        "total_orders": int(orders.sum()),
+        "total_products": len(catalog)
     }
 
 
+@timed("analytics_seconds")
 def get_best_selling_products(db: Session, business_id: int, limit: int = 10) -> List[Dict[str, Any]]:
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
-    if not product_ids:
-        return []
-    
-    result = db.query(
-        Sale.product_id,
-        func.sum(Sale.quantity).label('total_quantity'),
-        func.sum(Sale.total_amount).label('total_revenue')
-    ).filter(
-        Sale.product_id.in_(product_ids)
-    ).group_by(Sale.product_id).order_by(
-        func.sum(Sale.quantity).desc()
-    ).limit(limit).all()
-    
-    best_products = []
-    for r in result:
-        product = next((p for p in products if p.id == r.product_id), None)
-        if product:
-            best_products.append({
-                "name": product.name,
-                "category": product.category,
-                "quantity_sold": int(r.total_quantity),
-                "revenue": round(float(r.total_revenue), 2)
-            })
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        names, categories = tenant.product_names, tenant.product_categories
+        quantity, revenue, orders = tenant.product_totals()
+    else:
+        catalog, quantity, revenue, orders = _product_sales_totals(db, business_id)
+        names, categories = catalog.names, catalog.categories
     
-    return best_products
+    ranked = sorted((i for i in range(len(orders)) if orders[i] > 0), key=lambda i: -quantity[i])
+    return [{
+        "name": names[i],
+        "category": categories[i],
+        "quantity_sold": int(quantity[i]),
+        "revenue": _rupees(revenue[i])
+    } for i in ranked[:limit]]
 
 
+@timed("analytics_seconds")
 def get_most_profitable_products(db: Session, business_id: int, limit: int = 10) -> List[Dict[str, Any]]:
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
-    if not product_ids:
-        return []
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        names, categories = tenant.product_names, tenant.product_categories
+        cost_price, selling_price = tenant.cost_price_paise, tenant.selling_price_paise
+        quantity, _, orders = tenant.product_totals()
+    else:
+        catalog, quantity, _, orders = _product_sales_totals(db, business_id)
+        names, categories = catalog.names, catalog.categories
+        cost_price, selling_price = catalog.cost_price_paise, catalog.selling_price_paise
     
-    sales_data = db.query(
-        Sale.product_id,
-        func.sum(Sale.quantity).label('total_quantity'),
-        func.sum(Sale.total_amount).label('total_revenue')
-    ).filter(
-        Sale.product_id.in_(product_ids)
-    ).group_by(Sale.product_id).all()
-    
-    profitable_products = []
-    for s in sales_data:
-        product = next((p for p in products if p.id == s.product_id), None)
-        if product:
-            profit_per_unit = product.selling_price - product.cost_price
-            total_profit = profit_per_unit * s.total_quantity
-            profitable_products.append({
-                "name": product.name,
-                "category": product.category,
-                "profit": round(total_profit, 2),
-                "profit_margin": round((profit_per_unit / product.selling_price) * 100, 1) if product.selling_price > 0 else 0
-            })
+    unit_profit = selling_price - cost_price
+    profit = unit_profit * quantity
+    margin = margin_percent(unit_profit, selling_price)
     
-    profitable_products.sort(key=lambda x: x["profit"], reverse=True)
-    return profitable_products[:limit]
+    sold = np.flatnonzero(orders > 0)
+    ranked = sold[np.argsort(-profit[sold], kind="stable")][:limit]
+    return [{
+        "name": names[i],
+        "category": categories[i],
+        "profit": _rupees(profit[i]),
+        "profit_margin": round(float(margin[i]), 1)
+    } for i in ranked]
 
 
+@timed("analytics_seconds")
 def get_best_day_of_week(db: Session, business_id: int) -> Dict[str, Any]:
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
-    if not product_ids:
-        return {"day": "N/A", "revenue": 0, "daily_breakdown": []}
+    day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     
-    sales = db.query(Sale).filter(Sale.product_id.in_(product_ids)).all()
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        revenue, orders = tenant.weekday_totals()
+    else:
+        revenue, orders = weekday_totals(db, business_id)
     
-    if not sales:
+    if not orders.sum():
         return {"day": "N/A", "revenue": 0, "daily_breakdown": []}
-    
-    day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-    daily_revenue = {day: 0 for day in day_names}
-    
-    for sale in sales:
-        day_index = sale.sale_date.weekday()
-        daily_revenue[day_names[day_index]] += sale.total_amount
+    daily_revenue = {day: int(revenue[i]) for i, day in enumerate(day_names)}
     
     best_day = max(daily_revenue, key=daily_revenue.get)
-    daily_breakdown = [{"day": day, "revenue": round(rev, 2)} for day, rev in daily_revenue.items()]
+    daily_breakdown = [{"day": day, "revenue": _rupees(rev)} for day, rev in daily_revenue.items()]
     
     return {
         "day": best_day,
-        "revenue": round(daily_revenue[best_day], 2),
+        "revenue": _rupees(daily_revenue[best_day]),
         "daily_breakdown": daily_breakdown
     }
 
 
+@timed("analytics_seconds")
 def get_weekly_trends(db: Session, business_id: int, weeks: int = 8) -> List[Dict[str, Any]]:
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
-    if not product_ids:
-        return []
-    
-    sales = db.query(Sale).filter(
-        Sale.product_id.in_(product_ids)
-    ).all()
-    
-    if not sales:
-        return []
-    
-    all_dates = [s.sale_date for s in sales]
-    start_date = min(all_dates)
-    end_date = max(all_dates)
+    tenant = get_tenant(db, business_id)
+    daily = tenant.daily_totals() if tenant is not None else daily_totals(db, business_id)
     
     weekly_data = {}
-    for sale in sales:
-        week_start = sale.sale_date - timedelta(days=sale.sale_date.weekday())
-        week_key = week_start.strftime("%Y-%m-%d")
-        
-        if week_key not in weekly_data:
-            weekly_data[week_key] = {"revenue": 0, "orders": 0}
-        
-        weekly_data[week_key]["revenue"] += sale.total_amount
-        weekly_data[week_key]["orders"] += 1
-    
-    trends = [
-        {
-            "week": week,
-            "revenue": round(data["revenue"], 2),
-            "orders": data["orders"]
-        }
+    for day, revenue, orders in daily:
+        week_key = (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+        data = weekly_data.setdefault(week_key, {"revenue": 0, "orders": 0})
+        data["revenue"] += revenue
+        data["orders"] += orders
+    
+    return [
+        {"week": week, "revenue": _rupees(data["revenue"]), "orders": data["orders"]}
         for week, data in sorted(weekly_data.items())
     ]
-    
-    return trends
 
 
+@timed("analytics_seconds")
 def get_monthly_trends(db: Session, business_id: int, months: int = 6) -> List[Dict[str, Any]]:
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
-    if not product_ids:
-        return []
-    
-    sales = db.query(Sale).filter(Sale.product_id.in_(product_ids)).all()
+    tenant = get_tenant(db, business_id)
+    daily = tenant.daily_totals() if tenant is not None else daily_totals(db, business_id)
     
     monthly_data = {}
-    for sale in sales:
-        month_key = sale.sale_date.strftime("%Y-%m")
-        
-        if month_key not in monthly_data:
-            monthly_data[month_key] = {"revenue": 0, "orders": 0}
-        
-        monthly_data[month_key]["revenue"] += sale.total_amount
-        monthly_data[month_key]["orders"] += 1
-    
-    trends = [
-        {
-            "month": month,
-            "revenue": round(data["revenue"], 2),
-            "orders": data["orders"]
-        }
+    for day, revenue, orders in daily:
+        data = monthly_data.setdefault(day.strftime("%Y-%m"), {"revenue": 0, "orders": 0})
+        data["revenue"] += revenue
+        data["orders"] += orders
+    
+    return [
+        {"month": month, "revenue": _rupees(data["revenue"]), "orders": data["orders"]}
         for month, data in sorted(monthly_data.items())
     ][-months:]
-    
-    return trends
 
 
+@timed("analytics_seconds")
 def get_low_performing_products(db: Session, business_id: int, days: int = 30, limit: int = 10) -> List[Dict[str, Any]]:
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
-    if not product_ids:
-        return []
-    
     cutoff_date = datetime.now().date() - timedelta(days=days)
     
-    sales_data = db.query(
-        Sale.product_id,
-        func.sum(Sale.quantity).label('total_quantity'),
-        func.sum(Sale.total_amount).label('total_revenue')
-    ).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= cutoff_date
-    ).group_by(Sale.product_id).all()
-    
-    sales_by_product = {s.product_id: {"quantity": s.total_quantity, "revenue": s.total_revenue} for s in sales_data}
-    
-    low_performers = []
-    for product in products:
-        sales_info = sales_by_product.get(product.id, {"quantity": 0, "revenue": 0})
-        low_performers.append({
-            "name": product.name,
-            "category": product.category,
-            "quantity_sold": int(sales_info["quantity"]) if sales_info["quantity"] else 0,
-            "revenue": round(float(sales_info["revenue"]), 2) if sales_info["revenue"] else 0
-        })
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        names, categories = tenant.product_names, tenant.product_categories
+        quantity, revenue, _ = tenant.product_totals(start=cutoff_date)
+    else:
+        catalog, quantity, revenue, _ = _product_sales_totals(db, business_id, start=cutoff_date)
+        names, categories = catalog.names, catalog.categories
     
-    low_performers.sort(key=lambda x: x["revenue"])
-    return low_performers[:limit]
+    ranked = np.argsort(revenue, kind="stable")[:limit]
+    return [{
+        "name": names[i],
+        "category": categories[i],
+        "quantity_sold": int(quantity[i]),
+        "revenue": _rupees(revenue[i])
+    } for i in ranked]
 
 
+@timed("analytics_seconds")
 def get_revenue_by_product(db: Session, business_id: int) -> List[Dict[str, Any]]:
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
-    if not product_ids:
-        return []
-    
-    sales_data = db.query(
-        Sale.product_id,
-        func.sum(Sale.total_amount).label('total_revenue')
-    ).filter(
-        Sale.product_id.in_(product_ids)
-    ).group_by(Sale.product_id).all()
-    
-    revenue_data = []
-    for s in sales_data:
-        product = next((p for p in products if p.id == s.product_id), None)
-        if product:
-            revenue_data.append({
-                "name": product.name,
-                "revenue": round(float(s.total_revenue), 2)
-            })
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        names = tenant.product_names
+        _, revenue, orders = tenant.product_totals()
+    else:
+        catalog, _, revenue, orders = _product_sales_totals(db, business_id)
+        names = catalog.names
     
+    revenue_data = [
+        {"name": names[i], "revenue": _rupees(revenue[i])}
+        for i in range(len(orders)) if orders[i] > 0
+    ]
     revenue_data.sort(key=lambda x: x["revenue"], reverse=True)
     return revenue_data
 
 
+@timed("analytics_seconds")
 def get_media_posts(db: Session, business_id: int) -> List[Dict[str, Any]]:
     posts = db.query(MediaPost).filter(
         MediaPost.business_id == business_id
@@ -281,8 +238,82 @@ def get_media_posts(db: Session, business_id: int) -> List[Dict[str, Any]]:
     } for p in posts]
 
 
+def _keyset_before(date_col, id_col, cursor: Optional[Tuple[str, int]]):
+    """Rows strictly after ``cursor`` in ``(date DESC, id DESC)`` order."""
+    last_date, last_id = datetime.strptime(cursor[0], "%Y-%m-%d").date(), cursor[1]
+    return or_(date_col < last_date, and_(date_col == last_date, id_col < last_id))
+
+
+@timed("analytics_seconds")
+def get_recent_sales_page(db: Session, business_id: int, page_size: int = 10,
+                          cursor: Optional[Tuple[str, int]] = None) -> Dict[str, Any]:
+    """One page of sales ordered by (sale_date DESC, id DESC), with the cursor for the next page"""
+    query = db.query(
+        Sale.id, Sale.sale_date, Sale.quantity, Sale.total_amount_paise, Product.name
+    ).join(Product, Sale.product_id == Product.id).filter(
+        Product.business_id == business_id
+    )
+    if cursor:
+        query = query.filter(_keyset_before(Sale.sale_date, Sale.id, cursor))
+    
+    rows = query.order_by(Sale.sale_date.desc(), Sale.id.desc()).limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    
+    return {
+        "sales": [{
+            "id": r.id,
+            "sale_date": r.sale_date.strftime("%Y-%m-%d"),
+            "product_name": r.name,
+            "quantity": r.quantity,
+            "total_amount": _rupees(r.total_amount_paise)
+        } for r in rows],
+        "next_cursor": (rows[-1].sale_date.strftime("%Y-%m-%d"), rows[-1].id) if has_more else None
+    }
+
+
+def _media_posts_keyset(db: Session, business_id: int, page_size: int,
+                        cursor: Optional[Tuple[str, int]]) -> Tuple[List[MediaPost], Optional[Tuple[str, int]]]:
+    query = db.query(MediaPost).filter(MediaPost.business_id == business_id)
+    if cursor:
+        query = query.filter(_keyset_before(MediaPost.posted_at, MediaPost.id, cursor))
+    
+    posts = query.order_by(MediaPost.posted_at.desc(), MediaPost.id.desc()).limit(page_size + 1).all()
+    has_more = len(posts) > page_size
+    posts = posts[:page_size]
+    next_cursor = (posts[-1].posted_at.strftime("%Y-%m-%d"), posts[-1].id) if has_more else None
+    return posts, next_cursor
+
+
+@timed("analytics_seconds")
+def get_media_posts_page(db: Session, business_id: int, page_size: int = 10,
+                         cursor: Optional[Tuple[str, int]] = None) -> Dict[str, Any]:
+    """One page of media posts ordered by (posted_at DESC, id DESC), with the cursor for the next page"""
+    posts, next_cursor = _media_posts_keyset(db, business_id, page_size, cursor)
+    
+    return {
+        "posts": [{
+            "id": p.id,
+            "post_type": p.post_type,
+            "caption": p.caption,
+            "posted_at": p.posted_at.strftime("%Y-%m-%d"),
+            "impressions": p.impressions,
+            "likes": p.likes,
+            "comments": p.comments,
+            "shares": p.shares,
+            "engagement": p.likes + p.comments + p.shares
+        } for p in posts],
+        "next_cursor": next_cursor
+    }
+
+
+@timed("analytics_seconds")
 def get_media_impact_stats(db: Session, business_id: int) -> Dict[str, Any]:
-    posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        posts = tenant.posts()
+    else:
+        posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
     
     if not posts:
         return {
@@ -294,8 +325,7 @@ def get_media_impact_stats(db: Session, business_id: int) -> Dict[str, Any]:
             "total_incremental_revenue": 0
         }
     
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
+    impacts = get_post_impacts(db, business_id, posts)
     
     total_reels = sum(1 for p in posts if p.post_type == "reel")
     total_stories = sum(1 for p in posts if p.post_type == "story")
@@ -306,7 +336,7 @@ def get_media_impact_stats(db: Session, business_id: int) -> Dict[str, Any]:
     total_incremental = 0
     
     for post in posts:
-        impact = calculate_post_impact(db, post, product_ids)
+        impact = impacts[post.id]
         total_lift += impact["lift_percent"]
         total_incremental += impact["incremental_revenue"]
     
@@ -322,86 +352,78 @@ def get_media_impact_stats(db: Session, business_id: int) -> Dict[str, Any]:
     }
 
 
-def calculate_post_impact(db: Session, post: MediaPost, product_ids: List[int]) -> Dict[str, Any]:
-    post_date = post.posted_at
-    
-    before_start = post_date - timedelta(days=7)
-    before_end = post_date - timedelta(days=1)
-    
-    after_start = post_date
-    after_end = post_date + timedelta(days=3)
+def _business_product_ids(db: Session, business_id: int, tenant=None) -> List[int]:
+    if tenant is not None:
+        return [int(pid) for pid in tenant.product_ids]
+    return list(db.scalars(select(Product.id).where(Product.business_id == business_id)))
+
+
+@timed("analytics_seconds")
+def get_posts_with_impact(db: Session, business_id: int) -> List[Dict[str, Any]]:
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        posts = sorted(tenant.posts(), key=lambda p: p.posted_at, reverse=True)
+    else:
+        posts = db.query(MediaPost).filter(
+            MediaPost.business_id == business_id
+        ).order_by(MediaPost.posted_at.desc()).all()
     
-    before_sales = db.query(func.sum(Sale.total_amount)).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= before_start,
-        Sale.sale_date <= before_end
-    ).scalar() or 0
+    if not posts:
+        return []
     
-    after_sales = db.query(func.sum(Sale.total_amount)).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= after_start,
-        Sale.sale_date <= after_end
-    ).scalar() or 0
+    impacts = get_post_impacts(db, business_id, posts)
     
-    before_days = (before_end - before_start).days + 1
-    after_days = (after_end - after_start).days + 1
+    return [_post_with_impact(post, impacts[post.id]) for post in posts]
+
+
+@timed("analytics_seconds")
+def get_posts_with_impact_page(db: Session, business_id: int, page_size: int = 10,
+                               cursor: Optional[Tuple[str, int]] = None) -> Dict[str, Any]:
+    """Like get_posts_with_impact, but only loads and scores one keyset page of posts"""
+    posts, next_cursor = _media_posts_keyset(db, business_id, page_size, cursor)
     
-    baseline_daily = before_sales / before_days if before_days > 0 else 0
-    post_daily = after_sales / after_days if after_days > 0 else 0
+    if not posts:
+        return {"posts": [], "next_cursor": None}
     
-    lift_percent = ((post_daily - baseline_daily) / baseline_daily * 100) if baseline_daily > 0 else 0
-    incremental_revenue = (post_daily - baseline_daily) * after_days if baseline_daily > 0 else 0
+    impacts = get_post_impacts(db, business_id, posts)
     
     return {
-        "baseline_daily": round(baseline_daily, 2),
-        "post_daily": round(post_daily, 2),
-        "lift_percent": round(lift_percent, 1),
-        "incremental_revenue": round(max(0, incremental_revenue), 2)
+        "posts": [_post_with_impact(post, impacts[post.id]) for post in posts],
+        "next_cursor": next_cursor
     }
 
 
-def get_posts_with_impact(db: Session, business_id: int) -> List[Dict[str, Any]]:
-    posts = db.query(MediaPost).filter(
-        MediaPost.business_id == business_id
-    ).order_by(MediaPost.posted_at.desc()).all()
-    
-    if not posts:
-        return []
-    
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
-    result = []
-    for post in posts:
-        impact = calculate_post_impact(db, post, product_ids)
-        result.append({
-            "id": post.id,
-            "post_type": post.post_type,
-            "caption": post.caption or "",
-            "posted_at": post.posted_at.strftime("%Y-%m-%d"),
-            "impressions": post.impressions,
-            "likes": post.likes,
-            "comments": post.comments,
-            "shares": post.shares,
-            "engagement": post.likes + post.comments + post.shares,
-            "baseline_daily": impact["baseline_daily"],
-            "post_daily": impact["post_daily"],
-            "lift_percent": impact["lift_percent"],
-            "incremental_revenue": impact["incremental_revenue"]
-        })
-    
-    return result
+def _post_with_impact(post: MediaPost, impact: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": post.id,
+        "post_type": post.post_type,
+        "caption": post.caption or "",
+        "posted_at": post.posted_at.strftime("%Y-%m-%d"),
+        "impressions": post.impressions,
+        "likes": post.likes,
+        "comments": post.comments,
+        "shares": post.shares,
+        "engagement": post.likes + post.comments + post.shares,
+        "baseline_daily": impact["baseline_daily"],
+        "post_daily": impact["post_daily"],
+        "lift_percent": impact["lift_percent"],
+        "incremental_revenue": impact["incremental_revenue"]
+    }
 
 
+@timed("analytics_seconds")
 def get_media_type_comparison(db: Session, business_id: int) -> Dict[str, Any]:
-    posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        posts = tenant.posts()
+    else:
+        posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
     
     if not posts:
         return {"reels": {"count": 0, "avg_lift": 0, "avg_engagement": 0},
                 "stories": {"count": 0, "avg_lift": 0, "avg_engagement": 0}}
     
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
+    impacts = get_post_impacts(db, business_id, posts)
     
     reels = [p for p in posts if p.post_type == "reel"]
     stories = [p for p in posts if p.post_type == "story"]
@@ -414,8 +436,7 @@ def get_media_type_comparison(db: Session, business_id: int) -> Dict[str, Any]:
         total_engagement = 0
         
         for post in post_list:
-            impact = calculate_post_impact(db, post, product_ids)
-            total_lift += impact["lift_percent"]
+            total_lift += impacts[post.id]["lift_percent"]
             total_engagement += post.likes + post.comments + post.shares
         
         return {
@@ -430,11 +451,12 @@ def get_media_type_comparison(db: Session, business_id: int) -> Dict[str, Any]:
     }
 
 
+@timed("analytics_seconds")
 def get_business_recommendations(db: Session, business_id: int) -> Dict[str, Any]:
     """Generate actionable business recommendations based on all available data"""
     
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
+    tenant = get_tenant(db, business_id)
+    product_ids = _business_product_ids(db, business_id, tenant)
     
     if not product_ids:
         return {
@@ -459,25 +481,25 @@ def get_business_recommendations(db: Session, business_id: int) -> Dict[str, Any
     thirty_days_ago = datetime.now().date() - timedelta(days=30)
     seven_days_ago = datetime.now().date() - timedelta(days=7)
     
-    recent_sales = db.query(Sale).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= thirty_days_ago
-    ).all()
-    
-    very_recent_sales = [s for s in recent_sales if s.sale_date >= seven_days_ago]
-    older_sales = [s for s in recent_sales if s.sale_date < seven_days_ago]
-    
-    recent_revenue = sum(s.total_amount for s in very_recent_sales)
-    older_revenue = sum(s.total_amount for s in older_sales)
+    if tenant is not None:
+        recent_revenue = tenant.revenue_between(seven_days_ago)
+        older_revenue = tenant.revenue_between(thirty_days_ago, seven_days_ago - timedelta(days=1))
+    else:
+        daily = daily_totals(db, business_id, start=thirty_days_ago)
+        recent_revenue = sum(revenue for day, revenue, _ in daily if day >= seven_days_ago)
+        older_revenue = sum(revenue for day, revenue, _ in daily if day < seven_days_ago)
     
-    older_daily_avg = older_revenue / 23 if older_sales else 0
-    recent_daily_avg = recent_revenue / 7 if very_recent_sales else 0
+    older_daily_avg = older_revenue / 23
+    recent_daily_avg = recent_revenue / 7
     
     growth_trend = "growing" if recent_daily_avg > older_daily_avg * 1.1 else (
         "declining" if recent_daily_avg < older_daily_avg * 0.9 else "stable"
     )
     
-    media_posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
+    if tenant is not None:
+        media_posts = tenant.posts()
+    else:
+        media_posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
     recent_posts = [p for p in media_posts if p.posted_at >= seven_days_ago]
     
     recommendations = []
@@ -580,40 +602,37 @@ def get_business_recommendations(db: Session, business_id: int) -> Dict[str, Any
         "health_score": health_score,
         "focus_area": focus_area,
         "growth_trend": growth_trend,
-        "recent_daily_avg": round(recent_daily_avg, 2),
+        "recent_daily_avg": round(to_rupees(recent_daily_avg), 2),
         "posts_this_week": len(recent_posts)
     }
 
 
+@timed("analytics_seconds")
 def get_revenue_with_posts_timeline(db: Session, business_id: int, days: int = 30) -> Dict[str, Any]:
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=days)
     
-    sales = db.query(Sale).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= start_date
-    ).all()
-    
-    posts = db.query(MediaPost).filter(
-        MediaPost.business_id == business_id,
-        MediaPost.posted_at >= start_date
-    ).all()
-    
     daily_revenue = {}
     current = start_date
     while current <= end_date:
         daily_revenue[current.strftime("%Y-%m-%d")] = 0
         current += timedelta(days=1)
     
-    for sale in sales:
-        date_key = sale.sale_date.strftime("%Y-%m-%d")
-        if date_key in daily_revenue:
-            daily_revenue[date_key] += sale.total_amount
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        daily = tenant.daily_totals(start_date, end_date)
+        posts = [p for p in tenant.posts() if p.posted_at >= start_date]
+    else:
+        daily = daily_totals(db, business_id, start_date, end_date)
+        posts = db.query(MediaPost.posted_at, MediaPost.post_type, MediaPost.caption).filter(
+            MediaPost.business_id == business_id,
+            MediaPost.posted_at >= start_date
+        ).all()
     
-    revenue_data = [{"date": d, "revenue": round(r, 2)} for d, r in sorted(daily_revenue.items())]
+    for day, revenue, _ in daily:
+        daily_revenue[day.strftime("%Y-%m-%d")] += revenue
+    
+    revenue_data = [{"date": d, "revenue": _rupees(r)} for d, r in sorted(daily_revenue.items())]
     
     post_markers = [{
         "date": p.posted_at.strftime("%Y-%m-%d"),
@@ -627,86 +646,205 @@ def get_revenue_with_posts_timeline(db: Session, business_id: int, days: int = 3
     }
 
 
+@timed("analytics_seconds")
 def get_sales_by_day_hour(db: Session, business_id: int) -> Dict[str, Any]:
     """Aggregate sales by day of week and hour for ML feature engineering"""
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
-    
-    if not product_ids:
-        return {"by_day": {}, "by_hour": {}}
-    
-    sales = db.query(Sale).filter(Sale.product_id.in_(product_ids)).all()
-    
     day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     by_day = {day: {"revenue": 0, "count": 0} for day in day_names}
     by_hour = {h: {"revenue": 0, "count": 0} for h in range(24)}
     
-    for sale in sales:
-        day_idx = sale.sale_date.weekday()
-        by_day[day_names[day_idx]]["revenue"] += sale.total_amount
-        by_day[day_names[day_idx]]["count"] += 1
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        if not len(tenant.product_ids):
+            return {"by_day": {}, "by_hour": {}}
+        day_revenue, day_orders = tenant.weekday_totals()
+        hour_revenue, hour_orders = tenant.hour_totals()
+        for i, day in enumerate(day_names):
+            by_day[day] = {"revenue": int(day_revenue[i]), "count": int(day_orders[i])}
+        for h in range(24):
+            by_hour[h] = {"revenue": int(hour_revenue[h]), "count": int(hour_orders[h])}
+        sales = []
+    else:
+        product_ids = _business_product_ids(db, business_id)
+        
+        if not product_ids:
+            return {"by_day": {}, "by_hour": {}}
         
-        if sale.sale_time:
-            hour = sale.sale_time.hour
-            by_hour[hour]["revenue"] += sale.total_amount
-            by_hour[hour]["count"] += 1
+        day_col, hour_col = _weekday_expr(), _hour_expr()
+        rows = db.query(
+            day_col, hour_col, func.sum(Sale.total_amount_paise), func.count(Sale.id)
+        ).filter(Sale.product_id.in_(product_ids)).group_by(day_col, hour_col).all()
+        
+        for day_idx, hour, revenue, count in rows:
+            by_day[day_names[day_idx]]["revenue"] += revenue
+            by_day[day_names[day_idx]]["count"] += count
+            if hour >= 0:
+                by_hour[hour]["revenue"] += revenue
+                by_hour[hour]["count"] += count
     
     return {
-        "by_day": [{"day": d, "revenue": round(v["revenue"], 2), "orders": v["count"]} 
+        "by_day": [{"day": d, "revenue": _rupees(v["revenue"]), "orders": v["count"]} 
                    for d, v in by_day.items()],
-        "by_hour": [{"hour": h, "revenue": round(v["revenue"], 2), "orders": v["count"]} 
+        "by_hour": [{"hour": h, "revenue": _rupees(v["revenue"]), "orders": v["count"]} 
                     for h, v in by_hour.items() if v["count"] > 0]
     }
 
 
+def _weekday_expr():
+    """Monday-first day of week of Sale.sale_date, computed by the database"""
+    return (cast(extract("dow", Sale.sale_date), Integer) + 6) % 7
+
+
+def _hour_expr():
+    """Hour of Sale.sale_time, or -1 when the sale has no time"""
+    return func.coalesce(cast(extract("hour", Sale.sale_time), Integer), -1)
+
+
+@timed("analytics_seconds")
+def refresh_sales_rollup(db: Session, business_id: int, commit: bool = True) -> bool:
+    """Rebuild a business's rows in sales_hourly_rollup with one INSERT ... SELECT ... GROUP BY"""
+    # Read the version first so writes that land during the rebuild leave the rollup stale
+    version = db.query(Business.data_version).filter(Business.id == business_id).scalar() or 0
+    
+    day_col, hour_col = _weekday_expr(), _hour_expr()
+    category_col = func.coalesce(Product.category, "")
+    grouped = select(
+        Product.business_id, Sale.sale_date, hour_col, category_col, day_col,
+        func.sum(Sale.total_amount_paise), func.sum(Sale.quantity), func.count(Sale.id)
+    ).join(Product, Sale.product_id == Product.id).where(
+        Product.business_id == business_id
+    ).group_by(Product.business_id, Sale.sale_date, hour_col, category_col, day_col)
+    
+    try:
+        db.execute(delete(SalesHourlyRollup).where(SalesHourlyRollup.business_id == business_id))
+        db.execute(insert(SalesHourlyRollup).from_select([
+            "business_id", "sale_date", "hour", "category", "day_of_week", "revenue_paise", "quantity", "orders"
+        ], grouped))
+        db.merge(SalesRollupState(business_id=business_id, data_version=version, built_at=datetime.utcnow()))
+        if commit:
+            db.commit()
+    except IntegrityError:
+        # A concurrent rebuild of the same business won; its rows are just as fresh
+        db.rollback()
+        return False
+    return True
+
+
+@timed("analytics_seconds")
+def get_sales_rollup_state(db: Session, business_id: int) -> Optional[Dict[str, Any]]:
+    """When the rollup was built and whether sales changed since, or None if it was never built"""
+    row = db.query(
+        SalesRollupState.built_at,
+        SalesRollupState.data_version,
+        Business.data_version.label("current_version")
+    ).join(Business, Business.id == SalesRollupState.business_id).filter(
+        SalesRollupState.business_id == business_id
+    ).first()
+    
+    if row is None:
+        return None
+    return {"built_at": row.built_at, "stale": row.data_version != row.current_version}
+
+
+@timed("analytics_seconds")
+def get_sales_heatmap(db: Session, business_id: int, start_date: Optional[date] = None,
+                      end_date: Optional[date] = None, categories: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Revenue and orders by day of week x hour from the hourly rollup"""
+    day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    
+    query = db.query(
+        SalesHourlyRollup.day_of_week,
+        SalesHourlyRollup.hour,
+        func.sum(SalesHourlyRollup.revenue_paise),
+        func.sum(SalesHourlyRollup.orders)
+    ).filter(SalesHourlyRollup.business_id == business_id)
+    if start_date:
+        query = query.filter(SalesHourlyRollup.sale_date >= start_date)
+    if end_date:
+        query = query.filter(SalesHourlyRollup.sale_date <= end_date)
+    if categories is not None:
+        query = query.filter(SalesHourlyRollup.category.in_(categories))
+    rows = query.group_by(SalesHourlyRollup.day_of_week, SalesHourlyRollup.hour).all()
+    
+    revenue = [[0] * 24 for _ in day_names]
+    orders = [[0] * 24 for _ in day_names]
+    untimed_orders = 0
+    for day_idx, hour, day_revenue, day_orders in rows:
+        if hour < 0:
+            untimed_orders += int(day_orders)
+            continue
+        revenue[day_idx][hour] = int(day_revenue)
+        orders[day_idx][hour] = int(day_orders)
+    
+    return {
+        "days": day_names,
+        "hours": list(range(24)),
+        "revenue": [[_rupees(r) for r in day] for day in revenue],
+        "orders": orders,
+        "total_revenue": _rupees(sum(map(sum, revenue))),
+        "total_orders": sum(map(sum, orders)),
+        "untimed_orders": untimed_orders
+    }
+
+
+@timed("analytics_seconds")
 def get_rolling_revenue_averages(db: Session, business_id: int) -> Dict[str, Any]:
     """Calculate rolling 3-day and 7-day revenue averages"""
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
+    tenant = get_tenant(db, business_id)
+    product_ids = _business_product_ids(db, business_id, tenant)
     
     if not product_ids:
         return {"avg_3d": 0, "avg_7d": 0, "avg_30d": 0}
     
     today = datetime.now().date()
     
-    sales_3d = db.query(func.sum(Sale.total_amount)).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= today - timedelta(days=3)
-    ).scalar() or 0
-    
-    sales_7d = db.query(func.sum(Sale.total_amount)).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= today - timedelta(days=7)
-    ).scalar() or 0
-    
-    sales_30d = db.query(func.sum(Sale.total_amount)).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= today - timedelta(days=30)
-    ).scalar() or 0
+    if tenant is not None:
+        sales_3d = tenant.revenue_between(today - timedelta(days=3))
+        sales_7d = tenant.revenue_between(today - timedelta(days=7))
+        sales_30d = tenant.revenue_between(today - timedelta(days=30))
+    else:
+        sales_3d = db.query(func.sum(Sale.total_amount_paise)).filter(
+            Sale.product_id.in_(product_ids),
+            Sale.sale_date >= today - timedelta(days=3)
+        ).scalar() or 0
+        
+        sales_7d = db.query(func.sum(Sale.total_amount_paise)).filter(
+            Sale.product_id.in_(product_ids),
+            Sale.sale_date >= today - timedelta(days=7)
+        ).scalar() or 0
+        
+        sales_30d = db.query(func.sum(Sale.total_amount_paise)).filter(
+            Sale.product_id.in_(product_ids),
+            Sale.sale_date >= today - timedelta(days=30)
+        ).scalar() or 0
     
     return {
-        "avg_3d": round(sales_3d / 3, 2) if sales_3d else 0,
-        "avg_7d": round(sales_7d / 7, 2) if sales_7d else 0,
-        "avg_30d": round(sales_30d / 30, 2) if sales_30d else 0
+        "avg_3d": round(to_rupees(sales_3d) / 3, 2) if sales_3d else 0,
+        "avg_7d": round(to_rupees(sales_7d) / 7, 2) if sales_7d else 0,
+        "avg_30d": round(to_rupees(sales_30d) / 30, 2) if sales_30d else 0
     }
 
 
+@timed("analytics_seconds")
 def get_post_timing_analysis(db: Session, business_id: int) -> Dict[str, Any]:
     """Analyze posting times and their sales impact"""
-    posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        posts = tenant.posts()
+    else:
+        posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
     
     if not posts:
         return {"analysis": [], "best_time": None, "best_day": None}
     
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
+    impacts = get_post_impacts(db, business_id, posts)
     
     day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     time_buckets = {"morning": (6, 12), "afternoon": (12, 17), "evening": (17, 22)}
     
     analysis = []
     for post in posts:
-        impact = calculate_post_impact(db, post, product_ids)
+        impact = impacts[post.id]
         
         time_bucket = "evening"
         if post.post_time:
@@ -0,0 +1,338 @@
+"""Headless JSON API over the analytics core for POS integrations and BI tools.
+
+Requests authenticate with HTTP Basic auth using the business login. Every
+response carries an ETag built from the business's data version (and the
+current date, since most insights use rolling windows), so clients that send
+If-None-Match get a cheap 304 until data changes. Responses are gzipped when
+the client accepts it, and at most API_MAX_CONCURRENCY requests are served at
+once; the rest get a 503 with Retry-After.
+
+POS terminals push sales as NDJSON to ``POST /api/v1/sales/ingest`` (see
+sales_ingest.py). The call answers 202 once the sales are buffered, or with
+``?wait=1`` 200 once they are committed; a full buffer answers 429.
+
+    python api_server.py --host 127.0.0.1 --port 8502
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import zlib
+from datetime import date, datetime, time as dt_time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import columnar_store
+import instrumentation
+from models import init_db, SessionLocal, Business
+from auth import authenticate_business
+from analytics import (
+    get_dashboard_stats,
+    get_weekly_trends,
+    get_monthly_trends,
+    get_best_day_of_week,
+    get_best_selling_products,
+    get_most_profitable_products,
+    get_low_performing_products,
+    get_revenue_by_product,
+    get_posts_with_impact_page,
+    get_media_type_comparison
+)
+from ml_engine import get_best_posting_recommendation
+from sales_ingest import BufferFull, get_buffer, parse_ndjson
+from precompute import get_precomputed, refresh_business
+
+logger = logging.getLogger(__name__)
+
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", "8502"))
+API_MAX_CONCURRENCY = int(os.environ.get("API_MAX_CONCURRENCY", "8"))
+API_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("API_QUEUE_TIMEOUT_SECONDS", "2"))
+API_AUTH_CACHE_SECONDS = int(os.environ.get("API_AUTH_CACHE_SECONDS", "300"))
+API_MAX_BODY_BYTES = int(os.environ.get("API_MAX_BODY_MB", "8")) * 1024 * 1024
+API_INGEST_WAIT_SECONDS = float(os.environ.get("API_INGEST_WAIT_SECONDS", "10"))
+GZIP_MIN_BYTES = 512
+
+_slots = threading.BoundedSemaphore(API_MAX_CONCURRENCY)
+_auth_cache: Dict[str, Tuple[int, float]] = {}
+_auth_lock = threading.Lock()
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _int_param(params: Dict[str, list], name: str, default: int, maximum: int = 1000) -> int:
+    try:
+        value = int(params.get(name, [default])[0])
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+    if not 1 <= value <= maximum:
+        raise ApiError(400, f"{name} must be between 1 and {maximum}")
+    return value
+
+
+def _cursor_param(params: Dict[str, list]) -> Optional[Tuple[str, int]]:
+    """Cursor is passed as ``YYYY-MM-DD,id``, the same shape as next_cursor in responses"""
+    raw = params.get("cursor", [None])[0]
+    if not raw:
+        return None
+    try:
+        day, post_id = raw.split(",")
+        datetime.strptime(day, "%Y-%m-%d")
+        return (day, int(post_id))
+    except ValueError:
+        raise ApiError(400, "cursor must look like YYYY-MM-DD,id")
+
+
+def _posts_impact(db, business_id, params):
+    page = get_posts_with_impact_page(
+        db, business_id, _int_param(params, "page_size", 25, 100), _cursor_param(params)
+    )
+    if page["next_cursor"]:
+        page["next_cursor"] = ",".join(str(part) for part in page["next_cursor"])
+    return page
+
+
+ROUTES: Dict[str, Callable[[Any, int, Dict[str, list]], Any]] = {
+    "/api/v1/dashboard": lambda db, bid, p: get_dashboard_stats(db, bid),
+    "/api/v1/trends/weekly": lambda db, bid, p: get_weekly_trends(db, bid, _int_param(p, "weeks", 8, 104)),
+    "/api/v1/trends/monthly": lambda db, bid, p: get_monthly_trends(db, bid, _int_param(p, "months", 6, 36)),
+    "/api/v1/trends/best-day": lambda db, bid, p: get_best_day_of_week(db, bid),
+    "/api/v1/products/best-selling": lambda db, bid, p: get_best_selling_products(db, bid, _int_param(p, "limit", 10)),
+    "/api/v1/products/most-profitable": lambda db, bid, p: get_most_profitable_products(db, bid, _int_param(p, "limit", 10)),
+    "/api/v1/products/low-performing": lambda db, bid, p: get_low_performing_products(
+        db, bid, _int_param(p, "days", 30, 365), _int_param(p, "limit", 10)
+    ),
+    "/api/v1/products/revenue": lambda db, bid, p: get_revenue_by_product(db, bid),
+    "/api/v1/posts/impact": _posts_impact,
+    "/api/v1/posts/type-comparison": lambda db, bid, p: get_media_type_comparison(db, bid),
+    "/api/v1/recommendations/posting": lambda db, bid, p: get_best_posting_recommendation(db, bid),
+    "/api/v1/recommendations/precomputed": lambda db, bid, p: get_precomputed(db, bid) or refresh_business(db, bid),
+}
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (date, datetime, dt_time)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _etag(business_id: int, data_version: int, path: str, query: str) -> str:
+    request_key = hashlib.sha1(f"{path}?{query}".encode("utf-8")).hexdigest()[:12]
+    return f'W/"{business_id}-{data_version}-{date.today().isoformat()}-{request_key}"'
+
+
+def _gunzip(body: bytes, limit: int) -> bytes:
+    """Decompress a gzip request body, refusing to expand it past ``limit`` bytes"""
+    parts, size = [], 0
+    while body:  # Concatenated gzip members are one stream, as with gzip.decompress
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        part = decompressor.decompress(body, limit - size + 1)
+        size += len(part)
+        if size > limit or decompressor.unconsumed_tail:
+            raise ApiError(413, f"Decompressed body larger than {limit} bytes")
+        if not decompressor.eof:
+            raise EOFError("Truncated gzip body")
+        parts.append(part)
+        body = decompressor.unused_data
+    return b"".join(parts)
+
+
+def _authenticate(db, header: Optional[str]) -> int:
+    """Business id for a Basic auth header; successful logins are cached to skip bcrypt on every poll"""
+    if not header or not header.startswith("Basic "):
+        raise ApiError(401, "Authentication required")
+
+    cache_key = hashlib.sha256(header.encode("utf-8")).hexdigest()
+    now = time.monotonic()
+    with _auth_lock:
+        cached = _auth_cache.get(cache_key)
+        if cached and now - cached[1] < API_AUTH_CACHE_SECONDS:
+            instrumentation.inc("cache_requests_total", cache="api_auth", result="hit")
+            return cached[0]
+    instrumentation.inc("cache_requests_total", cache="api_auth", result="miss")
+
+    try:
+        email, password = base64.b64decode(header[6:]).decode("utf-8").split(":", 1)
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError(401, "Malformed credentials")
+
+    business = authenticate_business(db, email, password)
+    if not business:
+        raise ApiError(401, "Invalid email or password")
+
+    with _auth_lock:
+        _auth_cache[cache_key] = (business.id, now)
+    return business.id
+
+
+class AnalyticsRequestHandler(BaseHTTPRequestHandler):
+    server_version = "BusinessAnalyticsAPI/1.0"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/v1/health":
+            self._send_json(200, {"status": "ok"})
+            return
+
+        handler = ROUTES.get(url.path)
+        if handler is None:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        if not _slots.acquire(timeout=API_QUEUE_TIMEOUT_SECONDS):
+            self._send_json(503, {"error": "Server busy"}, {"Retry-After": "1"})
+            return
+
+        db = SessionLocal()
+        try:
+            business_id = _authenticate(db, self.headers.get("Authorization"))
+            data_version = db.query(Business.data_version).filter(Business.id == business_id).scalar() or 0
+            etag = _etag(business_id, data_version, url.path, url.query)
+            columnar_store.sync_version(business_id, data_version)
+
+            if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self._send_empty(304, {"ETag": etag})
+                return
+
+            payload = handler(db, business_id, parse_qs(url.query))
+            self._send_json(200, payload, {"ETag": etag, "Cache-Control": "private, no-cache"})
+        except ApiError as e:
+            extra = {"WWW-Authenticate": 'Basic realm="analytics"'} if e.status == 401 else {}
+            self._send_json(e.status, {"error": e.message}, extra)
+        except Exception:
+            logger.exception("API request failed: %s", self.path)
+            self._send_json(500, {"error": "Internal server error"})
+        finally:
+            db.close()
+            _slots.release()
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/api/v1/sales/ingest":
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        if not _slots.acquire(timeout=API_QUEUE_TIMEOUT_SECONDS):
+            self._send_json(503, {"error": "Server busy"}, {"Retry-After": "1"})
+            return
+
+        db = SessionLocal()
+        holding_slot = True
+        try:
+            business_id = _authenticate(db, self.headers.get("Authorization"))
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ApiError(400, "Invalid Content-Length")
+            if length > API_MAX_BODY_BYTES:
+                raise ApiError(413, f"Body larger than {API_MAX_BODY_BYTES} bytes")
+            body = self.rfile.read(length)
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = _gunzip(body, API_MAX_BODY_BYTES)
+
+            sales, errors = parse_ndjson(db, business_id, body.splitlines())
+            db.close()
+            try:
+                ticket = get_buffer().submit(sales)
+            except BufferFull as e:
+                self._send_json(429, {"error": f"Ingest buffer full ({e}), retry later"}, {"Retry-After": "1"})
+                return
+
+            payload = {"accepted": ticket.queued, "duplicates": len(sales) - ticket.queued, "rejected": errors}
+            if parse_qs(url.query).get("wait", ["0"])[0] != "1":
+                self._send_json(202, payload)
+                return
+
+            # wait=1: answer only once the sales are committed, without
+            # holding a request slot while the writer catches up
+            _slots.release()
+            holding_slot = False
+            if not ticket.done.wait(API_INGEST_WAIT_SECONDS):
+                self._send_json(202, dict(payload, committed=False))
+            elif ticket.error:
+                self._send_json(503, dict(payload, committed=False, error=ticket.error), {"Retry-After": "1"})
+            else:
+                self._send_json(200, dict(
+                    payload, committed=True, inserted=ticket.inserted, duplicates=ticket.duplicates
+                ))
+        except ApiError as e:
+            extra = {"WWW-Authenticate": 'Basic realm="analytics"'} if e.status == 401 else {}
+            self._send_json(e.status, {"error": e.message}, extra)
+        except (OSError, EOFError, ValueError, zlib.error):
+            self._send_json(400, {"error": "Unreadable request body"})
+        except Exception:
+            logger.exception("API request failed: %s", self.path)
+            self._send_json(500, {"error": "Internal server error"})
+        finally:
+            db.close()
+            if holding_slot:
+                _slots.release()
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, default=_json_default, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Vary", "Accept-Encoding, Authorization")
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_empty(self, status: int, headers: Dict[str, str]):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def make_server(host: str = API_HOST, port: int = API_PORT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), AnalyticsRequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    instrumentation.start_exporter()
+    server = make_server(args.host, args.port)
+    logger.info("Analytics API listening on http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        get_buffer().close()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -5,9 +5,10 @@ import pandas as pd
 from datetime import datetime, timedelta
 import io
 import csv
+from sqlalchemy.exc import IntegrityError
 
-from models import init_db, SessionLocal, Product, Sale, MediaPost
-from auth import create_business, authenticate_business, get_business_by_email
+from models import init_db, get_scoped_session, remove_scoped_session, bump_data_version, to_paise, to_rupees, Business, Product, Sale, MediaPost
+from auth import create_business, authenticate_business, get_business_by_email, is_admin
 from analytics import (
     get_dashboard_stats,
     get_best_selling_products,
@@ -18,18 +19,31 @@ from analytics import (
     get_low_performing_products,
     get_revenue_by_product,
     get_media_impact_stats,
-    get_posts_with_impact,
+    get_posts_with_impact_page,
+    get_recent_sales_page,
+    get_media_posts_page,
     get_media_type_comparison,
     get_revenue_with_posts_timeline,
     get_business_recommendations,
-    get_post_timing_analysis
-)
-from demo_data import generate_demo_data, clear_demo_data
-from ml_engine import (
-    get_best_posting_recommendation,
-    get_posting_insights,
-    train_post_impact_model
+    get_post_timing_analysis,
+    get_sales_heatmap,
+    get_sales_rollup_state,
+    refresh_sales_rollup
 )
+from demo_data import generate_demo_data
+import columnar_store
+import csv_import
+import instrumentation
+import post_impacts
+import product_catalog
+import profiling
+import tenant_purge
+from charts import line_figure, add_post_markers, report_payload
+from parquet_io import export_business, import_business
+from ml_engine import train_post_impact_model
+from precompute import get_precomputed, refresh_business, start_scheduler
+from forecasting import forecast_products
+from page_loader import PanelLoader
 
 
 DEMO_EMAIL = "demo@example.com"
@@ -37,27 +51,33 @@ DEMO_PASSWORD = "demo123"
 
 def ensure_demo_account():
     """Create demo account with demo data if it doesn't exist"""
-    db = SessionLocal()
-    try:
-        existing = get_business_by_email(db, DEMO_EMAIL)
-        if not existing:
-            business = create_business(
-                db,
-                name="Demo Business",
-                owner_name="Demo User",
-                email=DEMO_EMAIL,
-                password=DEMO_PASSWORD,
-                category="Food & Beverage"
-            )
-            if business:
-                generate_demo_data(db, business.id)
-    finally:
-        db.close()
+    db = get_scoped_session()
+    existing = get_business_by_email(db, DEMO_EMAIL)
+    if not existing:
+        business = create_business(
+            db,
+            name="Demo Business",
+            owner_name="Demo User",
+            email=DEMO_EMAIL,
+            password=DEMO_PASSWORD,
+            category="Food & Beverage"
+        )
+        if business:
+            generate_demo_data(db, business.id)
+
+def mark_data_changed(db, products_changed: bool = False):
+    """Bump the business's data version and drop its columnar snapshot (and product catalog) after a bulk write"""
+    bump_data_version(db, st.session_state.business_id)
+    columnar_store.invalidate(st.session_state.business_id)
+    if products_changed:
+        product_catalog.invalidate(st.session_state.business_id)
 
 @st.cache_resource
 def init_app():
     init_db()
     ensure_demo_account()
+    start_scheduler()
+    instrumentation.start_exporter()
 
 init_app()
 
@@ -102,6 +122,54 @@ if "business_id" not in st.session_state:
     st.session_state.business_id = None
 if "business_name" not in st.session_state:
     st.session_state.business_name = None
+if "is_admin" not in st.session_state:
+    st.session_state.is_admin = False
+
+
+def show_chart(fig, name: str):
+    """Render a Plotly figure; its payload size is recorded on profiled pages"""
+    st.plotly_chart(fig, use_container_width=True)
+    report_payload(name, fig, force=profiling.is_profiling())
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_product_forecast(business_id: int, data_version: int, as_of: str):
+    """Product forecasts, refit only when the business's data or the date changes"""
+    return forecast_products(get_scoped_session(), business_id)
+
+
+def freshness_caption(updated_at: datetime, stale: bool):
+    """Caption with the age of background-computed results (updated_at in UTC)"""
+    age_minutes = int((datetime.utcnow() - updated_at).total_seconds() // 60)
+    freshness = "just now" if age_minutes < 1 else (
+        f"{age_minutes} min ago" if age_minutes < 120 else f"{age_minutes // 60} h ago"
+    )
+    st.caption(f"Updated {freshness}" + (" · new data since then, an update is queued" if stale else ""))
+
+
+def pager_state(key: str):
+    """Page-size selector for a keyset-paginated table; returns (page_size, cursor)"""
+    page_size = st.selectbox("Rows per page", [10, 25, 50, 100], key=f"{key}_page_size_select")
+    if st.session_state.get(f"{key}_page_size") != page_size:
+        st.session_state[f"{key}_page_size"] = page_size
+        st.session_state[f"{key}_cursors"] = []
+    cursors = st.session_state[f"{key}_cursors"]
+    return page_size, (cursors[-1] if cursors else None)
+
+
+def pager_controls(key: str, next_cursor):
+    cursors = st.session_state[f"{key}_cursors"]
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("← Newer", key=f"{key}_prev", disabled=not cursors, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Page {len(cursors) + 1}")
+    with col3:
+        if st.button("Older →", key=f"{key}_next", disabled=next_cursor is None, use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
 
 
 def show_auth_page():
@@ -123,13 +191,14 @@ def show_auth_page():
                 
                 if submit:
                     if email and password:
-                        db = SessionLocal()
+                        db = get_scoped_session()
                         try:
                             business = authenticate_business(db, email, password)
                             if business:
                                 st.session_state.authenticated = True
                                 st.session_state.business_id = business.id
                                 st.session_state.business_name = business.name
+                                st.session_state.is_admin = is_admin(business)
                                 st.rerun()
                             else:
                                 st.error("Invalid email or password")
@@ -158,7 +227,7 @@ def show_auth_page():
                         elif len(password) < 6:
                             st.error("Password must be at least 6 characters")
                         else:
-                            db = SessionLocal()
+                            db = get_scoped_session()
                             try:
                                 existing = get_business_by_email(db, email)
                                 if existing:
@@ -168,6 +237,7 @@ def show_auth_page():
                                     st.session_state.authenticated = True
                                     st.session_state.business_id = business.id
                                     st.session_state.business_name = business.name
+                                    st.session_state.is_admin = is_admin(business)
                                     st.success("Account created successfully!")
                                     st.rerun()
                             finally:
@@ -176,167 +246,189 @@ def show_auth_page():
                         st.warning("Please fill in all fields")
 
 
-def show_dashboard():
-    db = SessionLocal()
-    try:
-        stats = get_dashboard_stats(db, st.session_state.business_id)
-        
-        st.title(f"Dashboard - {st.session_state.business_name}")
-        
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric(
-                label="Total Revenue",
-                value=f"₹{stats['total_revenue']:,.2f}",
-                delta=None
-            )
-        
-        with col2:
-            st.metric(
-                label="Total Profit",
-                value=f"₹{stats['total_profit']:,.2f}",
-                delta=None
-            )
-        
-        with col3:
-            st.metric(
-                label="Total Orders",
-                value=f"{stats['total_orders']:,}",
-                delta=None
-            )
-        
-        with col4:
-            st.metric(
-                label="Products",
-                value=f"{stats['total_products']}",
-                delta=None
-            )
-        
-        recommendations = get_business_recommendations(db, st.session_state.business_id)
-        
-        health_color = "#10b981" if recommendations["health_score"] >= 70 else (
-            "#f59e0b" if recommendations["health_score"] >= 40 else "#ef4444"
+def dashboard_stats_panel(stats):
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric(
+            label="Total Revenue",
+            value=f"₹{stats['total_revenue']:,.2f}",
+            delta=None
         )
-        trend_icon = "📈" if recommendations.get("growth_trend") == "growing" else (
-            "📉" if recommendations.get("growth_trend") == "declining" else "➡️"
+    
+    with col2:
+        st.metric(
+            label="Total Profit",
+            value=f"₹{stats['total_profit']:,.2f}",
+            delta=None
         )
+    
+    with col3:
+        st.metric(
+            label="Total Orders",
+            value=f"{stats['total_orders']:,}",
+            delta=None
+        )
+    
+    with col4:
+        st.metric(
+            label="Products",
+            value=f"{stats['total_products']}",
+            delta=None
+        )
+
+
+def dashboard_outcome_panel(recommendations):
+    health_color = "#10b981" if recommendations["health_score"] >= 70 else (
+        "#f59e0b" if recommendations["health_score"] >= 40 else "#ef4444"
+    )
+    trend_icon = "📈" if recommendations.get("growth_trend") == "growing" else (
+        "📉" if recommendations.get("growth_trend") == "declining" else "➡️"
+    )
+    
+    st.markdown("")
+    
+    if "show_outcome" not in st.session_state:
+        st.session_state.show_outcome = False
+    
+    outcome_btn = st.button("🎯 VIEW YOUR ACTION ITEMS - Click to see what to do next!", 
+                            use_container_width=True, type="primary", key="outcome_btn")
+    
+    if outcome_btn:
+        st.session_state.show_outcome = not st.session_state.show_outcome
+    
+    if st.session_state.show_outcome:
+        st.markdown(f"""
+        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
+                    padding: 20px; border-radius: 12px; color: white; text-align: center; margin: 16px 0;">
+            <div style="font-size: 1.2rem; margin-bottom: 8px;">Business Health Score</div>
+            <div style="font-size: 3rem; font-weight: bold;">{recommendations["health_score"]}/100</div>
+            <div style="font-size: 1rem; opacity: 0.9; margin-top: 8px;">
+                {trend_icon} Sales {recommendations.get("growth_trend", "stable").capitalize()} | Focus: {recommendations["focus_area"]}
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
         
-        st.markdown("")
-        
-        if "show_outcome" not in st.session_state:
-            st.session_state.show_outcome = False
-        
-        outcome_btn = st.button("🎯 VIEW YOUR ACTION ITEMS - Click to see what to do next!", 
-                                use_container_width=True, type="primary", key="outcome_btn")
-        
-        if outcome_btn:
-            st.session_state.show_outcome = not st.session_state.show_outcome
+        st.markdown("### What You Should Do Next")
         
-        if st.session_state.show_outcome:
+        for rec in recommendations["recommendations"]:
+            if rec["priority"] == "high":
+                priority_color = "#ef4444"
+                bg_color = "#fef2f2"
+                border_color = "#fecaca"
+                priority_label = "HIGH PRIORITY"
+            elif rec["priority"] == "medium":
+                priority_color = "#f59e0b"
+                bg_color = "#fffbeb"
+                border_color = "#fde68a"
+                priority_label = "MEDIUM"
+            else:
+                priority_color = "#10b981"
+                bg_color = "#ecfdf5"
+                border_color = "#a7f3d0"
+                priority_label = "LOW"
+            
             st.markdown(f"""
-            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                        padding: 20px; border-radius: 12px; color: white; text-align: center; margin: 16px 0;">
-                <div style="font-size: 1.2rem; margin-bottom: 8px;">Business Health Score</div>
-                <div style="font-size: 3rem; font-weight: bold;">{recommendations["health_score"]}/100</div>
-                <div style="font-size: 1rem; opacity: 0.9; margin-top: 8px;">
-                    {trend_icon} Sales {recommendations.get("growth_trend", "stable").capitalize()} | Focus: {recommendations["focus_area"]}
+            <div style="background: {bg_color}; padding: 16px; border-radius: 10px; margin-bottom: 12px; 
+                        border: 2px solid {border_color}; box-shadow: 0 1px 3px rgba(0,0,0,0.1);">
+                <div style="display: flex; align-items: center; gap: 12px;">
+                    <span style="font-size: 1.5rem;">{rec["icon"]}</span>
+                    <div style="flex: 1;">
+                        <div style="font-weight: 600; font-size: 1.1rem; color: #1f2937;">{rec["title"]}</div>
+                        <div style="color: #4b5563; font-size: 0.95rem; margin-top: 4px;">{rec["description"]}</div>
+                    </div>
+                    <span style="background: {priority_color}; color: white; padding: 4px 12px; 
+                                 border-radius: 20px; font-size: 0.75rem; font-weight: 600;">{priority_label}</span>
                 </div>
             </div>
             """, unsafe_allow_html=True)
-            
-            st.markdown("### What You Should Do Next")
-            
-            for rec in recommendations["recommendations"]:
-                if rec["priority"] == "high":
-                    priority_color = "#ef4444"
-                    bg_color = "#fef2f2"
-                    border_color = "#fecaca"
-                    priority_label = "HIGH PRIORITY"
-                elif rec["priority"] == "medium":
-                    priority_color = "#f59e0b"
-                    bg_color = "#fffbeb"
-                    border_color = "#fde68a"
-                    priority_label = "MEDIUM"
-                else:
-                    priority_color = "#10b981"
-                    bg_color = "#ecfdf5"
-                    border_color = "#a7f3d0"
-                    priority_label = "LOW"
-                
-                st.markdown(f"""
-                <div style="background: {bg_color}; padding: 16px; border-radius: 10px; margin-bottom: 12px; 
-                            border: 2px solid {border_color}; box-shadow: 0 1px 3px rgba(0,0,0,0.1);">
-                    <div style="display: flex; align-items: center; gap: 12px;">
-                        <span style="font-size: 1.5rem;">{rec["icon"]}</span>
-                        <div style="flex: 1;">
-                            <div style="font-weight: 600; font-size: 1.1rem; color: #1f2937;">{rec["title"]}</div>
-                            <div style="color: #4b5563; font-size: 0.95rem; margin-top: 4px;">{rec["description"]}</div>
-                        </div>
-                        <span style="background: {priority_color}; color: white; padding: 4px 12px; 
-                                     border-radius: 20px; font-size: 0.75rem; font-weight: 600;">{priority_label}</span>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-        
-        st.divider()
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("Top Selling Products")
-            best_products = get_best_selling_products(db, st.session_state.business_id, 5)
-            if best_products:
-                df = pd.DataFrame(best_products)
-                fig = px.bar(
-                    df,
-                    x="name",
-                    y="quantity_sold",
-                    color="category",
-                    title="Units Sold by Product"
-                )
-                fig.update_layout(xaxis_title="", yaxis_title="Quantity Sold")
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("No sales data yet. Add products and sales to see insights.")
-        
-        with col2:
-            st.subheader("Revenue by Product")
-            revenue_data = get_revenue_by_product(db, st.session_state.business_id)
-            if revenue_data:
-                df = pd.DataFrame(revenue_data)
-                fig = px.pie(
-                    df,
-                    values="revenue",
-                    names="name",
-                    title="Revenue Distribution"
-                )
-                st.plotly_chart(fig, use_container_width=True)
+
+
+def dashboard_best_products_panel(best_products):
+    if best_products:
+        df = pd.DataFrame(best_products)
+        fig = px.bar(
+            df,
+            x="name",
+            y="quantity_sold",
+            color="category",
+            title="Units Sold by Product"
+        )
+        fig.update_layout(xaxis_title="", yaxis_title="Quantity Sold")
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No sales data yet. Add products and sales to see insights.")
+
+
+def dashboard_revenue_panel(revenue_data):
+    if revenue_data:
+        df = pd.DataFrame(revenue_data)
+        fig = px.pie(
+            df,
+            values="revenue",
+            names="name",
+            title="Revenue Distribution"
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No revenue data available yet.")
+
+
+def dashboard_weekly_panel(weekly_trends):
+    if weekly_trends:
+        df = pd.DataFrame(weekly_trends)
+        fig = line_figure(df, x="week", y="revenue", title="Revenue Over Time", markers=True)
+        fig.update_layout(xaxis_title="Week Starting", yaxis_title="Revenue (₹)")
+        show_chart(fig, "dashboard_weekly_revenue")
+    else:
+        st.info("Not enough data for trends yet.")
+
+
+def show_dashboard():
+    business_id = st.session_state.business_id
+    loader = PanelLoader({
+        "stats": lambda db: get_dashboard_stats(db, business_id),
+        "recommendations": lambda db: get_business_recommendations(db, business_id),
+        "best_products": lambda db: get_best_selling_products(db, business_id, 5),
+        "revenue": lambda db: get_revenue_by_product(db, business_id),
+        "weekly": lambda db: get_weekly_trends(db, business_id, 8)
+    })
+    
+    st.title(f"Dashboard - {st.session_state.business_name}")
+    
+    # Lay out every panel up front, then fill each one as its data arrives
+    areas = {"stats": st.empty(), "recommendations": st.empty()}
+    st.divider()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Top Selling Products")
+        areas["best_products"] = st.empty()
+    with col2:
+        st.subheader("Revenue by Product")
+        areas["revenue"] = st.empty()
+    st.subheader("Weekly Sales Trends")
+    areas["weekly"] = st.empty()
+    
+    for area in areas.values():
+        area.caption("Loading...")
+    
+    renderers = {
+        "stats": dashboard_stats_panel,
+        "recommendations": dashboard_outcome_panel,
+        "best_products": dashboard_best_products_panel,
+        "revenue": dashboard_revenue_panel,
+        "weekly": dashboard_weekly_panel
+    }
+    for name, result, error in loader.as_completed():
+        with areas[name].container():
+            if error is not None:
+                st.error("This panel could not be loaded. Try refreshing the page.")
             else:
-                st.info("No revenue data available yet.")
-        
-        st.subheader("Weekly Sales Trends")
-        weekly_trends = get_weekly_trends(db, st.session_state.business_id, 8)
-        if weekly_trends:
-            df = pd.DataFrame(weekly_trends)
-            fig = px.line(
-                df,
-                x="week",
-                y="revenue",
-                markers=True,
-                title="Revenue Over Time"
-            )
-            fig.update_layout(xaxis_title="Week Starting", yaxis_title="Revenue (₹)")
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("Not enough data for trends yet.")
-        
-    finally:
-        db.close()
+                renderers[name](result)
 
 
 def show_products_analytics():
-    db = SessionLocal()
+    db = get_scoped_session()
     try:
         st.title("Product Analytics")
         
@@ -419,7 +511,7 @@ def show_products_analytics():
 
 
 def show_best_day():
-    db = SessionLocal()
+    db = get_scoped_session()
     try:
         st.title("Best Day Analysis")
         
@@ -464,11 +556,11 @@ def show_best_day():
 
 
 def show_trends():
-    db = SessionLocal()
+    db = get_scoped_session()
     try:
         st.title("Sales Trends")
         
-        tab1, tab2 = st.tabs(["Weekly Trends", "Monthly Trends"])
+        tab1, tab2, tab3 = st.tabs(["Weekly Trends", "Monthly Trends", "Product Forecast"])
         
         with tab1:
             st.subheader("Weekly Sales Trends")
@@ -477,16 +569,10 @@ def show_trends():
             if weekly:
                 df = pd.DataFrame(weekly)
                 
-                fig = px.line(
-                    df,
-                    x="week",
-                    y="revenue",
-                    markers=True,
-                    title="Weekly Revenue"
-                )
+                fig = line_figure(df, x="week", y="revenue", title="Weekly Revenue", markers=True)
                 fig.update_traces(line_color='#667eea', marker_size=10)
                 fig.update_layout(xaxis_title="Week Starting", yaxis_title="Revenue (₹)")
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig, "trends_weekly_revenue")
                 
                 fig2 = px.bar(
                     df,
@@ -521,13 +607,139 @@ def show_trends():
                 st.dataframe(df, use_container_width=True, hide_index=True)
             else:
                 st.info("Not enough data for monthly trends yet.")
+        
+        with tab3:
+            st.subheader("Product Demand Forecast")
+            data_version = db.query(Business.data_version).filter(Business.id == st.session_state.business_id).scalar() or 0
+            with st.spinner("Fitting forecast model..."):
+                forecast = cached_product_forecast(
+                    st.session_state.business_id, data_version, datetime.now().strftime("%Y-%m-%d")
+                )
+            
+            if forecast.get("success"):
+                horizon = st.radio("Horizon", forecast["horizons"], format_func=lambda h: f"Next {h} days", horizontal=True)
+                metrics = forecast["metrics"][horizon]
+                
+                rows = [{
+                    "Product": p["name"],
+                    "Category": p["category"],
+                    "Recent Units/Day": p["recent_daily_units"],
+                    "Forecast Units": p["forecasts"][horizon]["units"],
+                    "Low": p["forecasts"][horizon]["lower"],
+                    "High": p["forecasts"][horizon]["upper"],
+                    "Forecast Revenue": p["forecasts"][horizon]["revenue"]
+                } for p in forecast["products"]]
+                df = pd.DataFrame(rows).sort_values("Forecast Units", ascending=False)
+                
+                top = df.head(15)
+                fig = go.Figure(go.Bar(
+                    x=top["Product"],
+                    y=top["Forecast Units"],
+                    error_y=dict(
+                        type="data", symmetric=False,
+                        array=top["High"] - top["Forecast Units"],
+                        arrayminus=top["Forecast Units"] - top["Low"]
+                    ),
+                    marker_color="#667eea"
+                ))
+                fig.update_layout(
+                    title=f"Forecast Units, Next {horizon} Days ({forecast['interval']:.0%} interval)",
+                    xaxis_title="Product", yaxis_title="Units"
+                )
+                st.plotly_chart(fig, use_container_width=True)
                 
+                st.dataframe(df, use_container_width=True, hide_index=True)
+                st.caption(
+                    f"As of {forecast['as_of']} · backtest MAE {metrics['mae']:.1f} units per product "
+                    f"(28-day average baseline: {metrics['naive_mae']:.1f}) · fitted in {forecast['fit_seconds']:.1f}s"
+                )
+            else:
+                st.info(forecast.get("error", "Not enough data to forecast yet."))
+                
+    finally:
+        db.close()
+
+
+def show_sales_heatmap():
+    db = get_scoped_session()
+    try:
+        st.title("Sales Heatmap")
+        st.markdown("See which days and hours bring in the most sales.")
+        
+        state = get_sales_rollup_state(db, st.session_state.business_id)
+        if state is None:
+            with st.spinner("Summarizing your sales by hour..."):
+                refresh_sales_rollup(db, st.session_state.business_id)
+            state = get_sales_rollup_state(db, st.session_state.business_id)
+        
+        fresh_col, refresh_col = st.columns([4, 1])
+        with fresh_col:
+            freshness_caption(state["built_at"], state["stale"])
+        with refresh_col:
+            if st.button("Refresh now", key="refresh_heatmap", use_container_width=True):
+                with st.spinner("Summarizing..."):
+                    refresh_sales_rollup(db, st.session_state.business_id)
+                st.rerun()
+        
+        categories = sorted({
+            c or "" for (c,) in db.query(Product.category).filter(
+                Product.business_id == st.session_state.business_id
+            ).distinct()
+        })
+        
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            today = datetime.now().date()
+            date_range = st.date_input("Date range", value=(today - timedelta(days=90), today), max_value=today)
+        with col2:
+            selected = st.multiselect(
+                "Categories", categories, default=categories,
+                format_func=lambda c: c or "Uncategorized"
+            )
+        with col3:
+            metric = st.radio("Show", ["Revenue", "Orders"], horizontal=True)
+        
+        start_date, end_date = (date_range[0], date_range[-1]) if date_range else (None, None)
+        heatmap = get_sales_heatmap(
+            db, st.session_state.business_id, start_date, end_date,
+            selected if len(selected) < len(categories) else None
+        )
+        
+        if heatmap["total_orders"]:
+            z = heatmap["revenue"] if metric == "Revenue" else heatmap["orders"]
+            fig = go.Figure(go.Heatmap(
+                z=z,
+                x=[f"{h:02d}:00" for h in heatmap["hours"]],
+                y=heatmap["days"],
+                colorscale="Purples",
+                hovertemplate="%{y} %{x}<br>" + ("₹%{z:,.2f}" if metric == "Revenue" else "%{z} orders") + "<extra></extra>"
+            ))
+            fig.update_layout(
+                title=f"{metric} by Day and Hour",
+                xaxis_title="Hour",
+                yaxis=dict(autorange="reversed"),
+                height=420
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            
+            best_day, best_hour = max(
+                ((d, h) for d in range(7) for h in range(24)), key=lambda dh: z[dh[0]][dh[1]]
+            )
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Busiest Slot", f"{heatmap['days'][best_day]} {best_hour:02d}:00")
+            col2.metric("Revenue", f"₹{heatmap['total_revenue']:,.2f}")
+            col3.metric("Orders", f"{heatmap['total_orders']:,}")
+            if heatmap["untimed_orders"]:
+                st.caption(f"{heatmap['untimed_orders']:,} orders in this range have no time recorded and are not shown.")
+        else:
+            st.info("No timed sales in this range. Record sales with a time of sale to fill the heatmap.")
+            
     finally:
         db.close()
 
 
 def show_media_impact():
-    db = SessionLocal()
+    db = get_scoped_session()
     try:
         st.title("Media Impact Analysis")
         st.markdown("See how your social media posts (reels and stories) affect your sales")
@@ -600,31 +812,23 @@ def show_media_impact():
                 df = pd.DataFrame(timeline["revenue_data"])
                 df["date"] = pd.to_datetime(df["date"])
                 
-                fig = px.line(df, x="date", y="revenue", title="Daily Revenue (Last 30 Days)")
+                fig = line_figure(df, x="date", y="revenue", title="Daily Revenue (Last 30 Days)")
                 fig.update_traces(line_color='#667eea')
-                
-                for marker in timeline["post_markers"]:
-                    color = '#ff6b6b' if marker["type"] == "reel" else '#feca57'
-                    marker_date = pd.to_datetime(marker["date"])
-                    fig.add_shape(
-                        type="line",
-                        x0=marker_date, x1=marker_date,
-                        y0=0, y1=1,
-                        yref="paper",
-                        line=dict(color=color, width=1, dash="dash")
-                    )
+                add_post_markers(fig, timeline["post_markers"])
                 
                 fig.update_layout(
                     xaxis_title="Date",
                     yaxis_title="Revenue (₹)",
                     showlegend=False
                 )
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig, "media_revenue_timeline")
                 st.caption("R = Reel posted, S = Story posted")
         
         st.subheader("Individual Post Performance")
         
-        posts_with_impact = get_posts_with_impact(db, st.session_state.business_id)
+        page_size, cursor = pager_state("post_impact")
+        posts_page = get_posts_with_impact_page(db, st.session_state.business_id, page_size, cursor)
+        posts_with_impact = posts_page["posts"]
         
         if posts_with_impact:
             df = pd.DataFrame(posts_with_impact)
@@ -644,6 +848,7 @@ def show_media_impact():
             display_df = df[["posted_at", "post_type", "caption", "engagement", "lift_percent", "incremental_revenue"]].copy()
             display_df.columns = ["Date", "Type", "Caption", "Engagement", "Lift %", "Incremental ₹"]
             st.dataframe(display_df, use_container_width=True, hide_index=True)
+            pager_controls("post_impact", posts_page["next_cursor"])
             
             st.markdown("---")
             st.markdown("### Understanding the Metrics")
@@ -658,12 +863,26 @@ def show_media_impact():
 
 
 def show_post_recommendations():
-    db = SessionLocal()
+    db = get_scoped_session()
     try:
         st.title("Post Recommendations")
         st.markdown("Get data-driven recommendations for when to post based on **sales impact**, not just engagement.")
         
-        recommendation = get_best_posting_recommendation(db, st.session_state.business_id)
+        precomputed = get_precomputed(db, st.session_state.business_id)
+        if precomputed is None:
+            with st.spinner("Analyzing your posts and sales..."):
+                precomputed = refresh_business(db, st.session_state.business_id)
+        
+        fresh_col, refresh_col = st.columns([4, 1])
+        with fresh_col:
+            freshness_caption(precomputed["computed_at"], precomputed["stale"])
+        with refresh_col:
+            if st.button("Refresh now", key="refresh_recommendations", use_container_width=True):
+                with st.spinner("Recomputing..."):
+                    refresh_business(db, st.session_state.business_id)
+                st.rerun()
+        
+        recommendation = precomputed["payload"]["recommendation"]
         
         if recommendation.get("error"):
             st.warning(recommendation.get("message", "Add more posts and sales data to get personalized recommendations."))
@@ -751,7 +970,7 @@ def show_post_recommendations():
             
             st.divider()
             
-            insights = get_posting_insights(db, st.session_state.business_id)
+            insights = precomputed["payload"]["insights"]
             
             if insights.get("has_data"):
                 col1, col2 = st.columns(2)
@@ -801,12 +1020,17 @@ def show_post_recommendations():
                         result = train_post_impact_model(db, st.session_state.business_id)
                         
                         if result.get("success"):
+                            columnar_store.version_bumped(
+                                st.session_state.business_id, bump_data_version(db, st.session_state.business_id)
+                            )
+                            refresh_business(db, st.session_state.business_id)
                             st.success(f"Model trained successfully!")
                             st.markdown(f"""
                             **Model Performance:**
-                            - R² Score: {result.get('r2', 0):.3f} (higher is better, max 1.0)
+                            - R² Score: {result.get('r2', 0):.3f} on the most recent days (higher is better, max 1.0)
                             - Mean Absolute Error: ₹{result.get('mae', 0):,.2f}
                             - Data points used: {result.get('data_points', 0)}
+                            - Trained in {result.get('train_seconds', 0):.2f}s ({result.get('iterations', 0)} trees, {result.get('estimator', '')})
                             
                             **Top Features:**
                             """)
@@ -839,8 +1063,21 @@ def show_post_recommendations():
         db.close()
 
 
+@st.fragment(run_every=1)
+def purge_progress(business_id: int):
+    """Progress of a background "Clear All Data"; reruns the page once it finishes"""
+    status = tenant_purge.get_purge(business_id).status()
+    if status["state"] != "running":
+        st.rerun()
+    total = max(status["total"] or 0, status["deleted_rows"], 1)
+    st.progress(
+        status["deleted_rows"] / total,
+        text=f"Clearing data: {status['table'] or 'counting rows'} ({status['deleted_rows']:,} of {total:,} rows)"
+    )
+
+
 def show_data_management():
-    db = SessionLocal()
+    db = get_scoped_session()
     try:
         st.title("Data Management")
         
@@ -900,6 +1137,7 @@ def show_data_management():
             with col2:
                 if st.button("Load Demo Data to Explore", use_container_width=True, type="primary"):
                     if generate_demo_data(db, st.session_state.business_id):
+                        mark_data_changed(db, products_changed=True)
                         st.success("Demo data loaded! Go to Dashboard to see your insights.")
                         st.rerun()
             
@@ -962,35 +1200,43 @@ def show_data_management():
                 submitted = st.form_submit_button("Add Product", use_container_width=True, type="primary")
                 
                 if submitted:
-                    if name and cost_price > 0 and selling_price > 0:
+                    duplicate = f"A product named '{name.strip()}' already exists"
+                    if name and product_catalog.get_catalog(db, st.session_state.business_id, refresh=True).by_name(name):
+                        st.error(duplicate)
+                    elif name and cost_price > 0 and selling_price > 0:
                         product = Product(
                             business_id=st.session_state.business_id,
                             name=name,
-                            cost_price=cost_price,
-                            selling_price=selling_price,
+                            cost_price_paise=to_paise(cost_price),
+                            selling_price_paise=to_paise(selling_price),
                             category=category
                         )
                         db.add(product)
-                        db.commit()
-                        st.success(f"Product '{name}' added successfully!")
-                        st.rerun()
+                        try:
+                            db.commit()
+                        except IntegrityError:
+                            # Added concurrently (e.g. a double submit): ux_products_business_name_key caught it
+                            db.rollback()
+                            st.error(duplicate)
+                        else:
+                            mark_data_changed(db, products_changed=True)
+                            st.success(f"Product '{name}' added successfully!")
+                            st.rerun()
                     else:
                         st.error("Please enter a product name")
             
-            current_products = db.query(Product).filter(
-                Product.business_id == st.session_state.business_id
-            ).all()
+            catalog = product_catalog.get_catalog(db, st.session_state.business_id)
             
-            if current_products:
+            if len(catalog):
                 st.markdown("---")
-                st.markdown(f"**Your Products ({len(current_products)})**")
+                st.markdown(f"**Your Products ({len(catalog)})**")
                 product_data = [{
                     "Name": p.name,
                     "Category": p.category,
-                    "Cost": f"₹{p.cost_price:.2f}",
-                    "Price": f"₹{p.selling_price:.2f}",
-                    "Margin": f"{((p.selling_price - p.cost_price) / p.selling_price * 100):.1f}%"
-                } for p in current_products]
+                    "Cost": f"₹{to_rupees(p.cost_price_paise):.2f}",
+                    "Price": f"₹{to_rupees(p.selling_price_paise):.2f}",
+                    "Margin": f"{margin:.1f}%"
+                } for p, margin in zip(catalog.records, catalog.margin_percent)]
                 st.dataframe(pd.DataFrame(product_data), use_container_width=True, hide_index=True)
             else:
                 st.info("No products added yet. Add your first product above!")
@@ -1016,45 +1262,47 @@ def show_data_management():
                     
                     selected = product_options.get(selected_product)
                     if selected:
-                        estimated_total = quantity * selected.selling_price
-                        st.markdown(f"**Total: ₹{estimated_total:.2f}** (₹{selected.selling_price:.2f} x {quantity})")
+                        estimated_total = to_rupees(quantity * selected.selling_price_paise)
+                        st.markdown(
+                            f"**Total: ₹{estimated_total:.2f}** (₹{to_rupees(selected.selling_price_paise):.2f} x {quantity})"
+                        )
                     
                     submitted = st.form_submit_button("Record Sale", use_container_width=True, type="primary")
                     
                     if submitted:
                         product = product_options[selected_product]
-                        total_amount = quantity * product.selling_price
+                        total_amount_paise = quantity * product.selling_price_paise
                         
                         sale = Sale(
                             product_id=product.id,
                             quantity=quantity,
-                            total_amount=total_amount,
+                            total_amount_paise=total_amount_paise,
                             sale_date=sale_date
                         )
                         db.add(sale)
                         db.commit()
-                        st.success(f"Recorded: {quantity}x {selected_product} = ₹{total_amount:.2f}")
+                        post_impacts.update_for_sales(db, st.session_state.business_id, [sale_date])
+                        data_version = bump_data_version(db, st.session_state.business_id)
+                        columnar_store.append_sale(
+                            st.session_state.business_id, product.id, quantity, total_amount_paise, sale_date,
+                            data_version=data_version
+                        )
+                        st.success(f"Recorded: {quantity}x {selected_product} = ₹{to_rupees(total_amount_paise):.2f}")
                         st.rerun()
                 
-                product_ids = [p.id for p in all_products]
-                recent_sales = db.query(Sale).filter(
-                    Sale.product_id.in_(product_ids)
-                ).order_by(Sale.sale_date.desc()).limit(10).all()
-                
-                if recent_sales:
+                if sales_count:
                     st.markdown("---")
-                    st.markdown("**Recent Sales (Last 10)**")
-                    sales_data = []
-                    for s in recent_sales:
-                        prod = next((p for p in all_products if p.id == s.product_id), None)
-                        if prod:
-                            sales_data.append({
-                                "Date": s.sale_date.strftime("%Y-%m-%d"),
-                                "Product": prod.name,
-                                "Qty": s.quantity,
-                                "Total": f"₹{s.total_amount:.2f}"
-                            })
+                    st.markdown("**Recent Sales**")
+                    page_size, cursor = pager_state("recent_sales")
+                    sales_page = get_recent_sales_page(db, st.session_state.business_id, page_size, cursor)
+                    sales_data = [{
+                        "Date": s["sale_date"],
+                        "Product": s["product_name"],
+                        "Qty": s["quantity"],
+                        "Total": f"₹{s['total_amount']:.2f}"
+                    } for s in sales_page["sales"]]
                     st.dataframe(pd.DataFrame(sales_data), use_container_width=True, hide_index=True)
+                    pager_controls("recent_sales", sales_page["next_cursor"])
             else:
                 st.warning("Add products first before recording sales. Go to the 'Add Products' tab.")
         
@@ -1093,46 +1341,91 @@ def show_data_management():
                         )
                         db.add(media_post)
                         db.commit()
+                        post_impacts.update_for_posts(db, st.session_state.business_id, [media_post.id])
+                        data_version = bump_data_version(db, st.session_state.business_id)
+                        columnar_store.append_post(st.session_state.business_id, media_post, data_version)
                         st.success(f"{post_type.capitalize()} added successfully!")
                         st.rerun()
             
-            media_posts = db.query(MediaPost).filter(
-                MediaPost.business_id == st.session_state.business_id
-            ).order_by(MediaPost.posted_at.desc()).all()
-            
-            if media_posts:
+            if posts_count:
+                page_size, cursor = pager_state("media_posts")
+                posts_page = get_media_posts_page(db, st.session_state.business_id, page_size, cursor)
                 posts_data = [{
-                    "Date": p.posted_at.strftime("%Y-%m-%d"),
-                    "Type": p.post_type.capitalize(),
-                    "Caption": (p.caption[:50] + "...") if p.caption and len(p.caption) > 50 else (p.caption or ""),
-                    "Impressions": p.impressions,
-                    "Likes": p.likes,
-                    "Comments": p.comments,
-                    "Shares": p.shares,
-                    "Engagement": p.likes + p.comments + p.shares
-                } for p in media_posts]
+                    "Date": p["posted_at"],
+                    "Type": p["post_type"].capitalize(),
+                    "Caption": (p["caption"][:50] + "...") if p["caption"] and len(p["caption"]) > 50 else (p["caption"] or ""),
+                    "Impressions": p["impressions"],
+                    "Likes": p["likes"],
+                    "Comments": p["comments"],
+                    "Shares": p["shares"],
+                    "Engagement": p["engagement"]
+                } for p in posts_page["posts"]]
                 st.dataframe(pd.DataFrame(posts_data), use_container_width=True, hide_index=True)
+                pager_controls("media_posts", posts_page["next_cursor"])
             else:
                 st.info("No media posts added yet. Add posts to track their impact on sales.")
         
         elif selected_tab == "Import / Demo":
             st.subheader("Quick Start with Demo Data")
+            purge = tenant_purge.get_purge(st.session_state.business_id)
+            purging = purge is not None and purge.running
+            if purging:
+                purge_progress(st.session_state.business_id)
+            elif purge is not None and st.session_state.get("purge_reported") != purge.status()["started_at"]:
+                status = purge.status()
+                st.session_state.purge_reported = status["started_at"]
+                if status["state"] == "done":
+                    st.success(f"All data cleared ({status['deleted_rows']:,} rows).")
+                else:
+                    st.error(f"Clearing data failed: {status['error']}")
             demo_col1, demo_col2 = st.columns(2)
             with demo_col1:
-                if st.button("Load Demo Data", use_container_width=True, type="primary"):
+                if st.button("Load Demo Data", use_container_width=True, type="primary", disabled=purging):
                     if generate_demo_data(db, st.session_state.business_id):
+                        mark_data_changed(db, products_changed=True)
                         st.success("Demo data loaded! Go to Dashboard to see insights.")
                         st.rerun()
                     else:
                         st.warning("Demo data already exists.")
             with demo_col2:
-                if st.button("Clear All Data", use_container_width=True, type="secondary"):
-                    clear_demo_data(db, st.session_state.business_id)
-                    st.success("All data cleared.")
+                if st.button("Clear All Data", use_container_width=True, type="secondary", disabled=purging):
+                    tenant_purge.start_purge(st.session_state.business_id)
                     st.rerun()
             
             st.divider()
             
+            st.subheader("Backup & Restore (Parquet)")
+            st.markdown("Export all products, sales and media posts as a compressed Parquet archive, or restore one.")
+            backup_col1, backup_col2 = st.columns(2)
+            with backup_col1:
+                if st.button("Prepare Parquet Export", use_container_width=True, key="parquet_export_btn"):
+                    buffer = io.BytesIO()
+                    result = export_business(db, st.session_state.business_id, buffer)
+                    if result.get("success"):
+                        st.session_state.parquet_export = buffer.getvalue()
+                        st.success(f"Exported {result['products']} products, {result['sales']} sales and {result['media_posts']} posts.")
+                    else:
+                        st.error(result.get("error", "Export failed"))
+                if st.session_state.get("parquet_export"):
+                    st.download_button(
+                        "Download Export",
+                        data=st.session_state.parquet_export,
+                        file_name=f"business_{st.session_state.business_id}_export.zip",
+                        mime="application/zip",
+                        use_container_width=True
+                    )
+            with backup_col2:
+                parquet_file = st.file_uploader("Restore from Parquet Export", type="zip", key="parquet_zip")
+                if parquet_file is not None and st.button("Import Parquet Archive", use_container_width=True, key="parquet_import_btn"):
+                    result = import_business(db, st.session_state.business_id, parquet_file)
+                    if result.get("success"):
+                        mark_data_changed(db, products_changed=True)
+                        st.success(f"Imported {result['products']} products, {result['sales']} sales and {result['media_posts']} posts.")
+                    else:
+                        st.error(result.get("error", "Import failed"))
+            
+            st.divider()
+            
             st.subheader("Import from CSV Files")
             st.info("Import your data in 3 steps: First Products, then Sales, then Media Posts (optional)")
             
@@ -1205,6 +1498,7 @@ def show_data_management():
                 
                 st.markdown("**Example CSV:**")
                 st.code("name,cost_price,selling_price,category\nMasala Chai,15,30,Beverages\nSamosa,8,20,Snacks", language="csv")
+                st.caption("Products are matched by name (ignoring case and spaces): re-uploading a catalog updates existing products instead of duplicating them.")
                 
                 products_file = st.file_uploader("Upload Products CSV", type="csv", key="products_csv")
                 
@@ -1214,21 +1508,13 @@ def show_data_management():
                         st.dataframe(df.head(5), use_container_width=True)
                         
                         if st.button("Import Products & Go to Sales", use_container_width=True, type="primary", key="import_products_btn"):
-                            imported = 0
-                            for _, row in df.iterrows():
-                                name = str(row.get('name', '')).strip()
-                                if name:
-                                    product = Product(
-                                        business_id=st.session_state.business_id,
-                                        name=name,
-                                        cost_price=float(row.get('cost_price', 0)),
-                                        selling_price=float(row.get('selling_price', 0)),
-                                        category=str(row.get('category', 'General')) if pd.notna(row.get('category')) else 'General'
-                                    )
-                                    db.add(product)
-                                    imported += 1
-                            db.commit()
-                            st.success(f"Successfully imported {imported} products! Moving to Sales import...")
+                            with instrumentation.timer("import_seconds", source="csv", table="products"):
+                                summary = csv_import.import_products(db, st.session_state.business_id, df)
+                                mark_data_changed(db, products_changed=True)
+                            instrumentation.inc(
+                                "import_rows_total", summary["added"] + summary["updated"], source="csv", table="products"
+                            )
+                            st.session_state.products_import_summary = summary
                             st.session_state.import_step = 2
                             st.session_state.data_mgmt_tab = "Import / Demo"
                             st.rerun()
@@ -1236,6 +1522,21 @@ def show_data_management():
                         st.error(f"Error: {str(e)}")
             
             elif st.session_state.import_step == 2:
+                summary = st.session_state.pop("products_import_summary", None)
+                if summary is not None:
+                    st.success(
+                        f"Products imported: {summary['added']} added, {summary['updated']} updated, "
+                        f"{summary['unchanged']} unchanged. Moving to Sales import..."
+                    )
+                    if summary["skipped"] or summary["duplicates"]:
+                        st.warning(
+                            f"Skipped {summary['skipped']} rows without a name or with a non-numeric price; "
+                            f"{summary['duplicates']} repeated names used their last row."
+                        )
+                    if summary["changes"]:
+                        with st.expander(f"Added and updated products ({len(summary['changes'])})"):
+                            st.dataframe(pd.DataFrame(summary["changes"]), use_container_width=True, hide_index=True)
+                
                 st.markdown("### Step 2: Import Sales")
                 st.warning("Make sure you have imported Products first! Product names must match exactly.")
                 
@@ -1261,36 +1562,39 @@ def show_data_management():
                         st.dataframe(df.head(5), use_container_width=True)
                         
                         if st.button("Import Sales", use_container_width=True, type="primary", key="import_sales_btn"):
-                            import_products = db.query(Product).filter(
-                                Product.business_id == st.session_state.business_id
-                            ).all()
-                            product_map = {p.name.lower(): p for p in import_products}
+                            with instrumentation.timer("import_seconds", source="csv", table="sales"):
+                                catalog = product_catalog.get_catalog(db, st.session_state.business_id, refresh=True)
                             
-                            imported = 0
-                            errors = 0
-                            error_names = []
+                                imported = 0
+                                errors = 0
+                                error_names = []
+                                sale_dates = set()
                             
-                            for _, row in df.iterrows():
-                                product_name = str(row.get('product_name', '')).strip().lower()
-                                if product_name in product_map:
-                                    product = product_map[product_name]
-                                    quantity = int(row.get('quantity', 1))
-                                    sale_date = pd.to_datetime(row.get('sale_date')).date()
+                                for _, row in df.iterrows():
+                                    product_name = str(row.get('product_name', '')).strip().lower()
+                                    product = catalog.by_name(product_name)
+                                    if product is not None:
+                                        quantity = int(row.get('quantity', 1))
+                                        sale_date = pd.to_datetime(row.get('sale_date')).date()
                                     
-                                    sale = Sale(
-                                        product_id=product.id,
-                                        quantity=quantity,
-                                        total_amount=quantity * product.selling_price,
-                                        sale_date=sale_date
-                                    )
-                                    db.add(sale)
-                                    imported += 1
-                                else:
-                                    errors += 1
-                                    if product_name not in error_names:
-                                        error_names.append(product_name)
+                                        sale = Sale(
+                                            product_id=product.id,
+                                            quantity=quantity,
+                                            total_amount_paise=quantity * product.selling_price_paise,
+                                            sale_date=sale_date
+                                        )
+                                        db.add(sale)
+                                        sale_dates.add(sale_date)
+                                        imported += 1
+                                    else:
+                                        errors += 1
+                                        if product_name not in error_names:
+                                            error_names.append(product_name)
                             
-                            db.commit()
+                                db.commit()
+                                post_impacts.update_for_sales(db, st.session_state.business_id, sale_dates)
+                                mark_data_changed(db)
+                            instrumentation.inc("import_rows_total", imported, source="csv", table="sales")
                             if errors > 0:
                                 st.warning(f"Imported {imported} sales. Skipped {errors} (product not found: {', '.join(error_names[:5])})")
                             else:
@@ -1310,7 +1614,7 @@ def show_data_management():
                     <strong>Required Columns:</strong>
                     <table style="width: 100%; margin-top: 8px;">
                         <tr><td><code>post_type</code></td><td>reel, story, or image</td></tr>
-                        <tr><td><code>posted_at</code></td><td>Date in YYYY-MM-DD format</td></tr>
+                        <tr><td><code>posted_at</code></td><td>Date, preferably YYYY-MM-DD (e.g. 10/15/2025 is also read)</td></tr>
                     </table>
                     <strong style="margin-top: 8px; display: block;">Optional Columns:</strong>
                     <table style="width: 100%; margin-top: 8px;">
@@ -1328,6 +1632,18 @@ def show_data_management():
                 st.markdown("**Example CSV:**")
                 st.code("post_type,posted_at,post_time,caption,platform,impressions,likes,comments,shares\nreel,2025-01-10,18:30:00,New menu!,instagram,5000,200,25,15\nstory,2025-01-12,12:00:00,Behind scenes,instagram,2000,150,10,5", language="csv")
                 
+                summary = st.session_state.get("posts_import_summary")
+                if summary is not None:
+                    st.success(f"Imported {summary['imported']} media posts.")
+                    problems = [dict(p, result="skipped") for p in summary["skipped"]]
+                    problems += [dict(p, result="imported") for p in summary["warnings"]]
+                    st.warning(f"{len(summary['skipped'])} rows were skipped and {len(summary['warnings'])} imported with changes:")
+                    st.dataframe(pd.DataFrame(problems).sort_values("line"), use_container_width=True, hide_index=True)
+                    if st.button("Continue to Dashboard", type="primary", key="posts_import_done_btn"):
+                        del st.session_state.posts_import_summary
+                        st.session_state.redirect_to_dashboard = True
+                        st.rerun()
+                
                 posts_file = st.file_uploader("Upload Media Posts CSV", type="csv", key="posts_csv")
                 
                 if posts_file is not None:
@@ -1336,38 +1652,15 @@ def show_data_management():
                         st.dataframe(df.head(5), use_container_width=True)
                         
                         if st.button("Import Media Posts", use_container_width=True, type="primary", key="import_posts_btn"):
-                            from datetime import time as dt_time
-                            imported = 0
-                            for _, row in df.iterrows():
-                                post_type = str(row.get('post_type', 'image')).strip().lower()
-                                if post_type in ['reel', 'story', 'image']:
-                                    posted_at = pd.to_datetime(row.get('posted_at')).date()
-                                    
-                                    post_time = None
-                                    if pd.notna(row.get('post_time')):
-                                        try:
-                                            time_parts = str(row.get('post_time')).split(':')
-                                            post_time = dt_time(int(time_parts[0]), int(time_parts[1]), int(time_parts[2]) if len(time_parts) > 2 else 0)
-                                        except:
-                                            pass
-                                    
-                                    post = MediaPost(
-                                        business_id=st.session_state.business_id,
-                                        post_type=post_type,
-                                        caption=str(row.get('caption', ''))[:500] if pd.notna(row.get('caption')) else '',
-                                        posted_at=posted_at,
-                                        post_time=post_time,
-                                        platform=str(row.get('platform', 'instagram')) if pd.notna(row.get('platform')) else 'instagram',
-                                        impressions=int(row.get('impressions', 0)) if pd.notna(row.get('impressions')) else 0,
-                                        likes=int(row.get('likes', 0)) if pd.notna(row.get('likes')) else 0,
-                                        comments=int(row.get('comments', 0)) if pd.notna(row.get('comments')) else 0,
-                                        shares=int(row.get('shares', 0)) if pd.notna(row.get('shares')) else 0
-                                    )
-                                    db.add(post)
-                                    imported += 1
-                            db.commit()
-                            st.success(f"Successfully imported {imported} media posts! Redirecting to Dashboard...")
-                            st.session_state.redirect_to_dashboard = True
+                            with instrumentation.timer("import_seconds", source="csv", table="media_posts"):
+                                summary = csv_import.import_media_posts(db, st.session_state.business_id, df)
+                                mark_data_changed(db)
+                            instrumentation.inc("import_rows_total", summary["imported"], source="csv", table="media_posts")
+                            if summary["skipped"] or summary["warnings"]:
+                                st.session_state.posts_import_summary = summary
+                            else:
+                                st.success(f"Successfully imported {summary['imported']} media posts! Redirecting to Dashboard...")
+                                st.session_state.redirect_to_dashboard = True
                             st.rerun()
                     except Exception as e:
                         st.error(f"Error: {str(e)}")
@@ -1376,6 +1669,38 @@ def show_data_management():
         db.close()
 
 
+PAGES = {
+    "Dashboard": show_dashboard,
+    "Product Analytics": show_products_analytics,
+    "Best Day": show_best_day,
+    "Trends": show_trends,
+    "Sales Heatmap": show_sales_heatmap,
+    "Media Impact": show_media_impact,
+    "Post Recommendations": show_post_recommendations,
+    "Data Management": show_data_management,
+}
+
+
+def show_profile_report(report):
+    """Admin summary of a profiled page run; the full report is in the file it names"""
+    st.divider()
+    if report is None:
+        st.caption("Profiling skipped: another page is being profiled in this process.")
+        return
+    
+    title = (f"⏱️ Profile: {report['wall_seconds']:.2f}s wall, {report['sql_seconds']:.2f}s SQL "
+             f"({report['sql_queries']} statements), {report['peak_kb'] / 1024:.1f} MB peak allocated")
+    with st.expander(title):
+        st.caption(f"Report written to `{report['path']}`")
+        st.markdown("**Top functions by cumulative time**")
+        st.dataframe(pd.DataFrame(report["top_functions"]), hide_index=True, use_container_width=True)
+        if report["top_sql"]:
+            st.markdown("**Slowest SQL statements**")
+            st.dataframe(pd.DataFrame(report["top_sql"]), hide_index=True, use_container_width=True)
+        st.markdown("**Largest allocations still live at page end**")
+        st.dataframe(pd.DataFrame(report["top_allocations"]), hide_index=True, use_container_width=True)
+
+
 def main():
     if not st.session_state.authenticated:
         show_auth_page()
@@ -1392,7 +1717,7 @@ def main():
             st.markdown(f"**{st.session_state.business_name}**")
             st.divider()
             
-            pages = ["Dashboard", "Product Analytics", "Best Day", "Trends", "Media Impact", "Post Recommendations", "Data Management"]
+            pages = list(PAGES)
             current_index = pages.index(st.session_state.current_page) if st.session_state.current_page in pages else 0
             
             page = st.radio(
@@ -1411,23 +1736,26 @@ def main():
                 st.session_state.authenticated = False
                 st.session_state.business_id = None
                 st.session_state.business_name = None
+                st.session_state.is_admin = False
                 st.rerun()
         
-        if page == "Dashboard":
-            show_dashboard()
-        elif page == "Product Analytics":
-            show_products_analytics()
-        elif page == "Best Day":
-            show_best_day()
-        elif page == "Trends":
-            show_trends()
-        elif page == "Media Impact":
-            show_media_impact()
-        elif page == "Post Recommendations":
-            show_post_recommendations()
-        elif page == "Data Management":
-            show_data_management()
+        # One version check per render drops a columnar snapshot that another process's writes made stale
+        data_version = get_scoped_session().query(Business.data_version).filter(
+            Business.id == st.session_state.business_id
+        ).scalar() or 0
+        columnar_store.sync_version(st.session_state.business_id, data_version)
+        
+        show_page = PAGES[page]
+        instrumentation.inc("page_renders_total", page=page)
+        with instrumentation.timer("page_render_seconds", page=page):
+            if st.session_state.is_admin and (profiling.PROFILE_PAGES or st.query_params.get("profile") == "1"):
+                show_profile_report(profiling.profile_page(page, show_page, st.session_state.business_id))
+            else:
+                show_page()
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        remove_scoped_session()
@@ -1,7 +1,11 @@
+import os
 import bcrypt
 from sqlalchemy.orm import Session
 from models import Business
 
+# Businesses whose owners get admin tools such as page profiling
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip()}
+
 
 def hash_password(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
@@ -35,3 +39,7 @@ def authenticate_business(db: Session, email: str, password: str) -> Business:
 
 def get_business_by_email(db: Session, email: str) -> Business:
     return db.query(Business).filter(Business.email == email).first()
+
+
+def is_admin(business: Business) -> bool:
+    return business is not None and (business.email or "").lower() in ADMIN_EMAILS
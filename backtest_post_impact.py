@@ -0,0 +1,246 @@
+"""Rolling-origin backtest of the post impact revenue model.
+
+Builds the get_sales_features() daily frame for a business and cuts
+expanding-window folds: train on every day before the origin, then test on
+the next --horizon days. The origin moves forward --step days at a time.
+Each candidate model is evaluated on every fold in parallel with joblib.
+Fold matrices are cached on disk with joblib.Memory, so re-runs and new
+candidates reuse them. The report gives MAE, fit/predict time and tree
+count per model. It also shows the MAE of the shuffled train_test_split
+protocol that train_post_impact_model used before holding out the most
+recent days.
+
+By default a synthetic business with --days of history is generated in a
+temporary SQLite database:
+
+    python backtest_post_impact.py --days 540 --jobs 4
+    DATABASE_URL=... python backtest_post_impact.py --business-id 1
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, time as dt_time
+from typing import Any, Dict, List
+
+import numpy as np
+
+CANDIDATES = ["seasonal_naive", "gbr", "hgb"]
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "post_impact_backtest_cache")
+
+
+def generate_synthetic_history(db, business_id: int, days: int, seed: int = 7):
+    """Products, daily sales with weekly seasonality and trend, and posts that lift the next 3 days"""
+    from sqlalchemy import insert
+    from models import Product, Sale, MediaPost
+
+    rng = random.Random(seed)
+    prices = [299, 349, 75, 99, 99, 499, 299, 399, 49, 449, 79, 149]
+    product_ids = db.scalars(insert(Product).returning(Product.id, sort_by_parameter_order=True), [
+        {"business_id": business_id, "name": f"Product {i + 1}", "cost_price_paise": price * 50,
+         "selling_price_paise": price * 100, "category": "General"}
+        for i, price in enumerate(prices)
+    ]).all()
+
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=days - 1)
+    weekday_factor = [0.85, 0.8, 0.9, 0.95, 1.15, 1.35, 1.25]
+    type_lift = {"reel": 0.35, "story": 0.12, "image": 0.2}
+
+    lift_by_day = {}
+    posts = []
+    day = start_date
+    while day <= end_date:
+        if rng.random() < 0.18:
+            post_type = rng.choice(list(type_lift))
+            hour = rng.choice([9, 12, 18, 19, 20])
+            evening = 1.2 if hour >= 17 else 1.0
+            for offset, decay in enumerate([1.0, 0.6, 0.3]):
+                target = day + timedelta(days=offset)
+                lift_by_day[target] = lift_by_day.get(target, 0) + type_lift[post_type] * decay * evening
+            posts.append({
+                "business_id": business_id, "post_type": post_type, "caption": f"{post_type} post",
+                "posted_at": day, "post_time": dt_time(hour, 0), "platform": "instagram",
+                "impressions": rng.randint(500, 5000), "likes": rng.randint(20, 400),
+                "comments": rng.randint(0, 60), "shares": rng.randint(0, 40)
+            })
+        day += timedelta(days=1)
+
+    sales = []
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        trend = 1 + 0.4 * offset / days
+        expected_orders = 18 * weekday_factor[day.weekday()] * trend * (1 + lift_by_day.get(day, 0))
+        for _ in range(np.random.default_rng(seed + offset).poisson(expected_orders)):
+            idx = rng.randrange(len(product_ids))
+            quantity = rng.randint(1, 3)
+            sales.append({
+                "product_id": product_ids[idx], "quantity": quantity,
+                "total_amount_paise": quantity * prices[idx] * 100, "sale_date": day,
+                "sale_time": dt_time(rng.randint(8, 21), rng.choice([0, 15, 30, 45]))
+            })
+
+    if posts:
+        db.execute(insert(MediaPost), posts)
+    db.execute(insert(Sale), sales)
+    db.commit()
+
+
+def rolling_origin_folds(n_rows: int, initial: int, horizon: int, step: int) -> List[tuple]:
+    """(train_end, test_end) row bounds; each fold trains on [0, train_end) and tests on [train_end, test_end)"""
+    folds = []
+    origin = initial
+    while origin + horizon <= n_rows:
+        folds.append((origin, origin + horizon))
+        origin += step
+    return folds
+
+
+def build_fold_matrices(df, columns: List[str], initial: int, horizon: int, step: int) -> List[Dict[str, Any]]:
+    """Feature and target arrays for every fold; cached by joblib.Memory on the frame's content"""
+    X = df[columns].to_numpy(dtype=np.float64)
+    y = df["revenue"].to_numpy(dtype=np.float64)
+    # Same weekday last week, for the seasonal-naive baseline
+    y_last_week = np.concatenate([np.full(7, np.nan), y[:-7]])
+
+    folds = []
+    for train_end, test_end in rolling_origin_folds(len(df), initial, horizon, step):
+        folds.append({
+            "origin": str(df["date"].iloc[train_end]),
+            "columns": columns,
+            "X_train": X[:train_end], "y_train": y[:train_end],
+            "X_test": X[train_end:test_end], "y_test": y[train_end:test_end],
+            "naive": y_last_week[train_end:test_end]
+        })
+    return folds
+
+
+def _frame(fold: Dict[str, Any], part: str, features: List[str]):
+    import pandas as pd
+
+    idx = [fold["columns"].index(col) for col in features]
+    return pd.DataFrame(fold[part][:, idx], columns=features)
+
+
+def evaluate_fold(name: str, fold: Dict[str, Any]) -> Dict[str, Any]:
+    """Fit on the fold's past and score the next days with the same estimator setup as training"""
+    import pandas as pd
+    from ml_engine import ESTIMATOR_FEATURES, fit_post_impact_estimator
+
+    started = time.perf_counter()
+    if name == "seasonal_naive":
+        fit_seconds = 0.0
+        pred = np.where(np.isnan(fold["naive"]), fold["y_train"][-7:].mean(), fold["naive"])
+        iterations = 0
+    else:
+        features = ESTIMATOR_FEATURES[name]
+        model = fit_post_impact_estimator(name, _frame(fold, "X_train", features), pd.Series(fold["y_train"]))
+        fit_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        pred = model.predict(_frame(fold, "X_test", features))
+        iterations = int(getattr(model, "n_iter_", getattr(model, "n_estimators_", 0)))
+    predict_seconds = time.perf_counter() - started
+    return {
+        "model": name,
+        "origin": fold["origin"],
+        "mae": float(np.mean(np.abs(fold["y_test"] - pred))),
+        "fit_seconds": fit_seconds,
+        "predict_seconds": predict_seconds,
+        "iterations": iterations
+    }
+
+
+def shuffled_split_mae(df, features: List[str]) -> float:
+    """MAE of the old train_post_impact_model protocol: GBR on a shuffled 80/20 split"""
+    from sklearn.model_selection import train_test_split
+    from ml_engine import fit_post_impact_estimator
+
+    X_train, X_test, y_train, y_test = train_test_split(df[features], df["revenue"], test_size=0.2, random_state=42)
+    model = fit_post_impact_estimator("gbr", X_train, y_train)
+    return float(np.mean(np.abs(y_test - model.predict(X_test))))
+
+
+def run_backtest(df, columns: List[str], models: List[str], initial: int, horizon: int, step: int,
+                 jobs: int, cache_dir: str) -> Dict[str, Any]:
+    from joblib import Memory, Parallel, delayed
+
+    memory = Memory(cache_dir, verbose=0)
+    started = time.perf_counter()
+    folds = memory.cache(build_fold_matrices)(df, columns, initial, horizon, step)
+    feature_seconds = time.perf_counter() - started
+    if not folds:
+        raise SystemExit(f"Only {len(df)} days of data: not enough for one fold with --initial-days {initial}")
+
+    started = time.perf_counter()
+    rows = Parallel(n_jobs=jobs)(delayed(evaluate_fold)(name, fold) for name in models for fold in folds)
+    wall_seconds = time.perf_counter() - started
+
+    summary = {}
+    for name in models:
+        results = [r for r in rows if r["model"] == name]
+        maes = np.array([r["mae"] for r in results])
+        summary[name] = {
+            "folds": len(results),
+            "mae": float(maes.mean()),
+            "mae_std": float(maes.std()),
+            "fit_ms": 1000 * float(np.mean([r["fit_seconds"] for r in results])),
+            "predict_ms": 1000 * float(np.mean([r["predict_seconds"] for r in results])),
+            "iterations": float(np.mean([r["iterations"] for r in results]))
+        }
+    return {"summary": summary, "folds": rows, "feature_seconds": feature_seconds, "wall_seconds": wall_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--business-id", type=int, help="backtest this business instead of synthetic data")
+    parser.add_argument("--days", type=int, default=540, help="history length of the synthetic business")
+    parser.add_argument("--initial-days", type=int, default=90, help="training days before the first origin")
+    parser.add_argument("--horizon", type=int, default=7, help="days scored per fold")
+    parser.add_argument("--step", type=int, default=7, help="days the origin advances per fold")
+    parser.add_argument("--models", default=",".join(CANDIDATES))
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel workers (joblib n_jobs)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    tmp = None
+    if args.business_id is None:
+        tmp = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/backtest.db"
+
+    from models import init_db, SessionLocal, Business
+    from ml_engine import get_sales_features, ESTIMATOR_FEATURES, POST_IMPACT_FEATURES
+
+    init_db()
+    db = SessionLocal()
+    business_id = args.business_id
+    if business_id is None:
+        business = Business(name="Backtest", owner_name="Backtest", email="backtest@example.com", password_hash="-")
+        db.add(business)
+        db.commit()
+        business_id = business.id
+        generate_synthetic_history(db, business_id, args.days)
+
+    df = get_sales_features(db, business_id)
+    db.close()
+    columns = sorted({col for features in ESTIMATOR_FEATURES.values() for col in features})
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+
+    result = run_backtest(df, columns, models, args.initial_days, args.horizon, args.step, args.jobs, args.cache_dir)
+
+    print(f"{len(df)} days, {result['summary'][models[0]]['folds']} folds of {args.horizon} days "
+          f"(features {result['feature_seconds']:.2f}s, folds {result['wall_seconds']:.2f}s wall)")
+    print(f"{'model':<16}{'MAE':>12}{'± std':>10}{'fit ms':>10}{'predict ms':>12}{'trees':>8}")
+    for name, stats in sorted(result["summary"].items(), key=lambda item: item[1]["mae"]):
+        print(f"{name:<16}{stats['mae']:>12.1f}{stats['mae_std']:>10.1f}{stats['fit_ms']:>10.1f}"
+              f"{stats['predict_ms']:>12.2f}{stats['iterations']:>8.0f}")
+    print(f"{'gbr (shuffled)':<16}{shuffled_split_mae(df, POST_IMPACT_FEATURES):>12.1f}   <- old train_test_split protocol, leaks future days")
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,151 @@
+"""Analytics engine benchmark: SQLAlchemy vs DuckDB on synthetic sales.
+
+Loads --sales synthetic sales (default 10M) for one business into a
+temporary SQLite database. It then times the analytics behind the Trends,
+Best Day, Product Analytics and revenue timeline views in one subprocess
+per engine:
+
+- ``sqlalchemy``: the default path (column-only scans and SQL GROUP BY)
+- ``parquet``: DuckDB over the business's Parquet mirror, whose write time
+  is reported separately
+- ``attach``: DuckDB over the SQLite file itself; skipped when the sqlite
+  extension cannot be loaded (it is downloaded on first use)
+
+    python bench_duckdb.py --sales 10000000 --repeat 3
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BENCH_FUNCTIONS = [
+    "get_weekly_trends",
+    "get_monthly_trends",
+    "get_best_day_of_week",
+    "get_best_selling_products",
+    "get_low_performing_products",
+    "get_revenue_with_posts_timeline",
+]
+
+
+def generate_sales(db_path: str, sales: int, products: int, days: int, chunk: int = 200_000):
+    """One business with ``products`` products and ``sales`` sales spread over ``days`` days"""
+    import numpy as np
+    from models import init_db
+
+    init_db()
+    rng = np.random.default_rng(7)
+    con = sqlite3.connect(db_path)
+    con.execute(
+        "INSERT INTO businesses (name, owner_name, email, password_hash, data_version) "
+        "VALUES ('Bench', 'Bench', 'bench@example.com', '-', 0)"
+    )
+    business_id = con.execute("SELECT last_insert_rowid()").fetchone()[0]
+    prices = rng.integers(20, 500, products) * 100  # paise
+    con.executemany(
+        "INSERT INTO products (business_id, name, name_key, cost_price_paise, selling_price_paise, category) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(business_id, f"Product {i + 1}", f"product {i + 1}", int(prices[i]) * 55 // 100, int(prices[i]),
+          f"Category {i % 8}")
+         for i in range(products)]
+    )
+    first_id = con.execute("SELECT MIN(id) FROM products WHERE business_id = ?", (business_id,)).fetchone()[0]
+
+    start = date.today() - timedelta(days=days - 1)
+    day_strings = [(start + timedelta(days=d)).isoformat() for d in range(days)]
+    for offset in range(0, sales, chunk):
+        n = min(chunk, sales - offset)
+        product = rng.integers(0, products, n)
+        quantity = rng.integers(1, 4, n)
+        day = rng.integers(0, days, n)
+        minute = rng.integers(8 * 60, 22 * 60, n)
+        con.executemany(
+            "INSERT INTO sales (product_id, quantity, total_amount_paise, sale_date, sale_time) VALUES (?, ?, ?, ?, ?)",
+            [(int(first_id + p), int(q), int(q * prices[p]), day_strings[d], f"{m // 60:02d}:{m % 60:02d}:00.000000")
+             for p, q, d, m in zip(product, quantity, day, minute)]
+        )
+        con.commit()
+    con.close()
+    return business_id
+
+
+def run_worker(engine: str, business_id: int, repeat: int) -> dict:
+    import analytics
+    import duckdb_engine
+    from models import SessionLocal
+
+    db = SessionLocal()
+    result = {}
+    if engine != "sqlalchemy":
+        if duckdb_engine.get_engine() is None:
+            return {"skipped": True}
+        if engine == "parquet":
+            started = time.perf_counter()
+            duckdb_engine.refresh_mirror(db, business_id)
+            result["mirror_write_s"] = round(time.perf_counter() - started, 2)
+
+    for name in BENCH_FUNCTIONS:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            getattr(analytics, name)(db, business_id)
+            timings.append(time.perf_counter() - started)
+        result[name] = round(min(timings), 3)
+    db.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sales", type=int, default=10_000_000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per function; the fastest is reported")
+    parser.add_argument("--engines", default="sqlalchemy,parquet,attach")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--business-id", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.business_id, args.repeat)))
+        return
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", DUCKDB_MIRROR_DIR=os.path.join(tmp, "mirror"))
+        os.environ.update(env)
+
+        started = time.perf_counter()
+        business_id = generate_sales(db_path, args.sales, args.products, args.days)
+        print(f"{args.sales:,} sales, {args.products} products, {args.days} days "
+              f"(generated in {time.perf_counter() - started:.0f}s)")
+
+        results = {}
+        for engine in engines:
+            worker_env = dict(env, DUCKDB_ANALYTICS="" if engine == "sqlalchemy" else engine)
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", engine,
+                 "--business-id", str(business_id), "--repeat", str(args.repeat)],
+                env=worker_env, capture_output=True, text=True, check=True, cwd=tmp
+            )
+            results[engine] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    ran = [e for e in engines if not results[e].get("skipped")]
+    for engine in engines:
+        if results[engine].get("skipped"):
+            print(f"{engine}: skipped (DuckDB engine unavailable)")
+    print(f"{'seconds':<34}" + "".join(f"{e:>12}" for e in ran))
+    for key in ["mirror_write_s"] + BENCH_FUNCTIONS:
+        if any(key in results[e] for e in ran):
+            print(f"{key:<34}" + "".join(f"{results[e].get(key, '-'):>12}" for e in ran))
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
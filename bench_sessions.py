@@ -0,0 +1,255 @@
+"""Load test: concurrent owner sessions of app.py driven by Streamlit's AppTest.
+
+Seeds --tenants businesses with demo data, then runs --sessions simulated
+owners in one process, the way one Streamlit server hosts its sessions.
+Each session is an ``AppTest`` of app.py in its own thread. It logs in as a
+tenant (round robin) and walks SESSION_STEPS until --duration is up:
+Dashboard, Media Impact, Post Recommendations, then a sales CSV import of
+--import-rows rows on Data Management.
+
+Every ``AppTest.run()`` is one timed step. Each concurrency level runs in
+its own subprocess against its own temporary SQLite database, or against
+--database-url (e.g. a local Postgres), where the seeded tenants are reused.
+The report gives step throughput, latency percentiles per step, and DB
+contention from ``instrumentation``: pool checkout wait, SQL statements and
+time, and errors mentioning locks or pool timeouts.
+
+    python bench_sessions.py --sessions 1,4,8,16 --duration 60
+    python bench_sessions.py --sessions 8 --database-url postgresql://localhost/bench
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+SESSION_STEPS = ["Dashboard", "Media Impact", "Post Recommendations", "import"]
+TENANT_PASSWORD = "loadtest123"
+CONTENTION_ERRORS = ("locked", "QueuePool limit", "timed out")
+
+
+def tenant_email(i: int) -> str:
+    return f"loadtest{i}@example.com"
+
+
+def seed_tenants(tenants: int) -> dict:
+    """Email -> product names for ``tenants`` demo businesses, creating the missing ones"""
+    from auth import create_business, get_business_by_email
+    from demo_data import generate_demo_data
+    from models import init_db, SessionLocal, Product
+
+    init_db()
+    db = SessionLocal()
+    try:
+        catalog = {}
+        for i in range(tenants):
+            business = get_business_by_email(db, tenant_email(i))
+            if business is None:
+                business = create_business(db, f"Load Test {i}", "Load Test", tenant_email(i), TENANT_PASSWORD)
+                generate_demo_data(db, business.id)
+            catalog[tenant_email(i)] = [
+                name for (name,) in db.query(Product.name).filter(Product.business_id == business.id)
+            ]
+        return catalog
+    finally:
+        db.close()
+
+
+def sales_csv(product_names: list, rows: int, rng: random.Random) -> bytes:
+    lines = ["product_name,quantity,sale_date"]
+    for _ in range(rows):
+        day = date.today() - timedelta(days=rng.randrange(30))
+        lines.append(f"{rng.choice(product_names)},{rng.randint(1, 5)},{day.isoformat()}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class Session:
+    """One simulated owner: an AppTest of app.py plus its step timings."""
+
+    def __init__(self, app_path: str, email: str, product_names: list, import_rows: int, timeout: float,
+                 seed: int):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(app_path, default_timeout=timeout)
+        self.email = email
+        self.product_names = product_names
+        self.import_rows = import_rows
+        self.rng = random.Random(seed)
+        self.timings = []  # (step, seconds)
+        self.errors = []  # (step, message)
+        self.sequences = 0
+
+    def _run(self, step: str):
+        started = time.perf_counter()
+        try:
+            self.at.run()
+        except Exception as e:
+            self.errors.append((step, repr(e)))
+            return
+        self.timings.append((step, time.perf_counter() - started))
+        for element in list(self.at.exception) + list(self.at.error):
+            self.errors.append((step, str(getattr(element, "message", None) or element.value)))
+
+    def login(self):
+        self.at.run()
+        self.at.text_input(key="login_email").input(self.email)
+        self.at.text_input(key="login_password").input(TENANT_PASSWORD)
+        self.at.button[0].click()
+        self._run("login")
+        if not self.at.session_state["authenticated"]:
+            raise RuntimeError(f"Login failed for {self.email}")
+
+    def open_page(self, page: str):
+        self.at.sidebar.radio[0].set_value(page)
+        self._run(page)
+
+    def import_sales(self):
+        self.at.session_state["data_mgmt_tab"] = "Import / Demo"
+        self.at.session_state["import_step"] = 2
+        self.open_page("Data Management")
+        self.at.file_uploader(key="sales_csv").set_value(
+            ("sales.csv", sales_csv(self.product_names, self.import_rows, self.rng), "text/csv")
+        )
+        self._run("import upload")
+        self.at.button(key="import_sales_btn").click()
+        self._run("import")
+
+    def walk(self, stop: threading.Event, think_seconds: float):
+        while not stop.is_set():
+            for step in SESSION_STEPS:
+                if stop.is_set():
+                    return
+                if step == "import":
+                    self.import_sales()
+                else:
+                    self.open_page(step)
+                if think_seconds:
+                    time.sleep(self.rng.uniform(0, 2 * think_seconds))
+            self.sequences += 1
+
+
+def _percentiles(values: list) -> dict:
+    import numpy as np
+
+    ms = np.array(values) * 1000 if values else np.zeros(1)
+    return {f"p{q}_ms": round(float(np.percentile(ms, q)), 1) for q in (50, 95, 99)}
+
+
+def _delta(before: dict, after: dict, kind: str, name: str) -> dict:
+    """count/sum/max of one observation or counter summed over its labels, between two snapshots"""
+    total = {"count": 0, "sum": 0.0, "max": 0.0}
+    for key, value in after[kind].items():
+        if key[0] != name:
+            continue
+        if kind == "counters":
+            total["count"] += value - before[kind].get(key, 0)
+            continue
+        previous = before[kind].get(key, {"count": 0, "sum": 0.0})
+        total["count"] += value["count"] - previous["count"]
+        total["sum"] += value["sum"] - previous["sum"]
+        total["max"] = max(total["max"], value["max"])
+    return total
+
+
+def run_worker(sessions: int, tenants: int, duration: float, import_rows: int, think_ms: int,
+               timeout: float) -> dict:
+    import instrumentation
+
+    catalog = seed_tenants(tenants)
+    emails = sorted(catalog)
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    users = [
+        Session(app_path, emails[i % len(emails)], catalog[emails[i % len(emails)]], import_rows, timeout, seed=i)
+        for i in range(sessions)
+    ]
+    for user in users:
+        user.login()
+
+    stop = threading.Event()
+    before = instrumentation.snapshot()
+    threads = [threading.Thread(target=user.walk, args=(stop, think_ms / 1000), daemon=True) for user in users]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    after = instrumentation.snapshot()
+
+    timings = [timing for user in users for timing in user.timings]
+    errors = [error for user in users for error in user.errors]
+    pool_wait = _delta(before, after, "observations", "db_pool_wait_seconds")
+    sql = _delta(before, after, "observations", "sql_query_seconds")
+    result = {
+        "steps": len(timings),
+        "steps_per_sec": round(len(timings) / elapsed, 2),
+        "sequences": sum(user.sequences for user in users),
+        **{f"all_{k}": v for k, v in _percentiles([s for _, s in timings]).items()},
+    }
+    for step in SESSION_STEPS:
+        result.update({f"{step}_{k}": v for k, v in _percentiles([s for name, s in timings if name == step]).items()})
+    result.update({
+        "pool_wait_mean_ms": round(pool_wait["sum"] / pool_wait["count"] * 1000, 2) if pool_wait["count"] else 0,
+        "pool_wait_max_ms": round(pool_wait["max"] * 1000, 1),
+        "sql_statements_per_sec": round(sql["count"] / elapsed, 1),
+        "sql_seconds_per_step": round(sql["sum"] / len(timings), 4) if timings else 0,
+        "contention_errors": sum(1 for _, message in errors if any(e in message for e in CONTENTION_ERRORS)),
+        "other_errors": sum(1 for _, message in errors if not any(e in message for e in CONTENTION_ERRORS)),
+    })
+    result["error_samples"] = [f"{step}: {message[:200]}" for step, message in errors[:5]]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,4,8", help="comma-separated concurrency levels")
+    parser.add_argument("--tenants", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30, help="seconds per concurrency level")
+    parser.add_argument("--import-rows", type=int, default=50, help="rows per sales CSV import")
+    parser.add_argument("--think-ms", type=int, default=0, help="mean pause between steps")
+    parser.add_argument("--timeout", type=float, default=120, help="AppTest timeout per step")
+    parser.add_argument("--database-url", help="use this database instead of a temporary SQLite file")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.tenants, args.duration, args.import_rows, args.think_ms,
+                                    args.timeout)))
+        return
+
+    levels = [int(n) for n in args.sessions.split(",") if n.strip()]
+    results = {}
+    for sessions in levels:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=args.database_url or f"sqlite:///{tmp}/bench.db")
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", str(sessions),
+                 "--tenants", str(args.tenants), "--duration", str(args.duration),
+                 "--import-rows", str(args.import_rows), "--think-ms", str(args.think_ms),
+                 "--timeout", str(args.timeout)],
+                env=env, capture_output=True, text=True, cwd=tmp
+            )
+            if out.returncode != 0:
+                sys.exit(f"{sessions} sessions failed:\n{out.stderr[-2000:]}")
+            results[sessions] = json.loads(out.stdout.strip().splitlines()[-1])
+            for sample in results[sessions].pop("error_samples"):
+                print(f"{sessions} sessions: {sample}", file=sys.stderr)
+
+    database = "database-url" if args.database_url else "temporary SQLite"
+    print(f"{args.tenants} tenants on {database}, {args.duration:.0f}s per level, "
+          f"{args.import_rows}-row imports, think {args.think_ms}ms")
+    print(f"{'sessions':<34}" + "".join(f"{n:>10}" for n in levels))
+    for key in results[levels[0]]:
+        print(f"{key:<34}" + "".join(f"{results[n][key]:>10}" for n in levels))
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
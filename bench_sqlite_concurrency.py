@@ -0,0 +1,148 @@
+"""Concurrency benchmark: N dashboard readers against 1 CSV-style importer on SQLite.
+
+Runs the same workload with the default engine and with SQLITE_TUNING=1
+(WAL, pragmas, read-only reader pool, single writer) and prints read
+throughput, read latency percentiles, import throughput and lock errors.
+
+    python bench_sqlite_concurrency.py --readers 8 --duration 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+
+def run_worker(readers: int, duration: float, batch_size: int) -> dict:
+    import numpy as np
+    from models import init_db, SessionLocal, Sale, Product
+    from auth import create_business
+    from demo_data import generate_demo_data
+    from analytics import get_dashboard_stats, get_weekly_trends, get_best_day_of_week
+
+    init_db()
+    db = SessionLocal()
+    business = create_business(db, "Bench", "Bench", "bench@example.com", "bench123")
+    generate_demo_data(db, business.id)
+    business_id = business.id
+    products = db.query(Product).filter(Product.business_id == business_id).all()
+    product_ids = [p.id for p in products]
+    start_date = db.query(Sale.sale_date).order_by(Sale.sale_date).first()[0]
+
+    # A transaction must see its own uncommitted rows, even with a separate reader pool
+    committed = db.query(Sale).count()
+    db.add(Sale(product_id=product_ids[0], quantity=1, total_amount_paise=1000, sale_date=start_date))
+    db.flush()
+    reads_own_writes = db.query(Sale).count() == committed + 1
+    db.rollback()
+    db.close()
+
+    stop = threading.Event()
+    latencies = []
+    errors = {"read": 0, "write": 0}
+    imported = [0]
+    lock = threading.Lock()
+
+    def reader():
+        session = SessionLocal()
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                get_dashboard_stats(session, business_id)
+                get_weekly_trends(session, business_id)
+                get_best_day_of_week(session, business_id)
+                session.rollback()
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                session.rollback()
+                if "locked" in str(e):
+                    with lock:
+                        errors["read"] += 1
+                else:
+                    raise
+        session.close()
+
+    def importer():
+        session = SessionLocal()
+        day = 0
+        while not stop.is_set():
+            try:
+                for i in range(batch_size):
+                    session.add(Sale(
+                        product_id=product_ids[i % len(product_ids)],
+                        quantity=1,
+                        total_amount_paise=1000,
+                        sale_date=start_date + timedelta(days=day % 90)
+                    ))
+                session.commit()
+                imported[0] += batch_size
+                day += 1
+            except Exception as e:
+                session.rollback()
+                if "locked" in str(e):
+                    errors["write"] += 1
+                else:
+                    raise
+        session.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads.append(threading.Thread(target=importer))
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    lat = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "reads": len(latencies),
+        "reads_per_sec": round(len(latencies) / duration, 1),
+        "read_p50_ms": round(float(np.percentile(lat, 50)), 1),
+        "read_p95_ms": round(float(np.percentile(lat, 95)), 1),
+        "read_p99_ms": round(float(np.percentile(lat, 99)), 1),
+        "imported_rows_per_sec": round(imported[0] / duration, 1),
+        "read_lock_errors": errors["read"],
+        "write_lock_errors": errors["write"],
+        "reads_own_writes": reads_own_writes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.readers, args.duration, args.batch_size)))
+        return
+
+    results = {}
+    for mode, tuning in [("default", "0"), ("tuned", "1")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/bench.db", SQLITE_TUNING=tuning)
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker", "--readers", str(args.readers),
+                 "--duration", str(args.duration), "--batch-size", str(args.batch_size)],
+                env=env, capture_output=True, text=True, check=True, cwd=tmp
+            )
+            results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"{args.readers} readers + 1 importer, {args.duration:.0f}s per mode")
+    keys = list(results["default"].keys())
+    print(f"{'metric':<24}{'default':>12}{'tuned':>12}")
+    for key in keys:
+        print(f"{key:<24}{str(results['default'][key]):>12}{str(results['tuned'][key]):>12}")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
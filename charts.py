@@ -0,0 +1,136 @@
+"""Chart preparation helpers that keep Plotly payloads small for long time series."""
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+instrumentation.set_buckets("chart_payload_bytes", (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000))
+
+LINE_POINT_BUDGET = int(os.environ.get("CHART_POINT_BUDGET", "2000"))
+WEBGL_THRESHOLD = int(os.environ.get("CHART_WEBGL_THRESHOLD", "1000"))
+MAX_POST_MARKERS = int(os.environ.get("CHART_MAX_POST_MARKERS", "60"))
+
+POST_MARKER_COLORS = {"reel": "#ff6b6b", "story": "#feca57", "image": "#10b981"}
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-triangle-three-buckets: indices of ``threshold`` points that preserve the shape of (x, y)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    bucket_edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = 0
+    for i in range(threshold - 2):
+        start, end = bucket_edges[i], bucket_edges[i + 1]
+        next_start = end
+        next_end = bucket_edges[i + 2] if i + 2 < len(bucket_edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(np.argmax(area))
+        indices[i + 1] = selected
+
+    return indices
+
+
+def _numeric_axis(values: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy()
+    try:
+        return pd.to_datetime(values).to_numpy().astype("datetime64[s]").astype(np.int64)
+    except (ValueError, TypeError):
+        return np.arange(len(values))
+
+
+def downsample(df: pd.DataFrame, x: str, y: str, max_points: int = LINE_POINT_BUDGET) -> pd.DataFrame:
+    """Reduce a line series to at most ``max_points`` rows with LTTB; shorter series are returned as-is"""
+    if len(df) <= max_points:
+        return df
+    keep = lttb_indices(_numeric_axis(df[x]), df[y].to_numpy(), max_points)
+    return df.iloc[keep]
+
+
+def line_figure(df: pd.DataFrame, x: str, y: str, title: str = None, markers: bool = False,
+                max_points: int = LINE_POINT_BUDGET) -> go.Figure:
+    """Downsampled line chart that switches to WebGL rendering for large series"""
+    df = downsample(df, x, y, max_points)
+    trace_cls = go.Scattergl if len(df) > WEBGL_THRESHOLD else go.Scatter
+    fig = go.Figure(trace_cls(x=df[x], y=df[y], mode="lines+markers" if markers else "lines", name=y))
+    fig.update_layout(title=title)
+    return fig
+
+
+def cluster_post_markers(markers: List[Dict[str, Any]], max_markers: int = MAX_POST_MARKERS) -> List[Dict[str, Any]]:
+    """Merge post markers into at most ``max_markers`` date bins, keeping each bin's dominant post type"""
+    if len(markers) <= max_markers:
+        return [dict(m, count=1) for m in markers]
+
+    dates = pd.to_datetime(pd.Series([m["date"] for m in markers]))
+    bins = pd.cut(dates.astype("int64"), bins=max_markers, labels=False)
+
+    clusters = []
+    for _, idx in pd.Series(range(len(markers))).groupby(bins.to_numpy()):
+        members = [markers[i] for i in idx]
+        types = pd.Series([m["type"] for m in members])
+        clusters.append({
+            "date": min(m["date"] for m in members),
+            "type": types.mode().iloc[0],
+            "caption": f"{len(members)} posts",
+            "count": len(members)
+        })
+    return clusters
+
+
+def add_post_markers(fig: go.Figure, markers: List[Dict[str, Any]], max_markers: int = MAX_POST_MARKERS) -> go.Figure:
+    """Draw (clustered) post markers as dashed vertical lines"""
+    for marker in cluster_post_markers(markers, max_markers):
+        marker_date = pd.to_datetime(marker["date"])
+        fig.add_shape(
+            type="line",
+            x0=marker_date, x1=marker_date,
+            y0=0, y1=1,
+            yref="paper",
+            line=dict(
+                color=POST_MARKER_COLORS.get(marker["type"], "#feca57"),
+                width=1 if marker["count"] == 1 else 2,
+                dash="dash"
+            )
+        )
+    return fig
+
+
+def payload_bytes(fig: go.Figure) -> int:
+    """Size of the figure as serialized for the browser"""
+    return len(fig.to_json().encode("utf-8"))
+
+
+def report_payload(name: str, fig: go.Figure, force: bool = False) -> Optional[int]:
+    """Record the figure's payload size in the ``chart_payload_bytes`` histogram.
+
+    Serializing a figure costs about as much as rendering it, so this is a
+    no-op unless ``force`` is set (a profiled page) or this module logs at DEBUG.
+    """
+    if not force and not logger.isEnabledFor(logging.DEBUG):
+        return None
+    size = payload_bytes(fig)
+    instrumentation.observe("chart_payload_bytes", size, chart=name)
+    logger.debug("chart %s payload %d bytes", name, size)
+    return size
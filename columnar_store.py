@@ -0,0 +1,432 @@
+"""Optional in-process columnar cache of each active business's data.
+
+When ``COLUMNAR_STORE=1`` the sales and posts of a business are loaded once
+into NumPy arrays and the analytics functions read from them instead of the
+database, so a warm tenant is served without SQL. Tenants are evicted
+least-recently-used under a global memory budget and reloaded after
+``COLUMNAR_STORE_RELOAD_SECONDS``.
+
+Writes in this process keep snapshots current through the write-through
+functions below. Writes by other processes are caught by ``sync_version``,
+which the app calls once per page render and the API once per request with
+the business's ``data_version`` they already read. Callers that never sync,
+such as background jobs, can see another process's writes up to
+``COLUMNAR_STORE_RELOAD_SECONDS`` late.
+
+Snapshots are copy-on-write: writes build a new ``TenantData`` that shares
+the unchanged columns and swap it in as one reference, so a reader holding
+a snapshot never sees a half-applied append.
+
+Money arrays hold integer paise and every revenue and profit total is
+returned in paise; callers convert to rupees for display.
+"""
+import copy
+import os
+import threading
+import time as time_module
+from collections import OrderedDict, namedtuple
+from datetime import date, time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import instrumentation
+from models import Business, Product, Sale, MediaPost
+
+ENABLED = os.environ.get("COLUMNAR_STORE", "0") == "1"
+MEMORY_BUDGET_BYTES = int(os.environ.get("COLUMNAR_STORE_BUDGET_MB", "256")) * 1024 * 1024
+RELOAD_SECONDS = int(os.environ.get("COLUMNAR_STORE_RELOAD_SECONDS", "900"))
+
+# Rough per-row overhead of the Python strings kept for products and posts
+_STRING_ROW_BYTES = 200
+
+ProductRecord = namedtuple("ProductRecord", ["id", "name", "category", "cost_price_paise", "selling_price_paise"])
+PostRecord = namedtuple("PostRecord", [
+    "id", "post_type", "caption", "posted_at", "post_time", "platform",
+    "impressions", "likes", "comments", "shares"
+])
+
+
+def _to_ordinal(d: Optional[date]) -> Optional[int]:
+    return d.toordinal() if d is not None else None
+
+
+def _to_minute(t: Optional[time]) -> int:
+    return t.hour * 60 + t.minute if t is not None else -1
+
+
+def _from_minute(m: int) -> Optional[time]:
+    return time(m // 60, m % 60) if m >= 0 else None
+
+
+def paise_bincount(idx: np.ndarray, paise: np.ndarray, minlength: int = 0) -> np.ndarray:
+    """Per-bin integer sums of paise amounts.
+
+    ``np.bincount`` accumulates weights in float64, which is exact for
+    integer totals below 2**53 paise, so the cast back loses nothing.
+    """
+    return np.bincount(idx, weights=paise, minlength=minlength).astype(np.int64)
+
+
+class TenantData:
+    """Immutable columnar snapshot of one business: products, sales and media posts."""
+
+    def __init__(self, business_id: int, products: List[Tuple], sales: List[Tuple], posts: List[Tuple],
+                 data_version: int = 0):
+        self.business_id = business_id
+        self.data_version = data_version
+        self.loaded_at = time_module.monotonic()
+
+        self.product_ids = np.array([p[0] for p in products], dtype=np.int64)
+        self.product_names = [p[1] for p in products]
+        self.product_categories = [p[2] for p in products]
+        self.cost_price_paise = np.array([p[3] for p in products], dtype=np.int64)
+        self.selling_price_paise = np.array([p[4] for p in products], dtype=np.int64)
+        self._product_index = {int(pid): i for i, pid in enumerate(self.product_ids)}
+
+        self.sale_day = np.array([s[3].toordinal() for s in sales], dtype=np.int32)
+        self.sale_product = np.array([self._product_index[s[0]] for s in sales], dtype=np.int32)
+        self.sale_quantity = np.array([s[1] for s in sales], dtype=np.int64)
+        self.sale_paise = np.array([s[2] for s in sales], dtype=np.int64)
+        self.sale_minute = np.array([_to_minute(s[4]) for s in sales], dtype=np.int16)
+
+        self.post_ids = np.array([p[0] for p in posts], dtype=np.int64)
+        self.post_types = [p[1] for p in posts]
+        self.post_captions = [p[2] for p in posts]
+        self.post_day = np.array([p[3].toordinal() for p in posts], dtype=np.int32)
+        self.post_minute = np.array([_to_minute(p[4]) for p in posts], dtype=np.int16)
+        self.post_platforms = [p[5] for p in posts]
+        self.post_impressions = np.array([p[6] or 0 for p in posts], dtype=np.int64)
+        self.post_likes = np.array([p[7] or 0 for p in posts], dtype=np.int64)
+        self.post_comments = np.array([p[8] or 0 for p in posts], dtype=np.int64)
+        self.post_shares = np.array([p[9] or 0 for p in posts], dtype=np.int64)
+
+        self._daily_cache = None
+        self._post_records = None
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [
+            self.product_ids, self.cost_price_paise, self.selling_price_paise,
+            self.sale_day, self.sale_product, self.sale_quantity, self.sale_paise, self.sale_minute,
+            self.post_ids, self.post_day, self.post_minute, self.post_impressions,
+            self.post_likes, self.post_comments, self.post_shares
+        ]
+        strings = (len(self.product_ids) + len(self.post_ids)) * _STRING_ROW_BYTES
+        return sum(a.nbytes for a in arrays) + strings
+
+    @property
+    def sale_count(self) -> int:
+        return len(self.sale_day)
+
+    def has_product(self, product_id: int) -> bool:
+        return product_id in self._product_index
+
+    def products(self) -> List[ProductRecord]:
+        return [
+            ProductRecord(int(pid), name, category, int(cost), int(price))
+            for pid, name, category, cost, price in zip(
+                self.product_ids, self.product_names, self.product_categories,
+                self.cost_price_paise, self.selling_price_paise
+            )
+        ]
+
+    def posts(self) -> List[PostRecord]:
+        """Posts as lightweight records with the same attributes as ``MediaPost``."""
+        if self._post_records is None:
+            self._post_records = [
+                PostRecord(
+                    int(self.post_ids[i]), self.post_types[i], self.post_captions[i],
+                    date.fromordinal(int(self.post_day[i])), _from_minute(int(self.post_minute[i])),
+                    self.post_platforms[i], int(self.post_impressions[i]), int(self.post_likes[i]),
+                    int(self.post_comments[i]), int(self.post_shares[i])
+                )
+                for i in range(len(self.post_ids))
+            ]
+        return self._post_records
+
+    def _sale_mask(self, start: Optional[date] = None, end: Optional[date] = None) -> np.ndarray:
+        mask = np.ones(len(self.sale_day), dtype=bool)
+        if start is not None:
+            mask &= self.sale_day >= start.toordinal()
+        if end is not None:
+            mask &= self.sale_day <= end.toordinal()
+        return mask
+
+    def product_totals(self, start: Optional[date] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Quantity, revenue (paise) and order count per product, aligned with ``products()``."""
+        mask = self._sale_mask(start)
+        idx = self.sale_product[mask]
+        n = len(self.product_ids)
+        quantity = np.bincount(idx, weights=self.sale_quantity[mask], minlength=n).astype(np.int64)
+        revenue = paise_bincount(idx, self.sale_paise[mask], minlength=n)
+        orders = np.bincount(idx, minlength=n)
+        return quantity, revenue, orders
+
+    def total_profit(self) -> int:
+        """Profit in paise of all sales at current product prices"""
+        unit_profit = self.selling_price_paise - self.cost_price_paise
+        return int(np.dot(unit_profit[self.sale_product], self.sale_quantity))
+
+    def _daily(self) -> Tuple[int, np.ndarray, np.ndarray]:
+        """Dense per-day revenue (paise) and order counts from the first sale day onwards."""
+        if self._daily_cache is None:
+            if len(self.sale_day) == 0:
+                self._daily_cache = (0, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+            else:
+                first = int(self.sale_day.min())
+                offsets = self.sale_day - first
+                revenue = paise_bincount(offsets, self.sale_paise)
+                orders = np.bincount(offsets)
+                self._daily_cache = (first, revenue, orders)
+        return self._daily_cache
+
+    def revenue_between(self, start: Optional[date] = None, end: Optional[date] = None) -> int:
+        """Total revenue in paise for sale dates in ``[start, end]`` (either bound optional)."""
+        first, revenue, _ = self._daily()
+        if len(revenue) == 0:
+            return 0
+        lo = 0 if start is None else max(0, start.toordinal() - first)
+        hi = len(revenue) if end is None else min(len(revenue), end.toordinal() - first + 1)
+        if hi <= lo:
+            return 0
+        return int(revenue[lo:hi].sum())
+
+    def daily_totals(self, start: Optional[date] = None, end: Optional[date] = None) -> List[Tuple[date, int, int]]:
+        """(date, revenue in paise, orders) for every day in range that has at least one sale."""
+        first, revenue, orders = self._daily()
+        if len(revenue) == 0:
+            return []
+        lo = 0 if start is None else max(0, start.toordinal() - first)
+        hi = len(revenue) if end is None else min(len(revenue), end.toordinal() - first + 1)
+        return [
+            (date.fromordinal(first + i), int(revenue[i]), int(orders[i]))
+            for i in range(lo, hi) if orders[i] > 0
+        ]
+
+    def weekday_totals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Revenue (paise) and order count by weekday (0 = Monday)."""
+        weekday = (self.sale_day - 1) % 7
+        revenue = paise_bincount(weekday, self.sale_paise, minlength=7)
+        orders = np.bincount(weekday, minlength=7)
+        return revenue, orders
+
+    def hour_totals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Revenue (paise) and order count by hour of day, for sales with a recorded time."""
+        timed = self.sale_minute >= 0
+        hour = self.sale_minute[timed] // 60
+        revenue = paise_bincount(hour, self.sale_paise[timed], minlength=24)
+        orders = np.bincount(hour, minlength=24)
+        return revenue, orders
+
+    def _derive(self, **columns) -> "TenantData":
+        """Copy of this snapshot with some columns replaced; the rest are shared, not copied."""
+        derived = copy.copy(self)
+        derived.__dict__.update(columns)
+        return derived
+
+    def with_sales(self, sales: List[Tuple]) -> "TenantData":
+        """New snapshot with (product_id, quantity, total_amount_paise, sale_date, sale_time) rows appended."""
+        return self._derive(
+            sale_day=np.append(self.sale_day, np.array([s[3].toordinal() for s in sales], dtype=np.int32)),
+            sale_product=np.append(
+                self.sale_product, np.array([self._product_index[s[0]] for s in sales], dtype=np.int32)
+            ),
+            sale_quantity=np.append(self.sale_quantity, np.array([s[1] for s in sales], dtype=np.int64)),
+            sale_paise=np.append(self.sale_paise, np.array([s[2] for s in sales], dtype=np.int64)),
+            sale_minute=np.append(self.sale_minute, np.array([_to_minute(s[4]) for s in sales], dtype=np.int16)),
+            _daily_cache=None
+        )
+
+    def with_post(self, post: MediaPost) -> "TenantData":
+        """New snapshot with one media post appended."""
+        return self._derive(
+            post_ids=np.append(self.post_ids, np.int64(post.id)),
+            post_types=self.post_types + [post.post_type],
+            post_captions=self.post_captions + [post.caption],
+            post_day=np.append(self.post_day, np.int32(post.posted_at.toordinal())),
+            post_minute=np.append(self.post_minute, np.int16(_to_minute(post.post_time))),
+            post_platforms=self.post_platforms + [post.platform],
+            post_impressions=np.append(self.post_impressions, np.int64(post.impressions or 0)),
+            post_likes=np.append(self.post_likes, np.int64(post.likes or 0)),
+            post_comments=np.append(self.post_comments, np.int64(post.comments or 0)),
+            post_shares=np.append(self.post_shares, np.int64(post.shares or 0)),
+            _post_records=None
+        )
+
+
+def _data_version(db: Session, business_id: int) -> int:
+    return db.scalar(select(Business.data_version).where(Business.id == business_id)) or 0
+
+
+def load_tenant(db: Session, business_id: int) -> TenantData:
+    # Read the version first: a write racing the load then only causes one extra reload
+    data_version = _data_version(db, business_id)
+    products = db.query(
+        Product.id, Product.name, Product.category, Product.cost_price_paise, Product.selling_price_paise
+    ).filter(Product.business_id == business_id).order_by(Product.id).all()
+
+    product_ids = [p[0] for p in products]
+    sales = []
+    if product_ids:
+        sales = db.query(
+            Sale.product_id, Sale.quantity, Sale.total_amount_paise, Sale.sale_date, Sale.sale_time
+        ).filter(Sale.product_id.in_(product_ids)).all()
+
+    posts = db.query(
+        MediaPost.id, MediaPost.post_type, MediaPost.caption, MediaPost.posted_at, MediaPost.post_time,
+        MediaPost.platform, MediaPost.impressions, MediaPost.likes, MediaPost.comments, MediaPost.shares
+    ).filter(MediaPost.business_id == business_id).order_by(MediaPost.id).all()
+
+    return TenantData(business_id, products, sales, posts, data_version)
+
+
+class ColumnarStore:
+    """LRU of ``TenantData`` bounded by a total memory budget."""
+
+    def __init__(self, budget_bytes: int = MEMORY_BUDGET_BYTES, reload_seconds: int = RELOAD_SECONDS):
+        self.budget_bytes = budget_bytes
+        self.reload_seconds = reload_seconds
+        self._tenants: "OrderedDict[int, TenantData]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks: Dict[int, threading.Lock] = {}
+
+    def _fresh(self, business_id: int) -> Optional[TenantData]:
+        with self._lock:
+            tenant = self._tenants.get(business_id)
+            if tenant is not None and time_module.monotonic() - tenant.loaded_at < self.reload_seconds:
+                self._tenants.move_to_end(business_id)
+                return tenant
+            return None
+
+    def get(self, db: Session, business_id: int) -> TenantData:
+        tenant = self._fresh(business_id)
+        if tenant is not None:
+            instrumentation.inc("cache_requests_total", cache="columnar_store", result="hit")
+            return tenant
+
+        # One load per business at a time: concurrent callers (e.g. dashboard panels) wait for it
+        with self._lock:
+            load_lock = self._load_locks.setdefault(business_id, threading.Lock())
+        with load_lock:
+            tenant = self._fresh(business_id)
+            if tenant is not None:
+                instrumentation.inc("cache_requests_total", cache="columnar_store", result="hit")
+                return tenant
+            instrumentation.inc("cache_requests_total", cache="columnar_store", result="miss")
+            tenant = load_tenant(db, business_id)
+            with self._lock:
+                self._tenants[business_id] = tenant
+                self._tenants.move_to_end(business_id)
+                self._evict()
+        return tenant
+
+    def peek(self, business_id: int) -> Optional[TenantData]:
+        with self._lock:
+            return self._tenants.get(business_id)
+
+    def invalidate(self, business_id: int):
+        with self._lock:
+            self._tenants.pop(business_id, None)
+            self._load_locks.pop(business_id, None)
+
+    def sync_version(self, business_id: int, data_version: int):
+        with self._lock:
+            tenant = self._tenants.get(business_id)
+            if tenant is not None and tenant.data_version != data_version:
+                self.invalidate(business_id)
+
+    def apply(self, business_id: int, change, data_version: Optional[int] = None):
+        """Swap in ``change(tenant)`` for a cached tenant; drops it if the change returns None.
+
+        ``data_version`` is the version a write bumped the business to: the
+        snapshot only follows along when it was at the version just before,
+        otherwise writes it has not seen happened in between and it is dropped.
+        """
+        with self._lock:
+            tenant = self._tenants.get(business_id)
+            if tenant is None:
+                return
+            updated = change(tenant)
+            if updated is not None and data_version is not None:
+                if tenant.data_version != data_version - 1:
+                    updated = None
+                else:
+                    updated = updated._derive(data_version=data_version)
+            if updated is None:
+                self.invalidate(business_id)
+            else:
+                self._tenants[business_id] = updated
+
+    def _evict(self):
+        total = sum(t.nbytes for t in self._tenants.values())
+        while total > self.budget_bytes and len(self._tenants) > 1:
+            business_id, evicted = self._tenants.popitem(last=False)
+            self._load_locks.pop(business_id, None)
+            total -= evicted.nbytes
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "tenants": len(self._tenants),
+                "bytes": sum(t.nbytes for t in self._tenants.values()),
+                "budget_bytes": self.budget_bytes
+            }
+
+
+_store = ColumnarStore() if ENABLED else None
+
+
+def get_tenant(db: Session, business_id: int) -> Optional[TenantData]:
+    """Return the warm columnar snapshot for a business, or None when the store is disabled."""
+    if _store is None:
+        return None
+    return _store.get(db, business_id)
+
+
+def append_sale(business_id: int, product_id: int, quantity: int, total_amount_paise: int,
+                sale_date: date, sale_time: Optional[time] = None, data_version: Optional[int] = None):
+    """Write-through for a newly committed sale; unknown products drop the tenant instead."""
+    append_sales(business_id, [(product_id, quantity, total_amount_paise, sale_date, sale_time)], data_version)
+
+
+def append_sales(business_id: int, sales: List[Tuple], data_version: Optional[int] = None):
+    """Write-through for a batch of committed (product_id, quantity, total_amount_paise, sale_date, sale_time) rows.
+
+    Pass ``data_version`` when the write also bumped the business's version.
+    """
+    if _store is None:
+        return
+    _store.apply(
+        business_id,
+        lambda t: t.with_sales(sales) if all(t.has_product(s[0]) for s in sales) else None,
+        data_version
+    )
+
+
+def append_post(business_id: int, post: MediaPost, data_version: Optional[int] = None):
+    """Write-through for a newly committed media post."""
+    if _store is None:
+        return
+    _store.apply(business_id, lambda t: t.with_post(post), data_version)
+
+
+def version_bumped(business_id: int, data_version: int):
+    """Follow a data version bump for writes that were already appended."""
+    if _store is None:
+        return
+    _store.apply(business_id, lambda t: t, data_version)
+
+
+def sync_version(business_id: int, data_version: int):
+    """Drop a cached tenant loaded at a different data version, e.g. after another process wrote."""
+    if _store is not None:
+        _store.sync_version(business_id, data_version)
+
+
+def invalidate(business_id: int):
+    """Drop a business from the store after bulk or structural writes."""
+    if _store is not None:
+        _store.invalidate(business_id)
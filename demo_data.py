@@ -1,5 +1,7 @@
 from sqlalchemy.orm import Session
-from models import Product, Sale, MediaPost
+from models import Product, Sale, MediaPost, to_paise
+import post_impacts
+from tenant_purge import purge_business
 from datetime import datetime, timedelta, time
 import random
 
@@ -29,8 +31,8 @@ def generate_demo_data(db: Session, business_id: int):
         product = Product(
             business_id=business_id,
             name=p_data["name"],
-            cost_price=p_data["cost_price"],
-            selling_price=p_data["selling_price"],
+            cost_price_paise=to_paise(p_data["cost_price"]),
+            selling_price_paise=to_paise(p_data["selling_price"]),
             category=p_data["category"]
         )
         db.add(product)
@@ -81,7 +83,7 @@ def generate_demo_data(db: Session, business_id: int):
                 post_boost = 1.4 if current_date in post_dates else 1.0
                 
                 quantity = max(1, int(random.gauss(5 * base_demand * weekend_boost * post_boost, 2)))
-                total_amount = quantity * product.selling_price
+                total_amount_paise = quantity * product.selling_price_paise
                 
                 sale_hour = random.choices(
                     [9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20],
@@ -93,7 +95,7 @@ def generate_demo_data(db: Session, business_id: int):
                 sale = Sale(
                     product_id=product.id,
                     quantity=quantity,
-                    total_amount=total_amount,
+                    total_amount_paise=total_amount_paise,
                     sale_date=current_date,
                     sale_time=time(sale_hour, sale_minute)
                 )
@@ -139,15 +141,10 @@ def generate_demo_data(db: Session, business_id: int):
         db.add(media_post)
     
     db.commit()
+    post_impacts.rebuild(db, business_id)
     return True
 
 
 def clear_demo_data(db: Session, business_id: int):
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    
-    for product in products:
-        db.query(Sale).filter(Sale.product_id == product.id).delete()
-    
-    db.query(Product).filter(Product.business_id == business_id).delete()
-    db.query(MediaPost).filter(MediaPost.business_id == business_id).delete()
-    db.commit()
+    """Delete all of the business's data (see tenant_purge)"""
+    return purge_business(db, business_id)
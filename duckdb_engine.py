@@ -0,0 +1,217 @@
+"""Optional DuckDB engine for the scan-and-aggregate analytics.
+
+SQLite aggregates sales one row at a time. With ``DUCKDB_ANALYTICS`` set,
+the daily, weekday and per-product sales totals behind the trend, best-day,
+product ranking and revenue timeline analytics run as vectorized DuckDB SQL
+over one of two sources:
+
+- ``attach``: the application database itself, attached read-only through
+  DuckDB's ``sqlite`` or ``postgres`` extension. Always current.
+- ``parquet``: a Parquet mirror of each business's sales under
+  ``DUCKDB_MIRROR_DIR``, rewritten by the background precompute after data
+  changes. The mirror is keyed by ``Business.data_version``. Until the
+  current version is written, the business is served by SQLAlchemy.
+
+Callers get None from ``get_duckdb_sales`` and keep using SQLAlchemy when
+the engine is off, the duckdb package or the extension is missing, or the
+mirror is stale.
+"""
+import logging
+import os
+import shutil
+import threading
+from datetime import date
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from models import DATABASE_URL, Business
+from parquet_io import export_queries, export_schemas, write_parquet
+
+logger = logging.getLogger(__name__)
+
+DUCKDB_ANALYTICS = os.environ.get("DUCKDB_ANALYTICS", "").lower()  # "", "attach" or "parquet"
+DUCKDB_MIRROR_DIR = os.environ.get("DUCKDB_MIRROR_DIR", "duckdb_mirror")
+DUCKDB_THREADS = int(os.environ.get("DUCKDB_THREADS", "0"))  # 0 leaves DuckDB's default (all cores)
+
+
+def _attach_statement(database_url: str) -> Tuple[str, str]:
+    """(extension, ATTACH statement) that opens the application database read-only as ``app``"""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        path = os.path.abspath(url.database).replace("'", "''")
+        return "sqlite", f"ATTACH '{path}' AS app (TYPE sqlite, READ_ONLY)"
+    if url.get_backend_name() == "postgresql":
+        dsn = url.set(drivername="postgresql").render_as_string(hide_password=False).replace("'", "''")
+        return "postgres", f"ATTACH '{dsn}' AS app (TYPE postgres, READ_ONLY)"
+    raise ValueError(f"DuckDB cannot attach {url.get_backend_name()} databases")
+
+
+class DuckDBEngine:
+    """One in-process DuckDB database; every query runs on its own cursor."""
+
+    def __init__(self, mode: str, mirror_dir: str = DUCKDB_MIRROR_DIR, database_url: str = DATABASE_URL,
+                 threads: int = DUCKDB_THREADS):
+        import duckdb
+
+        if mode not in ("attach", "parquet"):
+            raise ValueError(f"Unknown DUCKDB_ANALYTICS mode {mode!r}")
+        if mode == "parquet":
+            import pyarrow  # noqa: F401  (writes the mirror)
+        self.mode = mode
+        self.mirror_dir = mirror_dir
+        self._con = duckdb.connect()
+        if threads > 0:
+            self._con.execute(f"SET threads = {int(threads)}")
+        if mode == "attach":
+            extension, attach = _attach_statement(database_url)
+            self._con.execute(f"INSTALL {extension}")
+            self._con.execute(f"LOAD {extension}")
+            self._con.execute(attach)
+
+    def mirror_path(self, business_id: int, data_version: int) -> str:
+        return os.path.join(self.mirror_dir, str(business_id), f"v{data_version}", "sales.parquet")
+
+    def sales(self, db: Session, business_id: int) -> Optional["DuckDBSales"]:
+        if self.mode == "attach":
+            return DuckDBSales(
+                self._con, "app.sales s JOIN app.products p ON s.product_id = p.id", "p.business_id = ?", [business_id]
+            )
+        version = db.scalar(select(Business.data_version).where(Business.id == business_id)) or 0
+        path = self.mirror_path(business_id, version)
+        if not os.path.exists(path):
+            return None
+        return DuckDBSales(self._con, "read_parquet(?) s", "true", [path])
+
+    def write_mirror(self, db: Session, business_id: int) -> Optional[str]:
+        """Write the business's sales at its current data version; no-op if already written"""
+        version = db.scalar(select(Business.data_version).where(Business.id == business_id)) or 0
+        path = self.mirror_path(business_id, version)
+        if os.path.exists(path):
+            return path
+
+        version_dir = os.path.dirname(path)
+        tmp_dir = f"{version_dir}.tmp{os.getpid()}.{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            write_parquet(db, export_queries(business_id)["sales"], export_schemas()["sales"],
+                          os.path.join(tmp_dir, "sales.parquet"))
+            os.replace(tmp_dir, version_dir)
+        except OSError:
+            # Another writer renamed its copy of the same version first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.exists(path):
+                raise
+
+        # Keep the previous version for readers that looked it up just before this write
+        business_dir = os.path.dirname(version_dir)
+        for name in os.listdir(business_dir):
+            if name.startswith("v") and name[1:].isdigit() and int(name[1:]) < version - 1:
+                shutil.rmtree(os.path.join(business_dir, name), ignore_errors=True)
+        return path
+
+
+class DuckDBSales:
+    """Sales totals of one business computed by DuckDB; same shapes as ``TenantData``'s."""
+
+    def __init__(self, con, relation: str, condition: str, params: list):
+        self._con = con
+        self._relation = relation
+        self._condition = condition
+        self._params = params
+
+    def _fetch(self, select_sql: str, where: str = "", params: Optional[list] = None,
+               group_by: str = "") -> List[tuple]:
+        sql = f"SELECT {select_sql} FROM {self._relation} WHERE {self._condition}{where}"
+        if group_by:
+            sql += f" GROUP BY {group_by} ORDER BY {group_by}"
+        cursor = self._con.cursor()
+        try:
+            return cursor.execute(sql, self._params + (params or [])).fetchall()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _date_range(start: Optional[date], end: Optional[date]) -> Tuple[str, list]:
+        where, params = "", []
+        if start is not None:
+            where += " AND CAST(s.sale_date AS DATE) >= ?"
+            params.append(start)
+        if end is not None:
+            where += " AND CAST(s.sale_date AS DATE) <= ?"
+            params.append(end)
+        return where, params
+
+    def daily_totals(self, start: Optional[date] = None, end: Optional[date] = None) -> List[Tuple[date, int, int]]:
+        """(date, revenue in paise, orders) for every day in range that has at least one sale"""
+        where, params = self._date_range(start, end)
+        rows = self._fetch(
+            "CAST(s.sale_date AS DATE) AS day, SUM(s.total_amount_paise), COUNT(*)", where, params, group_by="day"
+        )
+        return [(day, int(revenue), int(orders)) for day, revenue, orders in rows]
+
+    def weekday_totals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Revenue (paise) and order count by weekday (0 = Monday)"""
+        revenue = np.zeros(7, dtype=np.int64)
+        orders = np.zeros(7, dtype=np.int64)
+        for weekday, day_revenue, day_orders in self._fetch(
+            "isodow(CAST(s.sale_date AS DATE)) - 1 AS weekday, SUM(s.total_amount_paise), COUNT(*)",
+            group_by="weekday"
+        ):
+            revenue[weekday] = day_revenue
+            orders[weekday] = day_orders
+        return revenue, orders
+
+    def product_totals(self, start: Optional[date] = None) -> List[Tuple[int, int, int, int]]:
+        """(product_id, quantity, revenue in paise, orders) per product with sales since ``start``"""
+        where, params = self._date_range(start, None)
+        return self._fetch(
+            "s.product_id, SUM(s.quantity), SUM(s.total_amount_paise), COUNT(*)", where, params,
+            group_by="s.product_id"
+        )
+
+
+_engine: Optional[DuckDBEngine] = None
+_engine_failed = False
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Optional[DuckDBEngine]:
+    """Process-wide engine, or None when DUCKDB_ANALYTICS is off or the engine cannot start"""
+    global _engine, _engine_failed
+    if not DUCKDB_ANALYTICS or _engine_failed:
+        return None
+    with _engine_lock:
+        if _engine is None and not _engine_failed:
+            try:
+                _engine = DuckDBEngine(DUCKDB_ANALYTICS)
+            except ImportError as e:
+                logger.warning("DUCKDB_ANALYTICS is set but %s is not installed; using SQLAlchemy", e.name)
+                _engine_failed = True
+            except Exception as e:
+                logger.warning("DuckDB engine unavailable (%s); using SQLAlchemy", e)
+                _engine_failed = True
+        return _engine
+
+
+def get_duckdb_sales(db: Session, business_id: int) -> Optional[DuckDBSales]:
+    """DuckDB totals for a business, or None to use the SQLAlchemy path"""
+    engine = get_engine()
+    return engine.sales(db, business_id) if engine is not None else None
+
+
+def refresh_mirror(db: Session, business_id: int) -> Optional[str]:
+    """Rewrite a business's Parquet mirror if the engine reads from one"""
+    engine = get_engine()
+    if engine is None or engine.mode != "parquet":
+        return None
+    return engine.write_mirror(db, business_id)
+
+
+def remove_mirror(business_id: int):
+    """Delete every Parquet mirror version of a business"""
+    mirror_dir = _engine.mirror_dir if _engine is not None else DUCKDB_MIRROR_DIR
+    shutil.rmtree(os.path.join(mirror_dir, str(business_id)), ignore_errors=True)
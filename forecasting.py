@@ -0,0 +1,241 @@
+"""Multi-horizon unit forecasts for every product of a business.
+
+Sales are aggregated into a products x days matrix of units sold. Lag and
+rolling-window features for every (product, forecast origin) pair are cut
+from cumulative sums of that matrix in a few NumPy operations. One global
+model per horizon then learns across all products at once, with the product
+as a feature. Each model predicts the total units over the next ``h`` days
+directly. Prediction intervals are split-conformal: the most recent
+``FORECAST_CALIBRATION_DAYS`` origins are held out and their absolute errors
+set the interval width.
+"""
+import os
+import time as time_module
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import instrumentation
+from models import Product, Sale, to_rupees
+
+FORECAST_HORIZONS = (7, 14, 30)
+FORECAST_HISTORY_DAYS = int(os.environ.get("FORECAST_HISTORY_DAYS", "365"))
+FORECAST_CALIBRATION_DAYS = int(os.environ.get("FORECAST_CALIBRATION_DAYS", "28"))
+FORECAST_MAX_TRAIN_ROWS = int(os.environ.get("FORECAST_MAX_TRAIN_ROWS", "200000"))
+FORECAST_INTERVAL = float(os.environ.get("FORECAST_INTERVAL", "0.8"))
+
+LAGS = (1, 2, 7, 14)
+WINDOWS = (7, 14, 28)
+MIN_HISTORY = max(WINDOWS + LAGS)
+MAX_CATEGORICAL_PRODUCTS = 250
+
+
+def get_product_daily_matrix(db: Session, business_id: int,
+                             history_days: int = FORECAST_HISTORY_DAYS) -> Dict[str, Any]:
+    """Units sold per product per day, as a dense (products x days) array ending today"""
+    products = db.query(
+        Product.id, Product.name, Product.category, Product.selling_price_paise
+    ).filter(Product.business_id == business_id).order_by(Product.id).all()
+
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=history_days - 1)
+    rows = db.query(
+        Sale.product_id, Sale.sale_date, func.sum(Sale.quantity)
+    ).join(Product, Sale.product_id == Product.id).filter(
+        Product.business_id == business_id,
+        Sale.sale_date >= start_date,
+        Sale.sale_date <= end_date
+    ).group_by(Sale.product_id, Sale.sale_date).all()
+
+    index = {p.id: i for i, p in enumerate(products)}
+    units = np.zeros((len(products), history_days), dtype=np.float64)
+    if rows:
+        product_idx = np.fromiter((index[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+        day_idx = np.fromiter(((r[1] - start_date).days for r in rows), dtype=np.int64, count=len(rows))
+        np.add.at(units, (product_idx, day_idx), np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows)))
+
+    return {
+        "products": products,
+        "start_date": start_date,
+        "end_date": end_date,
+        "units": units
+    }
+
+
+def _window_sums(cumsum: np.ndarray, origins: np.ndarray, window: int) -> np.ndarray:
+    """Sum of the ``window`` days ending at each origin (inclusive), for every product"""
+    return cumsum[:, origins + 1] - cumsum[:, np.maximum(origins + 1 - window, 0)]
+
+
+def build_features(units: np.ndarray, origins: np.ndarray, start_weekday: int,
+                   product_level: np.ndarray, product_price: np.ndarray,
+                   product_category: np.ndarray) -> Tuple[np.ndarray, List[str]]:
+    """Feature matrix with one row per (product, origin), products varying slowest"""
+    n_products = units.shape[0]
+    cumsum = np.concatenate([np.zeros((n_products, 1)), np.cumsum(units, axis=1)], axis=1)
+    sq_cumsum = np.concatenate([np.zeros((n_products, 1)), np.cumsum(units ** 2, axis=1)], axis=1)
+
+    columns, names = [], []
+    for lag in LAGS:
+        columns.append(units[:, origins + 1 - lag])
+        names.append(f"lag_{lag}")
+    for window in WINDOWS:
+        mean = _window_sums(cumsum, origins, window) / window
+        columns.append(mean)
+        names.append(f"mean_{window}d")
+    mean_28 = columns[names.index("mean_28d")]
+    var_28 = _window_sums(sq_cumsum, origins, 28) / 28 - mean_28 ** 2
+    columns.append(np.sqrt(np.maximum(var_28, 0)))
+    names.append("std_28d")
+
+    shape = (n_products, len(origins))
+    columns.append(np.broadcast_to(((start_weekday + origins + 1) % 7)[None, :], shape))
+    names.append("next_day_of_week")
+    columns.append(np.broadcast_to(np.arange(n_products)[:, None], shape))
+    names.append("product")
+    columns.append(np.broadcast_to(product_category[:, None], shape))
+    names.append("category")
+    columns.append(np.broadcast_to(product_level[:, None], shape))
+    names.append("product_level")
+    columns.append(np.broadcast_to(product_price[:, None], shape))
+    names.append("selling_price")
+
+    X = np.stack([np.asarray(c, dtype=np.float64).reshape(-1) for c in columns], axis=1)
+    return X, names
+
+
+def _targets(units: np.ndarray, origins: np.ndarray, horizon: int) -> np.ndarray:
+    cumsum = np.concatenate([np.zeros((units.shape[0], 1)), np.cumsum(units, axis=1)], axis=1)
+    return (cumsum[:, origins + 1 + horizon] - cumsum[:, origins + 1]).reshape(-1)
+
+
+def _make_model(categorical: Sequence[bool]):
+    from sklearn.ensemble import HistGradientBoostingRegressor
+
+    return HistGradientBoostingRegressor(
+        loss="poisson",
+        max_iter=200,
+        learning_rate=0.1,
+        early_stopping=True,
+        validation_fraction=0.1,
+        n_iter_no_change=15,
+        categorical_features=list(categorical),
+        random_state=42
+    )
+
+
+@instrumentation.timed("analytics_seconds")
+def forecast_products(db: Session, business_id: int,
+                      horizons: Sequence[int] = FORECAST_HORIZONS) -> Dict[str, Any]:
+    """Forecast units (and revenue) per product for each horizon with prediction intervals"""
+    try:
+        import sklearn  # noqa: F401
+    except ImportError:
+        return {"success": False, "error": "scikit-learn not installed"}
+
+    started = time_module.perf_counter()
+    data = get_product_daily_matrix(db, business_id)
+    products, units = data["products"], data["units"]
+    n_products, n_days = units.shape if units.size else (len(products), 0)
+
+    active_days = np.flatnonzero(units.sum(axis=0))
+    if not n_products or not len(active_days):
+        return {"success": False, "error": "No sales in the forecast history window"}
+
+    first_day = int(active_days[0])
+    longest = max(horizons)
+    if n_days - first_day < MIN_HISTORY + longest + FORECAST_CALIBRATION_DAYS:
+        return {
+            "success": False,
+            "error": f"Need at least {MIN_HISTORY + longest + FORECAST_CALIBRATION_DAYS} days of sales history to forecast"
+        }
+
+    start_weekday = data["start_date"].weekday()
+    price = to_rupees(np.array([p.selling_price_paise for p in products], dtype=np.int64))
+    categories = sorted({p.category or "" for p in products})
+    category = np.array([categories.index(p.category or "") for p in products], dtype=np.float64)
+    categorical_columns = {"next_day_of_week"}
+    if n_products <= MAX_CATEGORICAL_PRODUCTS:
+        categorical_columns.add("product")
+    if len(categories) <= MAX_CATEGORICAL_PRODUCTS:
+        categorical_columns.add("category")
+
+    last_origin = n_days - 1
+    latest_origin = np.array([last_origin])
+
+    results: Dict[int, Dict[str, np.ndarray]] = {}
+    metrics = {}
+    for horizon in horizons:
+        origins = np.arange(first_day + MIN_HISTORY - 1, last_origin - horizon + 1)
+        calib = origins[-FORECAST_CALIBRATION_DAYS:]
+        train = origins[:-FORECAST_CALIBRATION_DAYS]
+        stride = max(1, int(np.ceil(n_products * len(train) / FORECAST_MAX_TRAIN_ROWS)))
+        train = train[::-1][::stride][::-1]
+
+        # Long-run level per product, from days before the calibration window only
+        level = units[:, first_day:calib[0] + 1].mean(axis=1)
+
+        X_train, names = build_features(units, train, start_weekday, level, price, category)
+        y_train = _targets(units, train, horizon)
+        X_calib, _ = build_features(units, calib, start_weekday, level, price, category)
+        y_calib = _targets(units, calib, horizon)
+
+        if y_train.sum() <= 0:
+            return {"success": False, "error": "Not enough sales to fit a forecast"}
+
+        model = _make_model([name in categorical_columns for name in names])
+        with instrumentation.timer("model_seconds", model="forecast", op="train"):
+            model.fit(X_train, y_train)
+        calib_pred = model.predict(X_calib)
+        residuals = np.abs(y_calib - calib_pred)
+        width = float(np.quantile(residuals, FORECAST_INTERVAL))
+
+        naive = (_window_sums(
+            np.concatenate([np.zeros((n_products, 1)), np.cumsum(units, axis=1)], axis=1), calib, 28
+        ) / 28 * horizon).reshape(-1)
+        metrics[horizon] = {
+            "mae": round(float(residuals.mean()), 2),
+            "naive_mae": round(float(np.abs(y_calib - naive).mean()), 2),
+            "interval_width": round(width, 2),
+            "training_rows": int(len(y_train))
+        }
+
+        full_level = units[:, first_day:].mean(axis=1)
+        X_latest, _ = build_features(units, latest_origin, start_weekday, full_level, price, category)
+        point = np.maximum(model.predict(X_latest), 0)
+        results[horizon] = {
+            "units": point,
+            "lower": np.maximum(point - width, 0),
+            "upper": point + width
+        }
+
+    recent = units[:, -28:].mean(axis=1)
+    rows = []
+    for i, product in enumerate(products):
+        rows.append({
+            "product_id": product.id,
+            "name": product.name,
+            "category": product.category,
+            "recent_daily_units": round(float(recent[i]), 2),
+            "forecasts": {
+                horizon: {
+                    "units": round(float(results[horizon]["units"][i]), 1),
+                    "lower": round(float(results[horizon]["lower"][i]), 1),
+                    "upper": round(float(results[horizon]["upper"][i]), 1),
+                    "revenue": round(float(results[horizon]["units"][i] * price[i]), 2)
+                } for horizon in horizons
+            }
+        })
+
+    return {
+        "success": True,
+        "as_of": data["end_date"].strftime("%Y-%m-%d"),
+        "horizons": list(horizons),
+        "interval": FORECAST_INTERVAL,
+        "products": rows,
+        "metrics": metrics,
+        "fit_seconds": round(time_module.perf_counter() - started, 2)
+    }
@@ -0,0 +1,212 @@
+"""Process-wide instrumentation: gauges, counters and histograms.
+
+Code records through ``set_gauge``, ``inc``, ``observe`` and the ``timer``
+context manager / ``timed`` decorator. ``render_prometheus`` returns every
+metric in the Prometheus text exposition format. ``start_exporter`` serves
+it at ``http://METRICS_HOST:METRICS_PORT/metrics`` and/or rewrites
+``METRICS_FILE`` every ``METRICS_FILE_SECONDS`` for node_exporter's textfile
+collector. Each process (every Streamlit replica, the API server) exports
+its own numbers; give each a distinct port or file and let Prometheus sum
+across instances.
+"""
+import functools
+import logging
+import os
+import threading
+import time as time_module
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = os.environ.get("METRICS_PREFIX", "bizanalytics")
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # 0 disables the HTTP exporter
+METRICS_FILE = os.environ.get("METRICS_FILE", "")
+METRICS_FILE_SECONDS = int(os.environ.get("METRICS_FILE_SECONDS", "15"))
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+_lock = threading.Lock()
+_gauges: Dict[Tuple, float] = {}
+_counters: Dict[Tuple, float] = {}
+_observations: Dict[Tuple, Dict[str, Any]] = {}
+_buckets: Dict[str, Sequence[float]] = {}
+_started_at = time_module.time()
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple:
+    return (name,) + tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def set_gauge(name: str, value: float, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Add to a counter (by convention named ``*_total``)"""
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_buckets(name: str, buckets: Sequence[float]):
+    """Histogram bucket bounds for ``name``; observations default to SECONDS_BUCKETS"""
+    with _lock:
+        _buckets[name] = tuple(sorted(buckets))
+
+
+def observe(name: str, value: float, **labels):
+    """Record one observation (e.g. a duration in seconds)"""
+    with _lock:
+        stats = _observations.get(_key(name, labels))
+        if stats is None:
+            bounds = _buckets.get(name, SECONDS_BUCKETS)
+            stats = _observations[_key(name, labels)] = {
+                "count": 0, "sum": 0.0, "max": 0.0, "bounds": bounds, "buckets": [0] * len(bounds)
+            }
+        stats["count"] += 1
+        stats["sum"] += value
+        stats["max"] = max(stats["max"], value)
+        i = bisect_left(stats["bounds"], value)
+        if i < len(stats["buckets"]):
+            stats["buckets"][i] += 1
+    logger.debug("%s %s %.6f", name, labels, value)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Observe the duration of the ``with`` block, also when it raises"""
+    started = time_module.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time_module.perf_counter() - started, **labels)
+
+
+def timed(name: str, **labels):
+    """Decorator observing each call's duration, labelled with the function name"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name, function=fn.__name__, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "gauges": dict(_gauges),
+            "counters": dict(_counters),
+            "observations": {
+                k: {"count": v["count"], "sum": v["sum"], "max": v["max"]} for k, v in _observations.items()
+            }
+        }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    with _lock:
+        gauges = dict(_gauges)
+        counters = dict(_counters)
+        observations = {k: {**v, "buckets": list(v["buckets"])} for k, v in _observations.items()}
+
+    lines = []
+    typed = set()
+
+    def emit(kind: str, name: str, labels: Sequence[Tuple[str, str]], value: float, suffix: str = ""):
+        full = f"{METRICS_PREFIX}_{name}" if METRICS_PREFIX else name
+        if full not in typed:
+            typed.add(full)
+            lines.append(f"# TYPE {full} {kind}")
+        lines.append(f"{full}{suffix}{_labels(labels)} {_number(value)}")
+
+    emit("gauge", "process_start_time_seconds", (), _started_at)
+    for (name, *labels), value in sorted(gauges.items()):
+        emit("gauge", name, labels, value)
+    for (name, *labels), value in sorted(counters.items()):
+        emit("counter", name, labels, value)
+    for (name, *labels), stats in sorted(observations.items()):
+        cumulative = 0
+        for bound, count in zip(stats["bounds"], stats["buckets"]):
+            cumulative += count
+            emit("histogram", name, labels + [("le", _number(bound))], cumulative, "_bucket")
+        emit("histogram", name, labels + [("le", "+Inf")], stats["count"], "_bucket")
+        emit("histogram", name, labels, stats["sum"], "_sum")
+        emit("histogram", name, labels, stats["count"], "_count")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics %s", format % args)
+
+
+def _write_file_forever(path: str, interval: int):
+    while True:
+        try:
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                f.write(render_prometheus())
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Could not write metrics file %s: %s", path, e)
+        time_module.sleep(interval)
+
+
+_exporter_started = False
+
+
+def start_exporter(port: int = METRICS_PORT, path: str = METRICS_FILE, host: str = METRICS_HOST) -> Optional[Any]:
+    """Start the HTTP and/or file exporter once per process; returns the HTTP server if one was started"""
+    global _exporter_started
+    with _lock:
+        if _exporter_started:
+            return None
+        _exporter_started = True
+
+    server = None
+    if port:
+        try:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info("Serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+        except OSError as e:
+            logger.warning("Metrics exporter could not bind %s:%d: %s", host, port, e)
+    if path:
+        threading.Thread(
+            target=_write_file_forever, args=(path, METRICS_FILE_SECONDS), name="metrics-file", daemon=True
+        ).start()
+    return server
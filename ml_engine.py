@@ -1,42 +1,64 @@
 import pickle
 import os
+import time as time_module
 from datetime import datetime, timedelta, time
 from typing import Dict, Any, List, Optional, Tuple
 import pandas as pd
 import numpy as np
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 
-from models import Product, Sale, MediaPost
+import instrumentation
+from models import Product, Sale, MediaPost, to_rupees
+from columnar_store import get_tenant
+from post_impacts import get_post_impacts
+from sales_scan import daily_totals
 
 MODEL_PATH = "post_impact_model.pkl"
 
+# "hgb" (HistGradientBoosting, native categoricals, early stopping) or "gbr" (exact-split GradientBoosting)
+POST_IMPACT_ESTIMATOR = os.environ.get("POST_IMPACT_ESTIMATOR", "hgb")
+TEST_FRACTION = 0.2
+VALIDATION_FRACTION = 0.15
 
+POST_TYPE_CODES = {"reel": 1, "story": 2, "image": 3}  # 0 = no post that day
+
+POST_IMPACT_FEATURES = [
+    "day_of_week", "is_weekend",
+    "revenue_3d_avg", "revenue_7d_avg",
+    "orders_3d_avg", "orders_7d_avg",
+    "had_post", "had_post_yesterday", "had_post_2days", "had_post_3days",
+    "post_type_reel", "post_type_story", "post_type_image",
+    "dow_0", "dow_1", "dow_2", "dow_3", "dow_4", "dow_5", "dow_6"
+]
+
+HGB_FEATURES = [
+    "day_of_week", "is_weekend",
+    "revenue_3d_avg", "revenue_7d_avg",
+    "orders_3d_avg", "orders_7d_avg",
+    "had_post", "had_post_yesterday", "had_post_2days", "had_post_3days",
+    "post_type"
+]
+HGB_CATEGORICAL = ["day_of_week", "post_type"]
+
+ESTIMATOR_FEATURES = {"hgb": HGB_FEATURES, "gbr": POST_IMPACT_FEATURES}
+
+
+@instrumentation.timed("analytics_seconds")
 def get_sales_features(db: Session, business_id: int) -> pd.DataFrame:
     """Extract and engineer features from sales and posts data"""
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
+    daily_sales = daily_totals(db, business_id)
     
-    if not product_ids:
+    if not daily_sales:
         return pd.DataFrame()
     
-    sales = db.query(Sale).filter(
-        Sale.product_id.in_(product_ids)
-    ).all()
-    
-    posts = db.query(MediaPost).filter(
+    posts = db.query(MediaPost.posted_at, MediaPost.post_type, MediaPost.post_time).filter(
         MediaPost.business_id == business_id
     ).all()
     
-    if not sales:
-        return pd.DataFrame()
-    
-    valid_dates = [s.sale_date for s in sales if s.sale_date]
+    valid_dates = [day for day, _, _ in daily_sales]
     valid_dates.extend([p.posted_at for p in posts if p.posted_at])
     
-    if not valid_dates:
-        return pd.DataFrame()
-    
     start_date = min(valid_dates)
     end_date = max(valid_dates + [datetime.now().date()])
     
@@ -46,20 +68,21 @@ def get_sales_features(db: Session, business_id: int) -> pd.DataFrame:
         daily_data[current] = {
             "date": current,
             "day_of_week": current.weekday(),
-            "revenue": 0.0,
+            "revenue": 0,
             "orders": 0,
             "had_post": 0,
             "post_type_reel": 0,
             "post_type_story": 0,
             "post_type_image": 0,
+            "post_type": 0,
             "post_hour": -1,
         }
         current += timedelta(days=1)
     
-    for sale in sales:
-        if sale.sale_date in daily_data:
-            daily_data[sale.sale_date]["revenue"] += sale.total_amount
-            daily_data[sale.sale_date]["orders"] += 1
+    for day, revenue, orders in daily_sales:
+        if day in daily_data:
+            daily_data[day]["revenue"] += revenue
+            daily_data[day]["orders"] += orders
     
     for post in posts:
         post_date = post.posted_at
@@ -71,12 +94,14 @@ def get_sales_features(db: Session, business_id: int) -> pd.DataFrame:
                 daily_data[post_date]["post_type_story"] = 1
             elif post.post_type == "image":
                 daily_data[post_date]["post_type_image"] = 1
+            daily_data[post_date]["post_type"] = POST_TYPE_CODES.get(post.post_type, 0)
             
             if post.post_time:
                 daily_data[post_date]["post_hour"] = post.post_time.hour
     
     df = pd.DataFrame(list(daily_data.values()))
     df = df.sort_values("date").reset_index(drop=True)
+    df["revenue"] = to_rupees(df["revenue"])  # Summed in paise; the model works in rupees
     
     df["revenue_3d_avg"] = df["revenue"].rolling(window=3, min_periods=1).mean().shift(1)
     df["revenue_7d_avg"] = df["revenue"].rolling(window=7, min_periods=1).mean().shift(1)
@@ -97,15 +122,22 @@ def get_sales_features(db: Session, business_id: int) -> pd.DataFrame:
     return df
 
 
+@instrumentation.timed("analytics_seconds")
 def calculate_post_impact_by_slot(db: Session, business_id: int) -> Dict[str, Any]:
     """Calculate average sales uplift for different posting slots (day/time/type)"""
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        product_ids = [int(pid) for pid in tenant.product_ids]
+    else:
+        product_ids = list(db.scalars(select(Product.id).where(Product.business_id == business_id)))
     
     if not product_ids:
         return {"slots": [], "baseline": 0}
     
-    posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
+    if tenant is not None:
+        posts = tenant.posts()
+    else:
+        posts = db.query(MediaPost).filter(MediaPost.business_id == business_id).all()
     
     if len(posts) < 3:
         return {"slots": [], "baseline": 0, "error": "Need at least 3 posts for analysis"}
@@ -113,37 +145,28 @@ def calculate_post_impact_by_slot(db: Session, business_id: int) -> Dict[str, An
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=180)
     
-    sales = db.query(Sale).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= start_date
-    ).all()
-    
-    if not sales:
+    if tenant is not None:
+        daily_revenues = [revenue for _, revenue, _ in tenant.daily_totals(start_date)]
+    else:
+        daily_revenues = [revenue for _, revenue in db.query(
+            Sale.sale_date, func.sum(Sale.total_amount_paise)
+        ).filter(
+            Sale.product_id.in_(product_ids),
+            Sale.sale_date >= start_date
+        ).group_by(Sale.sale_date).all()]
+    
+    if not daily_revenues:
         return {"slots": [], "baseline": 0}
     
-    daily_sales = {}
-    for sale in sales:
-        date_key = sale.sale_date
-        if date_key not in daily_sales:
-            daily_sales[date_key] = 0
-        daily_sales[date_key] += sale.total_amount
-    
-    baseline_revenues = list(daily_sales.values())
-    baseline_daily = np.mean(baseline_revenues) if baseline_revenues else 0
+    baseline_daily = to_rupees(sum(daily_revenues)) / len(daily_revenues)
     
+    # Same lift windows as the Media Impact page, read from the post_impacts table
+    impacts = get_post_impacts(db, business_id, posts)
     slot_impacts = []
     
     for post in posts:
         post_date = post.posted_at
-        
-        before_start = post_date - timedelta(days=7)
-        before_sales = sum(daily_sales.get(before_start + timedelta(days=i), 0) for i in range(7))
-        before_daily = before_sales / 7 if before_sales else baseline_daily
-        
-        after_sales = sum(daily_sales.get(post_date + timedelta(days=i), 0) for i in range(3))
-        after_daily = after_sales / 3 if after_sales else 0
-        
-        lift_percent = ((after_daily - before_daily) / before_daily * 100) if before_daily > 0 else 0
+        impact = impacts[post.id]
         
         hour_bucket = "morning"
         if post.post_time:
@@ -160,9 +183,9 @@ def calculate_post_impact_by_slot(db: Session, business_id: int) -> Dict[str, An
             "day_name": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"][post_date.weekday()],
             "time_bucket": hour_bucket,
             "post_type": post.post_type,
-            "lift_percent": lift_percent,
-            "post_daily": after_daily,
-            "baseline_daily": before_daily
+            "lift_percent": impact["lift_percent"],
+            "post_daily": impact["post_daily"],
+            "baseline_daily": impact["baseline_daily"]
         })
     
     return {
@@ -171,30 +194,62 @@ def calculate_post_impact_by_slot(db: Session, business_id: int) -> Dict[str, An
     }
 
 
-def train_post_impact_model(db: Session, business_id: int) -> Dict[str, Any]:
+def fit_post_impact_estimator(name: str, X: pd.DataFrame, y: pd.Series):
+    """Fit the named estimator on time-ordered rows; "hgb" early-stops on the most recent tail"""
+    if name == "gbr":
+        from sklearn.ensemble import GradientBoostingRegressor
+        
+        model = GradientBoostingRegressor(
+            n_estimators=100,
+            max_depth=4,
+            learning_rate=0.1,
+            random_state=42
+        )
+        return model.fit(X, y)
+    
+    if name == "hgb":
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        
+        n_val = int(len(X) * VALIDATION_FRACTION)
+        model = HistGradientBoostingRegressor(
+            max_iter=500,
+            learning_rate=0.1,
+            max_depth=4,
+            min_samples_leaf=min(20, max(2, len(X) // 20)),
+            categorical_features=[col for col in HGB_CATEGORICAL if col in X.columns],
+            early_stopping=n_val >= 5,
+            n_iter_no_change=20,
+            random_state=42
+        )
+        if n_val >= 5:
+            return model.fit(X.iloc[:-n_val], y.iloc[:-n_val], X_val=X.iloc[-n_val:], y_val=y.iloc[-n_val:])
+        return model.fit(X, y)
+    
+    raise ValueError(f"Unknown post impact estimator {name!r}")
+
+
+def model_file(business_id: int) -> str:
+    """Pickle of a business's trained post impact model"""
+    return f"post_impact_model_{business_id}.pkl"
+
+
+def train_post_impact_model(db: Session, business_id: int, estimator: str = None) -> Dict[str, Any]:
     """Train a tree-based model to predict sales based on posting patterns"""
     try:
-        from sklearn.ensemble import GradientBoostingRegressor
-        from sklearn.model_selection import train_test_split
         from sklearn.metrics import mean_absolute_error, r2_score
     except ImportError:
         return {"success": False, "error": "scikit-learn not installed"}
     
+    estimator = estimator or POST_IMPACT_ESTIMATOR
+    if estimator not in ESTIMATOR_FEATURES:
+        return {"success": False, "error": f"Unknown estimator '{estimator}'"}
+    
     df = get_sales_features(db, business_id)
     
     if df.empty or len(df) < 7:
         return {"success": False, "error": "Insufficient data. Need at least 7 days of sales."}
     
-    feature_cols = [
-        "day_of_week", "is_weekend",
-        "revenue_3d_avg", "revenue_7d_avg",
-        "orders_3d_avg", "orders_7d_avg",
-        "had_post", "had_post_yesterday", "had_post_2days", "had_post_3days",
-        "post_type_reel", "post_type_story", "post_type_image",
-        "dow_0", "dow_1", "dow_2", "dow_3", "dow_4", "dow_5", "dow_6"
-    ]
-    
-    available_cols = [col for col in feature_cols if col in df.columns]
+    available_cols = [col for col in ESTIMATOR_FEATURES[estimator] if col in df.columns]
     
     X = df[available_cols]
     y = df["revenue"]
@@ -202,40 +257,53 @@ def train_post_impact_model(db: Session, business_id: int) -> Dict[str, Any]:
     if len(X) < 7:
         return {"success": False, "error": "Not enough data for training"}
     
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Hold out the most recent days: a shuffled split would train on the future
+    n_test = max(2, int(len(X) * TEST_FRACTION))
+    X_train, X_test = X.iloc[:-n_test], X.iloc[-n_test:]
+    y_train, y_test = y.iloc[:-n_test], y.iloc[-n_test:]
     
-    model = GradientBoostingRegressor(
-        n_estimators=100,
-        max_depth=4,
-        learning_rate=0.1,
-        random_state=42
-    )
-    model.fit(X_train, y_train)
+    started = time_module.perf_counter()
+    model = fit_post_impact_estimator(estimator, X_train, y_train)
+    train_seconds = time_module.perf_counter() - started
+    instrumentation.observe("model_seconds", train_seconds, model="post_impact", op="train")
     
     y_pred = model.predict(X_test)
     mae = mean_absolute_error(y_test, y_pred)
     r2 = r2_score(y_test, y_pred)
     
-    feature_importance = dict(zip(available_cols, model.feature_importances_))
+    if hasattr(model, "feature_importances_"):
+        feature_importance = dict(zip(available_cols, model.feature_importances_))
+    else:
+        from sklearn.inspection import permutation_importance
+        # HistGradientBoosting has no impurity importances; use permutation importance on the
+        # held-out days, normalized to sum to 1 like feature_importances_
+        importance = np.maximum(
+            permutation_importance(model, X_test, y_test, n_repeats=5, random_state=42).importances_mean, 0
+        )
+        total = importance.sum()
+        feature_importance = dict(zip(available_cols, importance / total if total > 0 else importance))
     
     model_data = {
         "model": model,
+        "estimator": estimator,
         "features": available_cols,
         "business_id": business_id,
         "trained_at": datetime.now().isoformat(),
-        "metrics": {"mae": mae, "r2": r2},
+        "metrics": {"mae": mae, "r2": r2, "train_seconds": train_seconds},
         "feature_importance": feature_importance,
         "baseline_revenue": float(df["revenue"].mean())
     }
     
-    model_file = f"post_impact_model_{business_id}.pkl"
-    with open(model_file, 'wb') as f:
+    with open(model_file(business_id), 'wb') as f:
         pickle.dump(model_data, f)
     
     return {
         "success": True,
+        "estimator": estimator,
         "mae": round(mae, 2),
         "r2": round(r2, 3),
+        "train_seconds": round(train_seconds, 3),
+        "iterations": int(getattr(model, "n_iter_", getattr(model, "n_estimators_", 0))),
         "data_points": len(df),
         "feature_importance": {k: round(v, 4) for k, v in sorted(feature_importance.items(), key=lambda x: -x[1])[:5]}
     }
@@ -243,9 +311,9 @@ def train_post_impact_model(db: Session, business_id: int) -> Dict[str, Any]:
 
 def load_model(business_id: int) -> Optional[Dict[str, Any]]:
     """Load the trained model for a business"""
-    model_file = f"post_impact_model_{business_id}.pkl"
-    if os.path.exists(model_file):
-        with open(model_file, 'rb') as f:
+    path = model_file(business_id)
+    if os.path.exists(path):
+        with instrumentation.timer("model_seconds", model="post_impact", op="load"), open(path, 'rb') as f:
             return pickle.load(f)
     return None
 
@@ -275,6 +343,7 @@ def predict_revenue_for_scenario(
         "post_type_reel": 1 if post_type == "reel" else 0,
         "post_type_story": 1 if post_type == "story" else 0,
         "post_type_image": 1 if post_type == "image" else 0,
+        "post_type": POST_TYPE_CODES.get(post_type, 0) if had_post else 0,
     }
     
     for i in range(7):
@@ -282,49 +351,36 @@ def predict_revenue_for_scenario(
     
     X = pd.DataFrame([{col: row.get(col, 0) for col in features}])
     
-    return float(model.predict(X)[0])
+    with instrumentation.timer("model_seconds", model="post_impact", op="predict"):
+        return float(model.predict(X)[0])
 
 
-def get_best_posting_recommendation(db: Session, business_id: int) -> Dict[str, Any]:
+@instrumentation.timed("analytics_seconds")
+def get_best_posting_recommendation(db: Session, business_id: int,
+                                    slot_analysis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Get the best day/time/type recommendation for posting based on expected sales uplift"""
     
     model_data = load_model(business_id)
     
-    products = db.query(Product).filter(Product.business_id == business_id).all()
-    product_ids = [p.id for p in products]
+    tenant = get_tenant(db, business_id)
+    if tenant is not None:
+        product_ids = [int(pid) for pid in tenant.product_ids]
+    else:
+        product_ids = list(db.scalars(select(Product.id).where(Product.business_id == business_id)))
     
     if not product_ids:
         return {"error": "No products found", "recommendations": []}
     
     seven_days_ago = datetime.now().date() - timedelta(days=7)
-    recent_sales = db.query(Sale).filter(
-        Sale.product_id.in_(product_ids),
-        Sale.sale_date >= seven_days_ago
-    ).all()
+    def revenue_by_day(start=None):
+        totals = tenant.daily_totals(start) if tenant is not None else daily_totals(db, business_id, start)
+        return {day: revenue for day, revenue, _ in totals}
     
-    if recent_sales:
-        daily_revenues = {}
-        for sale in recent_sales:
-            date_key = sale.sale_date
-            if date_key not in daily_revenues:
-                daily_revenues[date_key] = 0
-            daily_revenues[date_key] += sale.total_amount
-        
-        recent_revenue_avg = sum(daily_revenues.values()) / max(len(daily_revenues), 1)
-    else:
-        all_sales = db.query(Sale).filter(Sale.product_id.in_(product_ids)).all()
-        if all_sales:
-            daily_revenues = {}
-            for sale in all_sales:
-                date_key = sale.sale_date
-                if date_key not in daily_revenues:
-                    daily_revenues[date_key] = 0
-                daily_revenues[date_key] += sale.total_amount
-            recent_revenue_avg = sum(daily_revenues.values()) / max(len(daily_revenues), 1)
-        else:
-            recent_revenue_avg = 1000
-    
-    slot_analysis = calculate_post_impact_by_slot(db, business_id)
+    daily_revenues = revenue_by_day(seven_days_ago) or revenue_by_day()
+    recent_revenue_avg = to_rupees(sum(daily_revenues.values())) / len(daily_revenues) if daily_revenues else 1000
+    
+    if slot_analysis is None:
+        slot_analysis = calculate_post_impact_by_slot(db, business_id)
     
     day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     post_types = ["reel", "story", "image"]
@@ -425,10 +481,13 @@ def get_best_posting_recommendation(db: Session, business_id: int) -> Dict[str,
     }
 
 
-def get_posting_insights(db: Session, business_id: int) -> Dict[str, Any]:
+@instrumentation.timed("analytics_seconds")
+def get_posting_insights(db: Session, business_id: int,
+                         slot_analysis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Get detailed posting insights and patterns"""
     
-    slot_analysis = calculate_post_impact_by_slot(db, business_id)
+    if slot_analysis is None:
+        slot_analysis = calculate_post_impact_by_slot(db, business_id)
     
     if not slot_analysis.get("slots"):
         return {
@@ -1,16 +1,162 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Date, Time
+from sqlalchemy import create_engine, event, update, Column, Integer, BigInteger, String, Float, Text, DateTime, ForeignKey, Date, Time, Index, PrimaryKeyConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, scoped_session, Session
+from sqlalchemy.sql import Select
 from datetime import datetime, time
+from typing import Dict, Optional
 import os
+import time as time_module
+
+import instrumentation
 
 DATABASE_URL = os.environ.get("DATABASE_URL") or "sqlite:///business_analytics.db"
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# SQLite production mode: WAL journaling, tuned pragmas, a read-only reader
+# pool and a single serialized writer connection.
+SQLITE_TUNING = os.environ.get("SQLITE_TUNING", "0") == "1"
+SQLITE_CACHE_KB = int(os.environ.get("SQLITE_CACHE_KB", "65536"))
+SQLITE_MMAP_BYTES = int(os.environ.get("SQLITE_MMAP_MB", "256")) * 1024 * 1024
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_READ_POOL_SIZE = int(os.environ.get("SQLITE_READ_POOL_SIZE", "8"))
+
+
+def _pool_settings() -> Dict:
+    """Connection pool settings for server databases, configurable from the environment"""
+    if DATABASE_URL.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+    }
+
+
+def _sqlite_tuning_enabled() -> bool:
+    return SQLITE_TUNING and DATABASE_URL.startswith("sqlite") and ":memory:" not in DATABASE_URL
+
+
+def _apply_sqlite_pragmas(dbapi_connection, writer: bool):
+    cursor = dbapi_connection.cursor()
+    if writer:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+if _sqlite_tuning_enabled():
+    engine = create_engine(DATABASE_URL, pool_size=1, max_overflow=0)
+    read_engine = create_engine(
+        f"sqlite:///file:{engine.url.database}?mode=ro&uri=true",
+        pool_size=SQLITE_READ_POOL_SIZE, max_overflow=0
+    )
+    event.listen(engine, "connect", lambda conn, record: _apply_sqlite_pragmas(conn, writer=True))
+    event.listen(read_engine, "connect", lambda conn, record: _apply_sqlite_pragmas(conn, writer=False))
+else:
+    engine = create_engine(DATABASE_URL, **_pool_settings())
+    read_engine = engine
+
+
+class ReadWriteSession(Session):
+    """Sends plain SELECTs to the read-only pool and flushes and all other statements to the writer.
+
+    Once a transaction has written, its SELECTs go to the writer too until it
+    commits or rolls back, so the session reads its own uncommitted writes.
+    """
+    _writing = False
+    
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._writing or self._flushing:
+            bind = engine
+        elif clause is None:
+            # ORM bulk DML asks for a connection by mapper alone; a bare
+            # session.connection() is treated as a read
+            bind = engine if mapper is not None else read_engine
+        else:
+            bind = read_engine if isinstance(clause, Select) else engine
+        if bind is engine:
+            self._writing = True
+        return bind
+
+
+@event.listens_for(ReadWriteSession, "after_commit")
+@event.listens_for(ReadWriteSession, "after_rollback")
+def _end_write_transaction(session):
+    session._writing = False
+
+
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine,
+    class_=ReadWriteSession if read_engine is not engine else Session
+)
+ScopedSession = scoped_session(SessionLocal)
 Base = declarative_base()
 
 
+def pool_status(pool_engine=None) -> Dict[str, int]:
+    pool = (pool_engine or engine).pool
+    return {
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0,
+        "overflow": max(0, pool.overflow()) if hasattr(pool, "overflow") else 0,
+        "size": pool.size() if hasattr(pool, "size") else 0,
+    }
+
+
+def record_pool_metrics():
+    for name, value in pool_status(engine).items():
+        instrumentation.set_gauge(f"db_pool_{name}", value, pool="write")
+    if read_engine is not engine:
+        for name, value in pool_status(read_engine).items():
+            instrumentation.set_gauge(f"db_pool_{name}", value, pool="read")
+
+
+for _pool_engine in {engine, read_engine}:
+    event.listen(_pool_engine, "checkout", lambda conn, record, proxy: record_pool_metrics())
+    event.listen(_pool_engine, "checkin", lambda conn, record: record_pool_metrics())
+
+
+def _instrument_queries(sql_engine, pool: str):
+    @event.listens_for(sql_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time_module.perf_counter()
+
+    @event.listens_for(sql_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        instrumentation.inc("sql_queries_total", pool=pool)
+        if started is not None:
+            instrumentation.observe("sql_query_seconds", time_module.perf_counter() - started, pool=pool)
+
+
+_instrument_queries(engine, "write")
+if read_engine is not engine:
+    _instrument_queries(read_engine, "read")
+
+
+def get_scoped_session() -> Session:
+    """Session shared by every caller in the current thread until remove_scoped_session().
+
+    The first call in a thread checks a connection out of the pool and
+    records how long that took.
+    """
+    if ScopedSession.registry.has():
+        return ScopedSession()
+    db = ScopedSession()
+    start = time_module.perf_counter()
+    db.connection()
+    instrumentation.observe("db_pool_wait_seconds", time_module.perf_counter() - start)
+    return db
+
+
+def remove_scoped_session():
+    ScopedSession.remove()
+
+
 class Business(Base):
     __tablename__ = "businesses"
     
@@ -21,23 +167,50 @@ class Business(Base):
     password_hash = Column(String(255), nullable=False)
     category = Column(String(100))
     created_at = Column(DateTime, default=datetime.utcnow)
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped on every data write
     
     products = relationship("Product", back_populates="business", cascade="all, delete-orphan")
     media_posts = relationship("MediaPost", back_populates="business", cascade="all, delete-orphan")
 
 
+def normalize_name(name: str) -> str:
+    return str(name).strip().lower()
+
+
+# Money is stored as integer paise so sums are exact; rupees only at the edges
+PAISE_PER_RUPEE = 100
+
+
+def to_paise(rupees) -> int:
+    return int(round(float(rupees) * PAISE_PER_RUPEE))
+
+
+def to_rupees(paise):
+    """Rupees for a paise amount or array of amounts"""
+    return paise / PAISE_PER_RUPEE
+
+
+def _product_name_key(context) -> str:
+    return normalize_name(context.get_current_parameters()["name"])
+
+
 class Product(Base):
     __tablename__ = "products"
     
     id = Column(Integer, primary_key=True, index=True)
     business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
     name = Column(String(255), nullable=False)
-    cost_price = Column(Float, nullable=False)
-    selling_price = Column(Float, nullable=False)
+    name_key = Column(String(255), nullable=False, default=_product_name_key)  # normalize_name(name), unique per business
+    cost_price_paise = Column(BigInteger, nullable=False)
+    selling_price_paise = Column(BigInteger, nullable=False)
     category = Column(String(100))
     
     business = relationship("Business", back_populates="products")
     sales = relationship("Sale", back_populates="product", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ux_products_business_name_key", "business_id", "name_key", unique=True),  # Upsert target of imports
+    )
 
 
 class Sale(Base):
@@ -46,11 +219,15 @@ class Sale(Base):
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False)
-    total_amount = Column(Float, nullable=False)
+    total_amount_paise = Column(BigInteger, nullable=False)
     sale_date = Column(Date, nullable=False)
     sale_time = Column(Time, nullable=True)  # Optional: time of sale for granular analysis
     
     product = relationship("Product", back_populates="sales")
+    
+    __table_args__ = (
+        Index("ix_sales_sale_date_id", "sale_date", "id"),  # Keyset pagination of recent sales
+    )
 
 
 class MediaPost(Base):
@@ -69,6 +246,79 @@ class MediaPost(Base):
     shares = Column(Integer, default=0)
     
     business = relationship("Business", back_populates="media_posts")
+    
+    __table_args__ = (
+        Index("ix_media_posts_business_posted_id", "business_id", "posted_at", "id"),  # Keyset pagination of posts
+    )
+
+
+class SaleIngestKey(Base):
+    """Client idempotency keys of sales pushed through the ingestion endpoint"""
+    __tablename__ = "sale_ingest_keys"
+    
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
+    idempotency_key = Column(String(128), nullable=False)
+    sale_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        PrimaryKeyConstraint("business_id", "idempotency_key"),
+    )
+
+
+class PrecomputedInsights(Base):
+    """Post recommendation results computed in the background, stored as JSON per business"""
+    __tablename__ = "precomputed_insights"
+    
+    business_id = Column(Integer, ForeignKey("businesses.id"), primary_key=True)
+    data_version = Column(Integer, nullable=False)  # Business.data_version the payload was computed from
+    computed_at = Column(DateTime, nullable=False)
+    payload = Column(Text, nullable=False)
+
+
+class PostImpact(Base):
+    """Sales lift of one media post, kept up to date as sales and posts are written"""
+    __tablename__ = "post_impacts"
+    
+    post_id = Column(Integer, ForeignKey("media_posts.id"), primary_key=True)
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
+    posted_at = Column(Date, nullable=False)  # Copy of MediaPost.posted_at for window lookups
+    baseline_daily = Column(Float, nullable=False)
+    post_daily = Column(Float, nullable=False)
+    lift_percent = Column(Float, nullable=False)
+    incremental_revenue = Column(Float, nullable=False)
+    computed_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_post_impacts_business_posted", "business_id", "posted_at"),
+    )
+
+
+class SalesHourlyRollup(Base):
+    """Sales per business, day, hour and product category, rebuilt from sales when the data version changes"""
+    __tablename__ = "sales_hourly_rollup"
+    
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
+    sale_date = Column(Date, nullable=False)
+    hour = Column(Integer, nullable=False)  # -1 for sales recorded without a time
+    category = Column(String(100), nullable=False)  # '' for uncategorized products
+    day_of_week = Column(Integer, nullable=False)  # Monday = 0
+    revenue_paise = Column(BigInteger, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    orders = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        PrimaryKeyConstraint("business_id", "sale_date", "hour", "category"),
+    )
+
+
+class SalesRollupState(Base):
+    """Business.data_version the sales rollup of a business was last built from"""
+    __tablename__ = "sales_rollup_state"
+    
+    business_id = Column(Integer, ForeignKey("businesses.id"), primary_key=True)
+    data_version = Column(Integer, nullable=False)
+    built_at = Column(DateTime, nullable=False)
 
 
 def init_db():
@@ -81,9 +331,8 @@ def run_migrations():
     """Run database migrations to add new columns if they don't exist"""
     from sqlalchemy import text, inspect
     
-    inspector = inspect(engine)
-    
     with engine.connect() as conn:
+        inspector = inspect(conn)
         media_post_columns = [col['name'] for col in inspector.get_columns('media_posts')]
         if 'post_time' not in media_post_columns:
             try:
@@ -105,6 +354,17 @@ def run_migrations():
             except Exception:
                 pass
         
+        business_columns = [col['name'] for col in inspector.get_columns('businesses')]
+        if 'data_version' not in business_columns:
+            try:
+                if 'sqlite' in str(engine.url):
+                    conn.execute(text("ALTER TABLE businesses ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0"))
+                else:
+                    conn.execute(text("ALTER TABLE businesses ADD COLUMN IF NOT EXISTS data_version INTEGER NOT NULL DEFAULT 0"))
+                conn.commit()
+            except Exception:
+                pass
+        
         sales_columns = [col['name'] for col in inspector.get_columns('sales')]
         if 'sale_time' not in sales_columns:
             try:
@@ -115,6 +375,113 @@ def run_migrations():
                 conn.commit()
             except Exception:
                 pass
+        
+        product_columns = [col['name'] for col in inspector.get_columns('products')]
+        if 'name_key' not in product_columns:
+            try:
+                conn.execute(text("ALTER TABLE products ADD COLUMN name_key VARCHAR(255)"))
+                conn.commit()
+            except Exception:
+                pass
+        _backfill_product_name_keys(conn)
+        
+        migrated_money = [
+            _migrate_money_column(conn, inspector, table, rupees_column) for table, rupees_column in MONEY_COLUMNS
+        ]
+        if any(migrated_money):
+            # Parquet mirrors and cached results keyed by data version hold rupees
+            conn.execute(text("UPDATE businesses SET data_version = data_version + 1"))
+            conn.commit()
+        
+        try:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sales_sale_date_id ON sales (sale_date, id)"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_media_posts_business_posted_id "
+                "ON media_posts (business_id, posted_at, id)"
+            ))
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_products_business_name_key "
+                "ON products (business_id, name_key)"
+            ))
+            conn.commit()
+        except Exception:
+            pass
+
+
+def _backfill_product_name_keys(conn):
+    """Set name_key on products created before it existed.
+
+    Products whose names already collide within a business keep their rows
+    and sales: the first one gets the plain key (the one name lookups and
+    imports match) and the others get ``<key>#<id>``.
+    """
+    from sqlalchemy import text
+    
+    rows = conn.execute(text("SELECT id, business_id, name FROM products WHERE name_key IS NULL ORDER BY id")).all()
+    if not rows:
+        return
+    taken = set(conn.execute(text(
+        "SELECT business_id, name_key FROM products WHERE name_key IS NOT NULL"
+    )).all())
+    updates = []
+    for product_id, business_id, name in rows:
+        key = normalize_name(name)
+        if (business_id, key) in taken:
+            key = f"{key}#{product_id}"
+        taken.add((business_id, key))
+        updates.append({"key": key, "id": product_id})
+    conn.execute(text("UPDATE products SET name_key = :key WHERE id = :id"), updates)
+    conn.commit()
+
+
+MONEY_COLUMNS = [
+    ("products", "cost_price"),
+    ("products", "selling_price"),
+    ("sales", "total_amount"),
+    ("sales_hourly_rollup", "revenue"),
+]
+
+
+def _migrate_money_column(conn, inspector, table: str, rupees_column: str) -> bool:
+    """Replace a float rupees column with a BIGINT ``<column>_paise`` column holding the rounded paise.
+
+    Add, copy and drop run in one transaction, so a failed migration leaves
+    the float column in place for the next start to retry.
+    """
+    from sqlalchemy import text
+    
+    columns = [col['name'] for col in inspector.get_columns(table)]
+    if rupees_column not in columns:
+        return False
+    paise_column = f"{rupees_column}_paise"
+    try:
+        if paise_column not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {paise_column} BIGINT NOT NULL DEFAULT 0"))
+        if 'sqlite' in str(engine.url):
+            conn.execute(text(f"UPDATE {table} SET {paise_column} = CAST(ROUND({rupees_column} * 100) AS INTEGER)"))
+        else:
+            conn.execute(text(
+                f"UPDATE {table} SET {paise_column} = ROUND(CAST({rupees_column} AS NUMERIC) * 100)::BIGINT"
+            ))
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {rupees_column}"))
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        return False
+
+
+def bump_data_version(db: Session, business_id: int, commit: bool = True) -> Optional[int]:
+    """Increment a business's data version so cached API responses go stale; returns the new version"""
+    version = db.execute(
+        update(Business)
+        .where(Business.id == business_id)
+        .values(data_version=Business.data_version + 1)
+        .returning(Business.data_version)
+    ).scalar()
+    if commit:
+        db.commit()
+    return version
 
 
 def get_db():
@@ -0,0 +1,81 @@
+"""Concurrent loading of a page's independent analytics panels.
+
+A page declares each panel as a function of a database session. The
+functions run on a process-wide pool of ``PANEL_WORKERS`` threads, each
+with its own pooled session, and the page renders each panel as its data
+arrives. Page time is then roughly that of the slowest panel instead of the
+sum of all of them. ``PANEL_WORKERS=1``, or profiling the page, loads the
+panels one after another in the page's own thread.
+"""
+import logging
+import os
+import threading
+import time as time_module
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import instrumentation
+import profiling
+from models import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+PANEL_WORKERS = int(os.environ.get("PANEL_WORKERS", "4"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PANEL_WORKERS, thread_name_prefix="panel")
+        return _executor
+
+
+def _run_panel(name: str, fn: Callable[[Session], Any]) -> Any:
+    db = SessionLocal()
+    started = time_module.perf_counter()
+    try:
+        return fn(db)
+    except Exception:
+        # The page only shows a generic error for the panel, so keep the traceback here
+        logger.exception("Panel %r failed to load", name)
+        raise
+    finally:
+        db.close()
+        instrumentation.observe("panel_load_seconds", time_module.perf_counter() - started, panel=name)
+
+
+class PanelLoader:
+    """Starts every panel's data function at once; yields results in completion order."""
+
+    def __init__(self, panels: Dict[str, Callable[[Session], Any]], workers: int = PANEL_WORKERS):
+        self.started = time_module.perf_counter()
+        self._panels = panels
+        self._futures = {}
+        # A profiled page loads its panels in its own thread so the profiler sees them
+        if workers > 1 and not profiling.is_profiling():
+            executor = _get_executor()
+            self._futures = {executor.submit(_run_panel, name, fn): name for name, fn in panels.items()}
+
+    def as_completed(self) -> Iterator[Tuple[str, Any, Optional[BaseException]]]:
+        """(name, result, error) per panel; error is the exception the panel raised, if any"""
+        if not self._futures:
+            for name, fn in self._panels.items():
+                try:
+                    yield name, _run_panel(name, fn), None
+                except Exception as e:
+                    yield name, None, e
+            return
+
+        for future in as_completed(self._futures):
+            error = future.exception()
+            yield self._futures[future], None if error else future.result(), error
+
+    @property
+    def elapsed(self) -> float:
+        return time_module.perf_counter() - self.started
@@ -0,0 +1,204 @@
+"""Parquet export and import of a business's products, sales and media posts.
+
+An export is a zip archive with ``products.parquet``, ``sales.parquet`` and
+``media_posts.parquet``. Rows are streamed from the database in chunks and
+dates and times keep their types, and money columns hold integer paise.
+Imports bulk insert in chunks and remap product ids to the rows created in
+the target business. Archives exported before money was stored in paise
+(float rupee columns) are converted on import.
+"""
+import io
+import time as time_module
+import zipfile
+from typing import Any, BinaryIO, Dict
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+import instrumentation
+from models import Product, Sale, MediaPost, normalize_name, to_paise
+from product_catalog import upsert_products
+import post_impacts
+
+CHUNK_ROWS = 50_000
+COMPRESSION = "zstd"
+
+
+def export_schemas():
+    """Arrow schema of each exported table, by table name"""
+    import pyarrow as pa
+
+    return {
+        "products": pa.schema([
+            ("id", pa.int64()),
+            ("name", pa.string()),
+            ("cost_price_paise", pa.int64()),
+            ("selling_price_paise", pa.int64()),
+            ("category", pa.string()),
+        ]),
+        "sales": pa.schema([
+            ("id", pa.int64()),
+            ("product_id", pa.int64()),
+            ("quantity", pa.int64()),
+            ("total_amount_paise", pa.int64()),
+            ("sale_date", pa.date32()),
+            ("sale_time", pa.time64("us")),
+        ]),
+        "media_posts": pa.schema([
+            ("id", pa.int64()),
+            ("post_type", pa.string()),
+            ("caption", pa.string()),
+            ("posted_at", pa.date32()),
+            ("post_time", pa.time64("us")),
+            ("platform", pa.string()),
+            ("impressions", pa.int64()),
+            ("likes", pa.int64()),
+            ("comments", pa.int64()),
+            ("shares", pa.int64()),
+        ]),
+    }
+
+
+def export_queries(business_id: int):
+    """SELECT of each exported table for one business, by table name"""
+    business_products = select(Product.id).where(Product.business_id == business_id)
+    return {
+        "products": select(
+            Product.id, Product.name, Product.cost_price_paise, Product.selling_price_paise, Product.category
+        ).where(Product.business_id == business_id).order_by(Product.id),
+        "sales": select(
+            Sale.id, Sale.product_id, Sale.quantity, Sale.total_amount_paise, Sale.sale_date, Sale.sale_time
+        ).where(Sale.product_id.in_(business_products)).order_by(Sale.id),
+        "media_posts": select(
+            MediaPost.id, MediaPost.post_type, MediaPost.caption, MediaPost.posted_at, MediaPost.post_time,
+            MediaPost.platform, MediaPost.impressions, MediaPost.likes, MediaPost.comments, MediaPost.shares
+        ).where(MediaPost.business_id == business_id).order_by(MediaPost.id),
+    }
+
+
+def write_parquet(db: Session, query, schema, sink) -> int:
+    """Stream a query's rows into a Parquet file or buffer in CHUNK_ROWS batches; returns the row count"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    count = 0
+    result = db.connection().execution_options(stream_results=True).execute(query)
+    with pq.ParquetWriter(sink, schema, compression=COMPRESSION) as writer:
+        for rows in result.partitions(CHUNK_ROWS):
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema
+            ))
+            count += len(rows)
+    return count
+
+
+def export_business(db: Session, business_id: int, fileobj: BinaryIO) -> Dict[str, Any]:
+    """Write a business's data to ``fileobj`` as a zip of Parquet files"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return {"success": False, "error": "pyarrow not installed"}
+
+    schemas = export_schemas()
+    counts = {}
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_STORED) as archive:
+        for table, query in export_queries(business_id).items():
+            buffer = io.BytesIO()
+            counts[table] = write_parquet(db, query, schemas[table], buffer)
+            archive.writestr(f"{table}.parquet", buffer.getvalue())
+
+    return {"success": True, **counts}
+
+
+def import_business(db: Session, business_id: int, fileobj: BinaryIO) -> Dict[str, Any]:
+    """Bulk insert an export produced by export_business into ``business_id``"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return {"success": False, "error": "pyarrow not installed"}
+
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        return {"success": False, "error": "Not a Parquet export archive"}
+
+    names = set(archive.namelist())
+    if "products.parquet" not in names:
+        return {"success": False, "error": "Archive has no products.parquet"}
+
+    def batches(name):
+        if name not in names:
+            return
+        parquet = pq.ParquetFile(io.BytesIO(archive.read(name)))
+        for batch in parquet.iter_batches(batch_size=CHUNK_ROWS):
+            yield batch.to_pydict()
+
+    def paise(cols, column):
+        if f"{column}_paise" in cols:
+            return cols[f"{column}_paise"]
+        return [to_paise(rupees) for rupees in cols[column]]  # Older archive in rupees
+
+    started = time_module.perf_counter()
+    counts = {"products": 0, "sales": 0, "media_posts": 0, "skipped_sales": 0}
+    product_id_map = {}
+
+    for cols in batches("products.parquet"):
+        rows = [{
+            "name": name,
+            "cost_price_paise": cost,
+            "selling_price_paise": price,
+            "category": category
+        } for name, cost, price, category in zip(
+            cols["name"], paise(cols, "cost_price"), paise(cols, "selling_price"), cols["category"]
+        )]
+        # Products already in the business (same normalized name) are updated and their sales kept
+        new_ids = upsert_products(db, business_id, rows)
+        product_id_map.update((old_id, new_ids[normalize_name(name)]) for old_id, name in zip(cols["id"], cols["name"]))
+        counts["products"] += len(rows)
+
+    for cols in batches("sales.parquet"):
+        rows = []
+        for product_id, quantity, amount, sale_date, sale_time in zip(
+            cols["product_id"], cols["quantity"], paise(cols, "total_amount"), cols["sale_date"], cols["sale_time"]
+        ):
+            new_id = product_id_map.get(product_id)
+            if new_id is None:
+                counts["skipped_sales"] += 1
+                continue
+            rows.append({
+                "product_id": new_id,
+                "quantity": quantity,
+                "total_amount_paise": amount,
+                "sale_date": sale_date,
+                "sale_time": sale_time
+            })
+        if rows:
+            db.execute(insert(Sale), rows)
+            counts["sales"] += len(rows)
+
+    for cols in batches("media_posts.parquet"):
+        rows = [{
+            "business_id": business_id,
+            "post_type": cols["post_type"][i],
+            "caption": cols["caption"][i],
+            "posted_at": cols["posted_at"][i],
+            "post_time": cols["post_time"][i],
+            "platform": cols["platform"][i] or "instagram",
+            "impressions": cols["impressions"][i] or 0,
+            "likes": cols["likes"][i] or 0,
+            "comments": cols["comments"][i] or 0,
+            "shares": cols["shares"][i] or 0
+        } for i in range(len(cols["id"]))]
+        if rows:
+            db.execute(insert(MediaPost), rows)
+            counts["media_posts"] += len(rows)
+
+    db.commit()
+    # Scored after the import is committed, like demo data, so the rebuild reads the imported rows
+    post_impacts.rebuild(db, business_id)
+    for table in ("products", "sales", "media_posts"):
+        instrumentation.inc("import_rows_total", counts[table], source="parquet", table=table)
+    instrumentation.observe("import_seconds", time_module.perf_counter() - started, source="parquet")
+    return {"success": True, **counts}
@@ -0,0 +1,180 @@
+"""Persisted sales lift of every media post.
+
+A post's impact compares average daily revenue over the ``BEFORE_DAYS`` days
+before it with the post day and the ``AFTER_DAYS`` days after it. Results
+live in ``post_impacts``, one row per post, and every Media Impact and
+recommendation function reads them from there. Window revenue is summed in
+integer paise; the stored averages and incremental revenue are rupees.
+
+Writers keep the table current. A new post is scored on insert. A new sale
+rescores only the posts whose before or after window covers the sale date.
+Bulk loads rebuild the whole business. A post without a row, for example one
+written by a path that does not call these hooks, is scored the first time
+it is read.
+"""
+import bisect
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+from sqlalchemy import delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import instrumentation
+from models import MediaPost, PostImpact, Product, Sale, to_rupees
+
+BEFORE_DAYS = 7
+AFTER_DAYS = 3  # days after the post day; the after window is AFTER_DAYS + 1 days long
+
+# Posts dated in this range around a sale date have the sale inside one of their windows
+_SALE_AFFECTS_POSTS_FROM = timedelta(days=-AFTER_DAYS)
+_SALE_AFFECTS_POSTS_TO = timedelta(days=BEFORE_DAYS)
+
+IMPACT_FIELDS = ("baseline_daily", "post_daily", "lift_percent", "incremental_revenue")
+
+
+def impact_from_window_sums(before_paise: int, after_paise: int) -> Dict[str, float]:
+    """Lift of the after window over the before window, from their total revenue in paise"""
+    after_days = AFTER_DAYS + 1
+    baseline_daily = to_rupees(before_paise) / BEFORE_DAYS
+    post_daily = to_rupees(after_paise) / after_days
+
+    lift_percent = ((post_daily - baseline_daily) / baseline_daily * 100) if baseline_daily > 0 else 0
+    incremental_revenue = (post_daily - baseline_daily) * after_days if baseline_daily > 0 else 0
+
+    return {
+        "baseline_daily": round(baseline_daily, 2),
+        "post_daily": round(post_daily, 2),
+        "lift_percent": round(lift_percent, 1),
+        "incremental_revenue": round(max(0, incremental_revenue), 2)
+    }
+
+
+def compute_impacts(db: Session, business_id: int, posts: Sequence) -> Dict[int, Dict[str, float]]:
+    """Score (id, posted_at) posts from one GROUP BY of daily revenue over their combined windows"""
+    if not posts:
+        return {}
+
+    start = min(p.posted_at for p in posts) - timedelta(days=BEFORE_DAYS)
+    end = max(p.posted_at for p in posts) + timedelta(days=AFTER_DAYS)
+    rows = db.query(Sale.sale_date, func.sum(Sale.total_amount_paise)).join(
+        Product, Sale.product_id == Product.id
+    ).filter(
+        Product.business_id == business_id,
+        Sale.sale_date >= start,
+        Sale.sale_date <= end
+    ).group_by(Sale.sale_date).all()
+
+    daily = np.zeros((end - start).days + 1, dtype=np.int64)
+    for sale_date, revenue in rows:
+        daily[(sale_date - start).days] = revenue
+    cumsum = np.concatenate([[0], np.cumsum(daily)])
+
+    impacts = {}
+    for post in posts:
+        offset = (post.posted_at - start).days
+        before_sales = cumsum[offset] - cumsum[offset - BEFORE_DAYS]
+        after_sales = cumsum[offset + AFTER_DAYS + 1] - cumsum[offset]
+        impacts[post.id] = impact_from_window_sums(int(before_sales), int(after_sales))
+    return impacts
+
+
+def _store(db: Session, business_id: int, posts: Sequence, impacts: Dict[int, Dict[str, float]], commit: bool):
+    """Upsert impact rows by post_id, so concurrent writers rescoring the same post do not conflict"""
+    if not posts:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Post impact upserts are not supported on {dialect}")
+
+    computed_at = datetime.utcnow()
+    stmt = insert(PostImpact)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PostImpact.post_id],
+        set_={c: stmt.excluded[c] for c in ("posted_at", "computed_at") + IMPACT_FIELDS}
+    )
+    db.execute(stmt, [{
+        "post_id": p.id,
+        "business_id": business_id,
+        "posted_at": p.posted_at,
+        "computed_at": computed_at,
+        **impacts[p.id]
+    } for p in posts])
+    if commit:
+        db.commit()
+
+
+def update_for_posts(db: Session, business_id: int, post_ids: Iterable[int], commit: bool = True) -> int:
+    """Score newly written posts; returns how many were scored"""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return 0
+    posts = db.query(MediaPost.id, MediaPost.posted_at).filter(
+        MediaPost.business_id == business_id,
+        MediaPost.id.in_(post_ids)
+    ).all()
+    _store(db, business_id, posts, compute_impacts(db, business_id, posts), commit)
+    return len(posts)
+
+
+def update_for_sales(db: Session, business_id: int, sale_dates: Iterable[date], commit: bool = True) -> int:
+    """Rescore the posts whose windows cover any of the given sale dates; returns how many"""
+    sale_dates = sorted(set(sale_dates))
+    if not sale_dates:
+        return 0
+    candidates = db.query(MediaPost.id, MediaPost.posted_at).filter(
+        MediaPost.business_id == business_id,
+        MediaPost.posted_at >= sale_dates[0] + _SALE_AFFECTS_POSTS_FROM,
+        MediaPost.posted_at <= sale_dates[-1] + _SALE_AFFECTS_POSTS_TO
+    ).all()
+
+    # Keep posts that have a sale date within [posted_at - BEFORE_DAYS, posted_at + AFTER_DAYS]
+    posts = []
+    for post in candidates:
+        i = bisect.bisect_left(sale_dates, post.posted_at - _SALE_AFFECTS_POSTS_TO)
+        if i < len(sale_dates) and sale_dates[i] <= post.posted_at - _SALE_AFFECTS_POSTS_FROM:
+            posts.append(post)
+
+    _store(db, business_id, posts, compute_impacts(db, business_id, posts), commit)
+    return len(posts)
+
+
+def rebuild(db: Session, business_id: int, commit: bool = True) -> int:
+    """Rescore every post of a business, e.g. after a bulk import"""
+    db.execute(delete(PostImpact).where(PostImpact.business_id == business_id))
+    posts = db.query(MediaPost.id, MediaPost.posted_at).filter(MediaPost.business_id == business_id).all()
+    _store(db, business_id, posts, compute_impacts(db, business_id, posts), commit=False)
+    if commit:
+        db.commit()
+    return len(posts)
+
+
+def get_post_impacts(db: Session, business_id: int, posts: Sequence) -> Dict[int, Dict[str, float]]:
+    """Stored impacts of the given posts by post id; posts without a row are scored and stored now"""
+    if not posts:
+        return {}
+
+    query = db.query(PostImpact.post_id, *[getattr(PostImpact, f) for f in IMPACT_FIELDS])
+    if len(posts) <= 500:
+        query = query.filter(PostImpact.post_id.in_([p.id for p in posts]))
+    else:
+        query = query.filter(PostImpact.business_id == business_id)
+    impacts = {row[0]: dict(zip(IMPACT_FIELDS, row[1:])) for row in query.all()}
+
+    missing = [p for p in posts if p.id not in impacts]
+    instrumentation.inc("cache_requests_total", len(posts) - len(missing), cache="post_impacts", result="hit")
+    if missing:
+        instrumentation.inc("cache_requests_total", len(missing), cache="post_impacts", result="miss")
+        scored = compute_impacts(db, business_id, missing)
+        try:
+            _store(db, business_id, missing, scored, commit=True)
+        except IntegrityError:
+            # The post was deleted while it was being scored
+            db.rollback()
+        impacts.update(scored)
+    return impacts
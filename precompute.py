@@ -0,0 +1,228 @@
+"""Background precomputation of the Post Recommendations page.
+
+Recommendations, posting insights and posting-time analysis all start from
+the same 180-day slot analysis, so they are computed together and stored as
+one JSON row per business in ``precomputed_insights``. A scheduler thread
+polls ``Business.data_version`` and recomputes a business once its version
+has stopped changing for ``PRECOMPUTE_DEBOUNCE_SECONDS``, and recomputes
+everyone once a night after ``PRECOMPUTE_NIGHTLY_HOUR`` (the analyses use
+rolling windows). The page reads the stored row with a single primary-key
+lookup. The same refresh rebuilds the business's hourly sales rollup behind
+the Sales Heatmap page and, with ``DUCKDB_ANALYTICS=parquet``, its DuckDB
+Parquet mirror.
+
+    python precompute.py --once     # refresh everything that is due, then exit
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import columnar_store
+import instrumentation
+from models import SessionLocal, Business, PrecomputedInsights
+from duckdb_engine import refresh_mirror
+from analytics import get_post_timing_analysis, refresh_sales_rollup
+from ml_engine import calculate_post_impact_by_slot, get_best_posting_recommendation, get_posting_insights
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_DEBOUNCE_SECONDS = int(os.environ.get("PRECOMPUTE_DEBOUNCE_SECONDS", "30"))
+PRECOMPUTE_POLL_SECONDS = int(os.environ.get("PRECOMPUTE_POLL_SECONDS", "10"))
+PRECOMPUTE_NIGHTLY_HOUR = int(os.environ.get("PRECOMPUTE_NIGHTLY_HOUR", "2"))
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def compute_payload(db: Session, business_id: int) -> Dict[str, Any]:
+    """Run the post recommendation analyses, sharing one slot analysis between them"""
+    slot_analysis = calculate_post_impact_by_slot(db, business_id)
+    return {
+        "recommendation": get_best_posting_recommendation(db, business_id, slot_analysis),
+        "insights": get_posting_insights(db, business_id, slot_analysis),
+        "timing": get_post_timing_analysis(db, business_id)
+    }
+
+
+def refresh_business(db: Session, business_id: int) -> Dict[str, Any]:
+    """Recompute and store one business's results; returns them in get_precomputed's shape"""
+    # Read the version first so writes that land during the computation leave the row stale
+    version = db.query(Business.data_version).filter(Business.id == business_id).scalar() or 0
+    columnar_store.sync_version(business_id, version)
+    refresh_sales_rollup(db, business_id)
+    refresh_mirror(db, business_id)
+    payload = json.loads(json.dumps(compute_payload(db, business_id), default=_json_default))
+    computed_at = datetime.utcnow()
+
+    try:
+        db.merge(PrecomputedInsights(
+            business_id=business_id,
+            data_version=version,
+            computed_at=computed_at,
+            payload=json.dumps(payload)
+        ))
+        db.commit()
+    except IntegrityError:
+        # Another refresh inserted the row first; its result is just as fresh
+        db.rollback()
+
+    return {"payload": payload, "computed_at": computed_at, "stale": False}
+
+
+def get_precomputed(db: Session, business_id: int) -> Optional[Dict[str, Any]]:
+    """Stored results for a business, or None if it has never been computed"""
+    row = db.query(
+        PrecomputedInsights.payload,
+        PrecomputedInsights.computed_at,
+        PrecomputedInsights.data_version,
+        Business.data_version.label("current_version")
+    ).join(Business, Business.id == PrecomputedInsights.business_id).filter(
+        PrecomputedInsights.business_id == business_id
+    ).first()
+
+    if row is None:
+        instrumentation.inc("cache_requests_total", cache="precomputed_insights", result="miss")
+        return None
+    stale = row.data_version != row.current_version
+    instrumentation.inc("cache_requests_total", cache="precomputed_insights", result="stale" if stale else "hit")
+    return {
+        "payload": json.loads(row.payload),
+        "computed_at": row.computed_at,
+        "stale": stale
+    }
+
+
+def _last_nightly_run_utc() -> datetime:
+    """Most recent PRECOMPUTE_NIGHTLY_HOUR in local time, as a UTC timestamp like computed_at"""
+    now = datetime.now()
+    cutoff = datetime.combine(now.date(), time(PRECOMPUTE_NIGHTLY_HOUR))
+    if now < cutoff:
+        cutoff -= timedelta(days=1)
+    return cutoff - (now - datetime.utcnow())
+
+
+class PrecomputeScheduler:
+    """Polls data versions and refreshes businesses whose results are out of date."""
+
+    def __init__(self, debounce_seconds: int = PRECOMPUTE_DEBOUNCE_SECONDS,
+                 poll_seconds: int = PRECOMPUTE_POLL_SECONDS, session_factory=SessionLocal):
+        self.debounce_seconds = debounce_seconds
+        self.poll_seconds = poll_seconds
+        self._session_factory = session_factory
+        self._changed: Dict[int, tuple] = {}  # business_id -> (data_version, first seen at)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def due_businesses(self, db: Session, debounce: bool = True) -> List[int]:
+        now = time_module.monotonic()
+        nightly_cutoff = _last_nightly_run_utc()
+        rows = db.query(
+            Business.id,
+            Business.data_version,
+            PrecomputedInsights.data_version,
+            PrecomputedInsights.computed_at
+        ).outerjoin(PrecomputedInsights, PrecomputedInsights.business_id == Business.id).all()
+
+        due = []
+        for business_id, version, computed_version, computed_at in rows:
+            if computed_version is not None and computed_version == version:
+                self._changed.pop(business_id, None)
+                if computed_at < nightly_cutoff:
+                    due.append(business_id)
+                continue
+
+            seen = self._changed.get(business_id)
+            if seen is None or seen[0] != version:
+                # New change: restart the debounce window
+                self._changed[business_id] = (version, now)
+                if debounce:
+                    continue
+            if not debounce or now - self._changed[business_id][1] >= self.debounce_seconds:
+                due.append(business_id)
+        return due
+
+    def run_once(self, debounce: bool = True) -> int:
+        """Refresh every business that is due; returns how many were refreshed"""
+        db = self._session_factory()
+        refreshed = 0
+        try:
+            for business_id in self.due_businesses(db, debounce):
+                started = time_module.perf_counter()
+                try:
+                    refresh_business(db, business_id)
+                    self._changed.pop(business_id, None)
+                    refreshed += 1
+                    logger.info("Precomputed insights for business %d in %.2fs",
+                                business_id, time_module.perf_counter() - started)
+                except Exception:
+                    db.rollback()
+                    logger.exception("Precompute failed for business %d", business_id)
+                    if business_id in self._changed:
+                        # Back off for one debounce window before retrying
+                        self._changed[business_id] = (self._changed[business_id][0], time_module.monotonic())
+        finally:
+            db.close()
+        return refreshed
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="precompute", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Precompute poll failed")
+
+
+_scheduler: Optional[PrecomputeScheduler] = None
+
+
+def start_scheduler() -> PrecomputeScheduler:
+    """Start the process-wide scheduler (idempotent)"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = PrecomputeScheduler()
+    _scheduler.start()
+    return _scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="refresh everything that is due and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from models import init_db
+    init_db()
+    scheduler = PrecomputeScheduler()
+    if args.once:
+        print(f"Refreshed {scheduler.run_once(debounce=False)} businesses")
+        return
+    scheduler.run_forever()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,158 @@
+"""Per-business product catalog cached in process.
+
+Analytics functions aggregate sales by product id in SQL and then need the
+product's name, category and prices. The catalog loads a business's products
+once and indexes them by id and by normalized name. Cost and selling prices
+are kept as integer paise NumPy arrays so profit can be computed exactly for
+many products in one operation.
+
+Catalogs are evicted least-recently-used beyond ``PRODUCT_CATALOG_MAX_BUSINESSES``.
+Writers call ``invalidate`` once their product changes are committed. Writes made by
+another process are picked up after ``PRODUCT_CATALOG_TTL_SECONDS``, or right
+away when a caller asks for a product id the catalog does not know.
+"""
+import os
+import threading
+import time as time_module
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import instrumentation
+from models import Product, normalize_name
+from columnar_store import ProductRecord
+
+PRODUCT_CATALOG_TTL_SECONDS = int(os.environ.get("PRODUCT_CATALOG_TTL_SECONDS", "300"))
+PRODUCT_CATALOG_MAX_BUSINESSES = int(os.environ.get("PRODUCT_CATALOG_MAX_BUSINESSES", "256"))
+PRODUCT_UPSERT_CHUNK_ROWS = int(os.environ.get("PRODUCT_UPSERT_CHUNK_ROWS", "1000"))
+UPSERT_COLUMNS = ("name", "cost_price_paise", "selling_price_paise", "category")
+
+
+class ProductCatalog:
+    """Products of one business, indexed by id and by normalized name."""
+
+    def __init__(self, business_id: int, products: List[tuple]):
+        self.business_id = business_id
+        self.loaded_at = time_module.monotonic()
+        self.records = [ProductRecord(*p) for p in products]
+
+        self.ids = np.array([p.id for p in self.records], dtype=np.int64)
+        self.names = [p.name for p in self.records]
+        self.categories = [p.category for p in self.records]
+        self.cost_price_paise = np.array([p.cost_price_paise for p in self.records], dtype=np.int64)
+        self.selling_price_paise = np.array([p.selling_price_paise for p in self.records], dtype=np.int64)
+        self._by_id = {p.id: i for i, p in enumerate(self.records)}
+        # First product wins when two names only differ by case or whitespace
+        self._by_name = {}
+        for i, p in enumerate(self.records):
+            self._by_name.setdefault(normalize_name(p.name), i)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def unit_profit(self) -> np.ndarray:
+        """Profit per unit in paise"""
+        return self.selling_price_paise - self.cost_price_paise
+
+    @property
+    def margin_percent(self) -> np.ndarray:
+        """Profit as a percentage of selling price; 0 for products priced at 0"""
+        return margin_percent(self.unit_profit, self.selling_price_paise)
+
+    def get(self, product_id: int) -> Optional[ProductRecord]:
+        i = self._by_id.get(product_id)
+        return self.records[i] if i is not None else None
+
+    def by_name(self, name: str) -> Optional[ProductRecord]:
+        i = self._by_name.get(normalize_name(name))
+        return self.records[i] if i is not None else None
+
+    def covers(self, product_ids: Iterable[int]) -> bool:
+        return all(pid in self._by_id for pid in product_ids)
+
+    def indices(self, product_ids: Iterable[int]) -> np.ndarray:
+        """Catalog positions of the given product ids; raises KeyError for unknown ids"""
+        return np.fromiter((self._by_id[pid] for pid in product_ids), dtype=np.int64)
+
+
+def margin_percent(unit_profit: np.ndarray, selling_price: np.ndarray) -> np.ndarray:
+    """Unit profit as a percentage of selling price (both in paise); 0 where the price is 0"""
+    return np.divide(
+        unit_profit * 100, selling_price, out=np.zeros(len(selling_price)), where=selling_price > 0
+    )
+
+
+_catalogs: "OrderedDict[int, ProductCatalog]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _load(db: Session, business_id: int) -> ProductCatalog:
+    rows = db.query(
+        Product.id, Product.name, Product.category, Product.cost_price_paise, Product.selling_price_paise
+    ).filter(Product.business_id == business_id).order_by(Product.id).all()
+    return ProductCatalog(business_id, [tuple(r) for r in rows])
+
+
+def get_catalog(db: Session, business_id: int, product_ids: Optional[Iterable[int]] = None,
+                refresh: bool = False) -> ProductCatalog:
+    """Cached catalog of a business, reloaded if expired, invalidated or missing any of ``product_ids``"""
+    with _lock:
+        catalog = _catalogs.get(business_id)
+        if catalog is not None:
+            _catalogs.move_to_end(business_id)
+
+    if (catalog is None or refresh
+            or time_module.monotonic() - catalog.loaded_at > PRODUCT_CATALOG_TTL_SECONDS
+            or (product_ids is not None and not catalog.covers(product_ids))):
+        instrumentation.inc("cache_requests_total", cache="product_catalog", result="miss")
+        catalog = _load(db, business_id)
+        with _lock:
+            _catalogs[business_id] = catalog
+            _catalogs.move_to_end(business_id)
+            while len(_catalogs) > PRODUCT_CATALOG_MAX_BUSINESSES:
+                _catalogs.popitem(last=False)
+    else:
+        instrumentation.inc("cache_requests_total", cache="product_catalog", result="hit")
+    return catalog
+
+
+def invalidate(business_id: int):
+    """Drop a business's catalog after its products were added, changed or deleted"""
+    with _lock:
+        _catalogs.pop(business_id, None)
+
+
+def upsert_products(db: Session, business_id: int, rows: List[Dict[str, Any]],
+                    chunk_rows: int = PRODUCT_UPSERT_CHUNK_ROWS) -> Dict[str, int]:
+    """Insert or update products by normalized name with one INSERT ... ON CONFLICT per chunk.
+
+    The last row wins for repeated names. Returns normalized name -> product
+    id; the caller commits and then invalidates the catalog.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Product upserts are not supported on {dialect}")
+
+    by_key = {normalize_name(row["name"]): row for row in rows}
+    values = [
+        {"business_id": business_id, "name_key": key, **{c: row[c] for c in UPSERT_COLUMNS}}
+        for key, row in by_key.items()
+    ]
+    stmt = insert(Product)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Product.business_id, Product.name_key],
+        set_={c: stmt.excluded[c] for c in UPSERT_COLUMNS}
+    ).returning(Product.name_key, Product.id)
+    ids = {}
+    for i in range(0, len(values), chunk_rows):
+        # Executemany with RETURNING is sent as one multi-row INSERT per chunk ("insertmanyvalues")
+        chunk = values[i:i + chunk_rows]
+        ids.update(db.execute(stmt.execution_options(insertmanyvalues_page_size=chunk_rows), chunk).all())
+    return ids
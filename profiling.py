@@ -0,0 +1,192 @@
+"""Admin page profiling: cProfile, SQL timing and tracemalloc for one page run.
+
+Admins (``ADMIN_EMAILS``) get a profile of every page they open when
+``PROFILE_PAGES=1``, or of one page by adding ``?profile=1`` to its URL.
+The page's ``show_*`` function runs under cProfile with tracemalloc tracing.
+SQLAlchemy cursor events time each statement the page's thread executes.
+Dashboard panels run in the page's thread while it is profiled, so that
+their work is included. The report goes to a timestamped file under
+``PROFILE_REPORT_DIR`` and its summary is shown on the page. Nothing is
+hooked while no page is being profiled.
+
+cProfile and tracemalloc are process-wide, so one page is profiled at a time
+and the allocation figures include other sessions' threads.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time as time_module
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import event
+
+from models import engine, read_engine
+
+PROFILE_PAGES = os.environ.get("PROFILE_PAGES", "0") == "1"
+PROFILE_REPORT_DIR = os.environ.get("PROFILE_REPORT_DIR", "profiles")
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "25"))
+
+_profile_lock = threading.Lock()
+_local = threading.local()
+
+
+def is_profiling() -> bool:
+    """True in a thread that is running a profiled page"""
+    return getattr(_local, "active", False)
+
+
+class _SQLTimer:
+    """Times the statements one thread executes through the application's engines."""
+
+    def __init__(self, thread_id: int):
+        self.thread_id = thread_id
+        self.seconds = 0.0
+        self.count = 0
+        self.statements: Dict[str, List[float]] = {}  # normalized SQL -> [executions, seconds]
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread_id:
+            conn.info.setdefault("profile_started", []).append(time_module.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("profile_started")
+        if threading.get_ident() != self.thread_id or not started:
+            return
+        elapsed = time_module.perf_counter() - started.pop()
+        self.seconds += elapsed
+        self.count += 1
+        stats = self.statements.setdefault(re.sub(r"\s+", " ", statement).strip(), [0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+
+    def __enter__(self):
+        for sql_engine in {engine, read_engine}:
+            event.listen(sql_engine, "before_cursor_execute", self._before)
+            event.listen(sql_engine, "after_cursor_execute", self._after)
+        return self
+
+    def __exit__(self, *exc):
+        for sql_engine in {engine, read_engine}:
+            event.remove(sql_engine, "before_cursor_execute", self._before)
+            event.remove(sql_engine, "after_cursor_execute", self._after)
+
+
+def _top_functions(profiler: cProfile.Profile, limit: int) -> List[Dict[str, Any]]:
+    stats = pstats.Stats(profiler).stats
+    ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{
+        "function": f"{os.path.basename(filename)}:{line}({name})" if line else name,
+        "calls": calls,
+        "own_seconds": round(own, 4),
+        "cumulative_seconds": round(cumulative, 4)
+    } for (filename, line, name), (_, calls, own, cumulative, _) in ranked]
+
+
+def _top_allocations(snapshot: tracemalloc.Snapshot, limit: int) -> List[Dict[str, Any]]:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    return [{
+        "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+        "kb": round(stat.size / 1024, 1),
+        "blocks": stat.count
+    } for stat in snapshot.statistics("lineno")[:limit]]
+
+
+def _write_report(report: Dict[str, Any], profiler: cProfile.Profile) -> str:
+    os.makedirs(PROFILE_REPORT_DIR, exist_ok=True)
+    slug = re.sub(r"[^a-z0-9]+", "-", report["page"].lower()).strip("-")
+    path = os.path.join(
+        PROFILE_REPORT_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-business{report['business_id']}-{slug}.txt"
+    )
+
+    out = io.StringIO()
+    out.write(f"Page: {report['page']}  business: {report['business_id']}  at: {report['started_at']}\n")
+    out.write(f"Wall: {report['wall_seconds']:.3f}s  SQL: {report['sql_seconds']:.3f}s "
+              f"in {report['sql_queries']} statements  peak allocated: {report['peak_kb'] / 1024:.1f} MB\n")
+    if report["error"]:
+        out.write(f"Page raised: {report['error']}\n")
+
+    out.write(f"\n== Top {PROFILE_TOP_N} functions by cumulative time ==\n")
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+
+    out.write("== Slowest SQL statements ==\n")
+    for stmt in report["top_sql"]:
+        out.write(f"{stmt['seconds']:9.4f}s {stmt['executions']:6d}x  {stmt['statement']}\n")
+
+    out.write("\n== Largest allocations still live at page end ==\n")
+    for alloc in report["top_allocations"]:
+        out.write(f"{alloc['kb']:10.1f} KB {alloc['blocks']:8d} blocks  {alloc['location']}\n")
+
+    with open(path, "w") as f:
+        f.write(out.getvalue())
+    return path
+
+
+def profile_page(page: str, show: Callable[[], Any], business_id: int) -> Optional[Dict[str, Any]]:
+    """Run ``show()`` under the profilers; returns the report, or None if another page is being profiled"""
+    if not _profile_lock.acquire(blocking=False):
+        show()
+        return None
+
+    try:
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+        profiler = cProfile.Profile()
+        sql = _SQLTimer(threading.get_ident())
+        started_at = datetime.now()
+        started = time_module.perf_counter()
+        error = None
+        _local.active = True
+        try:
+            with sql:
+                profiler.enable()
+                try:
+                    show()
+                finally:
+                    profiler.disable()
+        except BaseException as e:
+            # Includes Streamlit's rerun/stop signals: report, then let them through
+            error = e
+        finally:
+            _local.active = False
+            wall_seconds = time_module.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if not was_tracing:
+                tracemalloc.stop()
+
+        report = {
+            "page": page,
+            "business_id": business_id,
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "wall_seconds": wall_seconds,
+            "sql_seconds": sql.seconds,
+            "sql_queries": sql.count,
+            "peak_kb": max(0, peak - baseline) / 1024,
+            "error": repr(error) if error is not None else None,
+            "top_functions": _top_functions(profiler, PROFILE_TOP_N),
+            "top_sql": [
+                {"statement": statement[:300], "executions": int(executions), "seconds": round(seconds, 4)}
+                for statement, (executions, seconds) in sorted(
+                    sql.statements.items(), key=lambda item: item[1][1], reverse=True
+                )[:10]
+            ],
+            "top_allocations": _top_allocations(snapshot, 10),
+        }
+        report["path"] = _write_report(report, profiler)
+        if error is not None:
+            raise error
+        return report
+    finally:
+        _profile_lock.release()
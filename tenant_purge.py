@@ -0,0 +1,183 @@
+"""Set-based purge of all of a business's data.
+
+Each table is emptied with ``DELETE ... WHERE key IN (...)`` statements of
+at most ``PURGE_BATCH_ROWS`` keys, and each statement is committed on its
+own. A purge then holds the write lock (SQLite) or row locks (PostgreSQL)
+for one batch at a time, and the WAL does not grow by a whole tenant before
+a checkpoint. Nothing is loaded into the session, so the ORM cascades never
+run. Children go before parents. Products and posts are deleted together
+with any sales or impacts written for them while the purge was running.
+
+Afterwards the business's data version is bumped, its columnar snapshot
+and product catalog are dropped, and its post impact model file and DuckDB
+Parquet mirror are removed. The business account itself is kept.
+
+``start_purge`` runs a purge on a background thread and ``get_purge``
+returns its progress.
+"""
+import logging
+import os
+import threading
+import time as time_module
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+import columnar_store
+import instrumentation
+import product_catalog
+from duckdb_engine import remove_mirror
+from ml_engine import model_file
+from models import (
+    SessionLocal, MediaPost, PostImpact, PrecomputedInsights, Product, Sale, SaleIngestKey,
+    SalesHourlyRollup, SalesRollupState, bump_data_version
+)
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_ROWS = int(os.environ.get("PURGE_BATCH_ROWS", "5000"))
+PURGE_BATCH_PAUSE_MS = int(os.environ.get("PURGE_BATCH_PAUSE_MS", "0"))  # lets other writers in between batches
+
+
+def _targets(business_id: int) -> List[tuple]:
+    """(table, model, batch key column, condition, extra deletes for a batch of keys) in delete order"""
+    product_ids = select(Product.id).where(Product.business_id == business_id)
+    return [
+        ("post_impacts", PostImpact, PostImpact.post_id, PostImpact.business_id == business_id, None),
+        ("sale_ingest_keys", SaleIngestKey, SaleIngestKey.idempotency_key,
+         SaleIngestKey.business_id == business_id, None),
+        ("sales", Sale, Sale.id, Sale.product_id.in_(product_ids), None),
+        ("products", Product, Product.id, Product.business_id == business_id,
+         lambda keys: [("sales", delete(Sale).where(Sale.product_id.in_(keys)))]),
+        ("media_posts", MediaPost, MediaPost.id, MediaPost.business_id == business_id,
+         lambda keys: [("post_impacts", delete(PostImpact).where(PostImpact.post_id.in_(keys)))]),
+        # Keyed by day; a batch can run over by the rest of its last day's rows
+        ("sales_hourly_rollup", SalesHourlyRollup, SalesHourlyRollup.sale_date,
+         SalesHourlyRollup.business_id == business_id, None),
+        ("sales_rollup_state", SalesRollupState, SalesRollupState.business_id,
+         SalesRollupState.business_id == business_id, None),
+        ("precomputed_insights", PrecomputedInsights, PrecomputedInsights.business_id,
+         PrecomputedInsights.business_id == business_id, None),
+    ]
+
+
+def count_rows(db: Session, business_id: int) -> Dict[str, int]:
+    """Rows a purge of the business would delete, per table"""
+    return {
+        table: db.scalar(select(func.count()).select_from(model).where(condition)) or 0
+        for table, model, _, condition, _ in _targets(business_id)
+    }
+
+
+def purge_business(db: Session, business_id: int, batch_rows: int = PURGE_BATCH_ROWS,
+                   progress: Optional[Callable[[str, Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """Delete all of a business's data in committed batches; returns rows deleted per table"""
+    started = time_module.perf_counter()
+    deleted = {table: 0 for table, *_ in _targets(business_id)}
+    for table, model, key, condition, extra in _targets(business_id):
+        if progress:
+            progress(table, deleted)
+        last = None
+        while True:
+            stmt = select(key).where(condition).order_by(key).limit(batch_rows)
+            if last is not None:
+                stmt = stmt.where(key > last)
+            keys = list(dict.fromkeys(db.scalars(stmt)))
+            if not keys:
+                break
+            last = keys[-1]
+            for extra_table, extra_stmt in extra(keys) if extra else []:
+                deleted[extra_table] += db.execute(extra_stmt.execution_options(synchronize_session=False)).rowcount
+            deleted[table] += db.execute(
+                delete(model).where(condition, key.in_(keys)).execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            if progress:
+                progress(table, deleted)
+            if PURGE_BATCH_PAUSE_MS:
+                time_module.sleep(PURGE_BATCH_PAUSE_MS / 1000)
+
+    bump_data_version(db, business_id)
+    columnar_store.invalidate(business_id)
+    product_catalog.invalidate(business_id)
+    if os.path.exists(model_file(business_id)):
+        os.remove(model_file(business_id))
+    remove_mirror(business_id)
+
+    for table, rows in deleted.items():
+        instrumentation.inc("purge_rows_total", rows, table=table)
+    instrumentation.observe("purge_seconds", time_module.perf_counter() - started)
+    logger.info("Purged business %d: %s in %.1fs", business_id, deleted, time_module.perf_counter() - started)
+    return deleted
+
+
+class PurgeJob:
+    """A purge of one business running on its own thread and session."""
+
+    def __init__(self, business_id: int, session_factory=SessionLocal, batch_rows: int = PURGE_BATCH_ROWS):
+        self.business_id = business_id
+        self.batch_rows = batch_rows
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {
+            "state": "running", "table": None, "deleted": {}, "total": None,
+            "started_at": datetime.utcnow(), "finished_at": None, "error": None
+        }
+        self._thread = threading.Thread(target=self.run, name=f"purge-{business_id}", daemon=True)
+
+    def start(self) -> "PurgeJob":
+        self._thread.start()
+        return self
+
+    def _update(self, **values):
+        with self._lock:
+            self._status.update(values)
+
+    def run(self):
+        db = self._session_factory()
+        try:
+            self._update(total=sum(count_rows(db, self.business_id).values()))
+            db.rollback()
+            deleted = purge_business(
+                db, self.business_id, self.batch_rows,
+                progress=lambda table, deleted: self._update(table=table, deleted=dict(deleted))
+            )
+            self._update(state="done", table=None, deleted=deleted, finished_at=datetime.utcnow())
+        except Exception as e:
+            db.rollback()
+            logger.exception("Purge of business %d failed", self.business_id)
+            self._update(state="failed", error=str(e), finished_at=datetime.utcnow())
+        finally:
+            db.close()
+
+    def status(self) -> Dict[str, Any]:
+        """state ("running", "done" or "failed"), current table, rows deleted per table and the starting total"""
+        with self._lock:
+            status = dict(self._status)
+        status["deleted_rows"] = sum(status["deleted"].values())
+        return status
+
+    @property
+    def running(self) -> bool:
+        return self.status()["state"] == "running"
+
+
+_jobs: Dict[int, PurgeJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def start_purge(business_id: int) -> PurgeJob:
+    """Purge a business in the background; returns the running job if one already is"""
+    with _jobs_lock:
+        job = _jobs.get(business_id)
+        if job is None or not job.running:
+            job = _jobs[business_id] = PurgeJob(business_id).start()
+        return job
+
+
+def get_purge(business_id: int) -> Optional[PurgeJob]:
+    """The business's running or most recently finished purge in this process"""
+    with _jobs_lock:
+        return _jobs.get(business_id)